@@ -41,6 +41,14 @@ print "location and datacenter of dyn01: %s, %s" % (
 
 print "ASN of node apnic01: %s" % ring.get_node_details('apnic01')['asn']
 
+# all nodes in the same AS as apnic01
+print "nodes in the AS of apnic01: %s" % ", ".join(
+    ring.get_nodes_by_asn(ring.get_node_details('apnic01')['asn']))
+
+# the 5 nodes closest to Amsterdam, with their distance
+print "nodes closest to Amsterdam: %s" % ", ".join(
+    ["%s (%d km)" % (n, d) for (n, d) in ring.get_nearest_nodes(52.37, 4.89, 5)])
+
 # all nodes in France
 print "all French nodes: %s" % ", ".join(ring.get_ring_nodes('fr'))
 
@@ -33,3 +33,10 @@ print "max 5 nodes, ipv6 only + dual stack: %s " % ring.pick_nodes(5, support_ip
 print "max 5 nodes, ipv6 only and not in .nl: %s" % ring.pick_nodes(5, support_ipv6_only=True, ex_countries='nl')
 print "max 5 nodes, at least one from claranet and one in belgium: %s" % ring.pick_nodes(5, inc_networks="claranet", inc_countries="be")
 print "max 5 nodes, only from Japan and Poland: %s" % ring.pick_nodes(5, only_countries=["jp","pl"])
+
+# picking nodes again and again with the same criteria is cheaper using a
+# NodeSelector: the criteria are only applied again when the nodes change
+from ringtools.selector import NodeSelector
+selector = NodeSelector(5, inc_countries="nl", support_ipv4=True)
+for i in range(3):
+    print "max 5 nodes, including one in .nl, all dual stack (%d): %s" % (i + 1, selector.pick())
@@ -0,0 +1,27 @@
+#! /usr/bin/env python
+
+import sys
+
+try:
+    from ringtools import ring, mesh
+except ImportError:
+    # ringtools probaly isn't installed globally yet
+    sys.path.append('..')
+    from ringtools import ring, mesh
+
+
+# pick 10 random nodes
+nodes = ring.pick_nodes(count=10)
+print "picked nodes: %s" % ", ".join(nodes)
+
+# ping from every node to every other node, at most 3 nodes ping
+# the same node at the same time. The ping parser adds the average
+# ping time of each successful ping as value 'avg'.
+matrix = mesh.run_mesh('ping -c3 -q %%TARGET%%.ring.nlnog.net', nodes, 
+    values=["avg"], max_per_target=3, parser="ping")
+
+# print the matrix, one row per source node
+print "%-16s %s" % ("", " ".join(["%8s" % t[:8] for t in matrix.get_targets()]))
+for source in matrix.get_sources():
+    row = matrix.get_row("avg", source)
+    print "%-16s %s" % (source, " ".join(["%8s" % ("%.1f" % v if v != None else "-") for (t, v) in row]))
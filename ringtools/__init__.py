@@ -13,4 +13,4 @@ An interface to the NLNOG ring.
 # ======
 # Teun Vink - teun@teun.tv
 
-__all__ = ['exception', 'node', 'result', 'ring']
+__all__ = ['aggregate', 'archive', 'cli', 'exception', 'export', 'httpclient', 'inventory', 'mesh', 'node', 'parsers', 'result', 'ring', 'scheduler', 'selector']
@@ -0,0 +1,554 @@
+#! /usr/bin/env python
+"""
+Aggregates over results, updated while commands are running on the ring.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import threading
+
+from exception import RingException
+from result import NodeResult
+
+
+DFLT_QUANTILES = (0.5, 0.9, 0.99)
+
+# ===========================================================================
+
+def is_successful(result):
+    """ Check if a command was run successfully: the SSH connection was
+        made and the command finished with exitcode 0, like
+        L{NodeResultSet.get_successful_results}.
+
+        @param result: the result
+        @type result: L{NodeResult}
+
+        @return: I{True} if the command was successful
+        @rtype: boolean
+    """
+    return result.get_ssh_result() == NodeResult.SSH_OK and result.get_exitcode() == 0
+
+# ===========================================================================
+
+class _P2Estimator:
+    """ Estimator for a single quantile using the P-square algorithm
+        (Jain & Chlamtac, 1985): five markers, constant memory.
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2.0, p, (1 + p) / 2.0, 1]
+
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                h = q[i] + float(d) / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / float(n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / float(n[i] - n[i - 1]))
+                if not q[i - 1] < h < q[i + 1]:
+                    h = q[i] + d * (q[i + d] - q[i]) / float(n[i + d] - n[i])
+                q[i] = h
+                n[i] += d
+
+
+    def get(self):
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5:
+            return q[min(len(q) - 1, int(self.p * len(q)))]
+        return q[2]
+
+# ===========================================================================
+
+class QuantileSketch:
+    """ Streaming estimate of a fixed set of quantiles in constant memory.
+    """
+
+    def __init__(self, quantiles=DFLT_QUANTILES):
+        """ Create a new sketch.
+
+            @param quantiles: the quantiles to estimate, between 0 and 1
+            @type quantiles: list of floats
+        """
+        self.estimators = dict([(q, _P2Estimator(q)) for q in quantiles])
+
+
+    def add(self, value):
+        """ Add a value to the sketch.
+
+            @param value: the value
+            @type value: int or float
+        """
+        for e in self.estimators.itervalues():
+            e.add(value)
+
+
+    def get_quantile(self, quantile):
+        """ Get the estimate for a quantile.
+
+            @param quantile: one of the quantiles the sketch was created with
+            @type quantile: float
+
+            @return: the estimated value, or None if no values were added
+            @rtype: float
+
+            @raise RingException: if the quantile is not tracked
+        """
+        if not quantile in self.estimators:
+            raise RingException("Quantile %s is not tracked." % quantile)
+        return self.estimators[quantile].get()
+
+# ===========================================================================
+
+class ValueAccumulator:
+    """ Running count, sum, minimum, maximum and quantiles of a numerical
+        value in results.
+
+        Accumulators can be passed as consumers to L{ring.run_command}, they
+        are updated as soon as each node is done. Results without a numerical
+        value (failures) are not counted.
+    """
+
+    def __init__(self, name, quantiles=DFLT_QUANTILES, successful_only=False):
+        """ Create a new accumulator.
+
+            @param name: the name of the value to aggregate
+            @type name: string
+
+            @param quantiles: the quantiles to estimate
+            @type quantiles: list of floats
+
+            @param successful_only: only count successful results, see
+            L{is_successful}. Commands which failed or timed out can have
+            values for the part that did run.
+            @type successful_only: boolean
+        """
+        self.name = name
+        self.successful_only = successful_only
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(quantiles)
+        self.lock = threading.Lock()
+
+
+    def add_result(self, result):
+        """ Update the aggregates with the value of a result.
+
+            @param result: the result
+            @type result: L{NodeResult}
+        """
+        if self.successful_only and not is_successful(result):
+            return
+        self.add(result.get_value(self.name))
+
+
+    def add(self, value):
+        """ Update the aggregates with a value. Non-numerical values
+            are ignored.
+
+            @param value: the value
+            @type value: any
+        """
+        if not isinstance(value, (int, long, float)) or isinstance(value, bool):
+            return
+
+        self.lock.acquire()
+        try:
+            self.count += 1
+            self.sum += value
+            if self.min == None or value < self.min:
+                self.min = value
+            if self.max == None or value > self.max:
+                self.max = value
+            self.sketch.add(value)
+        finally:
+            self.lock.release()
+
+
+    def get_count(self):
+        """ Get the number of values seen.
+
+            @return: the number of values
+            @rtype: integer
+        """
+        return self.count
+
+
+    def get_sum(self):
+        """ Get the sum of all values seen.
+
+            @return: the sum
+            @rtype: float
+        """
+        return self.sum
+
+
+    def get_min(self):
+        """ Get the lowest value seen.
+
+            @return: the minimum, or None if no values were seen
+            @rtype: float
+        """
+        return self.min
+
+
+    def get_max(self):
+        """ Get the highest value seen.
+
+            @return: the maximum, or None if no values were seen
+            @rtype: float
+        """
+        return self.max
+
+
+    def get_avg(self):
+        """ Get the average of all values seen.
+
+            @return: the average, 0 if no values were seen
+            @rtype: float
+        """
+        return float(self.sum) / self.count if self.count > 0 else 0
+
+
+    def get_quantile(self, quantile):
+        """ Get an estimate of a quantile of the values seen.
+
+            @param quantile: one of the quantiles the accumulator was created with
+            @type quantile: float
+
+            @return: the estimated value, or None if no values were seen
+            @rtype: float
+
+            @raise RingException: if the quantile is not tracked
+        """
+        self.lock.acquire()
+        try:
+            return self.sketch.get_quantile(quantile)
+        finally:
+            self.lock.release()
+
+
+    def __repr__(self):
+        """ Fancy textual representation of the object.
+
+            @return: textual representation
+            @rtype: string
+        """
+        return "<accumulator for %s: count %d, avg %s, min %s, max %s>" % (
+            self.name, self.count, self.get_avg(), self.min, self.max)
+
+
+class GroupedAccumulator:
+    """ A L{ValueAccumulator} per group of results, for example per country.
+    """
+
+    def __init__(self, name, key, quantiles=DFLT_QUANTILES, successful_only=False):
+        """ Create a new accumulator.
+
+            @param name: the name of the value to aggregate
+            @type name: string
+
+            @param key: function called with a L{NodeResult}, returning the
+            group the result belongs to
+            @type key: function
+
+            @param quantiles: the quantiles to estimate
+            @type quantiles: list of floats
+
+            @param successful_only: only count successful results, see
+            L{ValueAccumulator}
+            @type successful_only: boolean
+        """
+        self.name = name
+        self.key = key
+        self.quantiles = quantiles
+        self.successful_only = successful_only
+        self.groups = {}
+        self.lock = threading.Lock()
+
+
+    def add_result(self, result):
+        """ Update the aggregates of the group of a result.
+
+            @param result: the result
+            @type result: L{NodeResult}
+        """
+        group = self.key(result)
+        self.lock.acquire()
+        try:
+            acc = self.groups.get(group)
+            if acc == None:
+                acc = self.groups[group] = ValueAccumulator(self.name, self.quantiles, self.successful_only)
+        finally:
+            self.lock.release()
+        acc.add_result(result)
+
+
+    def get_groups(self):
+        """ Get the accumulators of all groups seen. Groups only containing
+            results without a numerical value have a count of 0.
+
+            @return: a dictionary containing group->accumulator mappings
+            @rtype: dictionary
+        """
+        return dict(self.groups)
+
+# ===========================================================================
+
+class _HopStats:
+    """ Statistics of a single hop in a L{HopGraph}.
+    """
+
+    def __init__(self, address, quantiles):
+        self.address = address
+        self.hosts = set()
+        self.min_distance = None
+        self.max_distance = None
+        self.latency = ValueAccumulator('rtt', quantiles)
+        self.loss = ValueAccumulator('loss', quantiles)
+        self.next = {}
+
+
+class HopGraph:
+    """ The paths of traceroute or mtr results from many nodes, merged into
+        one graph of unique hops. For every hop the nodes passing it, its
+        distance (hop number), latency and loss are kept, together with the
+        hops following it and the number of paths using each of these links.
+
+        The graph can be passed as consumer to L{ring.run_command}, the
+        results need a I{hops} value as set by the I{traceroute} and I{mtr}
+        parsers in L{parsers}. Hops without replies are skipped, the hops
+        around them are linked directly.
+    """
+
+    def __init__(self, name='hops', quantiles=DFLT_QUANTILES):
+        """ Create a new, empty graph.
+
+            @param name: the name of the value containing the hops
+            @type name: string
+
+            @param quantiles: the quantiles of the latency to estimate per hop
+            @type quantiles: list of floats
+        """
+        self.name = name
+        self.quantiles = quantiles
+        self.hops = {}
+        self.paths = 0
+        self.lock = threading.Lock()
+
+
+    def add_result(self, result):
+        """ Merge the path of a result into the graph.
+
+            @param result: the result
+            @type result: L{NodeResult}
+        """
+        hops = result.get_value(self.name)
+        if not hops:
+            return
+        host = result.get_hostname()
+
+        self.lock.acquire()
+        try:
+            self.paths += 1
+            previous = []
+            current = []
+            distance = None
+            for hop in hops:
+                if hop['address'] == None:
+                    continue
+                if hop['hop'] != distance:
+                    if current:
+                        previous = current
+                    current = []
+                    distance = hop['hop']
+
+                stats = self.hops.get(hop['address'])
+                if stats == None:
+                    stats = self.hops[hop['address']] = _HopStats(hop['address'], self.quantiles)
+                stats.hosts.add(host)
+                if stats.min_distance == None or distance < stats.min_distance:
+                    stats.min_distance = distance
+                if stats.max_distance == None or distance > stats.max_distance:
+                    stats.max_distance = distance
+
+                if 'rtts' in hop:
+                    for rtt in hop['rtts']:
+                        stats.latency.add(rtt)
+                else:
+                    # mtr: one line of statistics per hop
+                    stats.loss.add(hop['loss'])
+                    if hop['loss'] < 100:
+                        stats.latency.add(hop['avg'])
+
+                for p in previous:
+                    if p.address != stats.address:
+                        p.next[stats.address] = p.next.get(stats.address, 0) + 1
+                if not stats in current:
+                    current.append(stats)
+        finally:
+            self.lock.release()
+
+
+    def _get(self, address):
+        try:
+            return self.hops[address]
+        except KeyError:
+            raise RingException("No hop %s in the graph." % address)
+
+
+    def get_path_count(self):
+        """ Get the number of paths merged into the graph.
+
+            @return: the number of paths
+            @rtype: integer
+        """
+        return self.paths
+
+
+    def get_hops(self):
+        """ Get all hops, ordered by distance and by the number of nodes
+            passing them.
+
+            @return: the addresses of the hops
+            @rtype: list of strings
+        """
+        return sorted(self.hops.keys(), key=lambda a:
+            (self.hops[a].min_distance, -len(self.hops[a].hosts), a))
+
+
+    def get_hop_hosts(self, address):
+        """ Get the nodes whose path passes a hop.
+
+            @param address: the address of the hop
+            @type address: string
+
+            @return: the names of the nodes
+            @rtype: list of strings
+
+            @raise RingException: if the hop is not in the graph
+        """
+        return sorted(self._get(address).hosts)
+
+
+    def get_hop_distance(self, address):
+        """ Get the lowest and highest hop number a hop was seen at.
+
+            @param address: the address of the hop
+            @type address: string
+
+            @return: the lowest and highest hop number
+            @rtype: tuple of integers
+
+            @raise RingException: if the hop is not in the graph
+        """
+        stats = self._get(address)
+        return (stats.min_distance, stats.max_distance)
+
+
+    def get_hop_latency(self, address):
+        """ Get the latency of a hop.
+
+            @param address: the address of the hop
+            @type address: string
+
+            @return: the latency (in ms) of all replies from the hop
+            @rtype: L{ValueAccumulator}
+
+            @raise RingException: if the hop is not in the graph
+        """
+        return self._get(address).latency
+
+
+    def get_hop_loss(self, address):
+        """ Get the packet loss of a hop, only available for mtr results.
+
+            @param address: the address of the hop
+            @type address: string
+
+            @return: the loss percentages of the paths passing the hop
+            @rtype: L{ValueAccumulator}
+
+            @raise RingException: if the hop is not in the graph
+        """
+        return self._get(address).loss
+
+
+    def get_next_hops(self, address):
+        """ Get the hops following a hop, most used first.
+
+            @param address: the address of the hop
+            @type address: string
+
+            @return: the addresses of the next hops and the number of paths
+            using each link
+            @rtype: list of (string, integer) tuples
+
+            @raise RingException: if the hop is not in the graph
+        """
+        return sorted(self._get(address).next.items(), key=lambda (a, c): (-c, a))
+
+
+    def get_links(self):
+        """ Get all links between hops.
+
+            @return: links as (from, to, number of paths) tuples
+            @rtype: list of tuples
+        """
+        links = []
+        for (address, stats) in self.hops.iteritems():
+            links.extend([(address, a, c) for (a, c) in stats.next.iteritems()])
+        return links
+
+
+    def __repr__(self):
+        """ Fancy textual representation of the object.
+
+            @return: textual representation
+            @rtype: string
+        """
+        return "<hop graph: %d paths, %d hops>" % (self.paths, len(self.hops))
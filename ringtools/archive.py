@@ -0,0 +1,393 @@
+#! /usr/bin/env python
+"""
+Binary archives of results of commands performed on the ring.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+# FILE FORMAT
+# ===========
+# An archive starts with the 8 byte MAGIC string, followed by any number of
+# records. Records are only ever appended, so every sweep can be added to
+# the same file. Each record consists of:
+#
+#   header   RECORD_HEADER: timestamp, length of the hostname, ssh result,
+#            exitcode, length of the values block, length of the output block
+#   hostname utf-8 encoded
+#   values   JSON: [ssh errormsg, {name: value}]
+#   output   empty if the output was dropped, otherwise a zero byte and
+#            OUTPUT_HEADER: the number of stdout and stderr lines (-1 for
+#            None), followed by the length of each line and the lines
+#            themselves, stored as the bytes received. Older archives have
+#            JSON [stdout, stderr] instead, starting with "[".
+#
+# Reading an archive only walks the record headers to build an index, the
+# values and output blocks are decoded when a record is actually needed.
+
+import os, mmap, struct, time
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from exception import RingException
+from export import _decode
+from result import NodeResult, NodeResultSet
+
+
+MAGIC = "RINGRES\x01"
+
+# timestamp, hostname length, ssh result, exitcode, values length, output length
+RECORD_HEADER = struct.Struct("!dHbiII")
+
+# number of stdout and stderr lines
+OUTPUT_HEADER = struct.Struct("!ii")
+
+# stored in the header when the ssh result or exitcode is unknown
+_NONE_SSH = -1
+_NONE_EXIT = -2 ** 31
+
+# ===========================================================================
+
+def dump(results, path, append=True, timestamp=None):
+    """ Write results to an archive file.
+
+        @param results: the results to be written
+        @type results: L{NodeResultSet}, L{NodeResult} or list of L{NodeResult} objects
+
+        @param path: the name of the archive file
+        @type path: string
+
+        @param append: add the results to an existing archive. If I{False}
+        an existing archive is overwritten.
+        @type append: boolean
+
+        @param timestamp: the time to record for these results, the current
+        time is used if not specified. All results written in one call get
+        the same timestamp, identifying them as one sweep.
+        @type timestamp: float
+
+        An incomplete record at the end of an existing archive (left by an
+        interrupted write) is removed before the results are appended.
+
+        @raise RingException: if the file exists but is not an archive
+    """
+    if timestamp == None:
+        timestamp = time.time()
+
+    f = open(path, "r+b" if append and os.path.exists(path) else "wb")
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            f.write(MAGIC)
+        else:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise RingException("%s is not a result archive." % path)
+            end = _end_of_records(f, size)
+            if end < size:
+                f.truncate(end)
+            f.seek(end)
+
+        for r in NodeResultSet(results).get_results():
+            f.write(_pack(r, timestamp))
+    finally:
+        f.close()
+
+
+def load(path):
+    """ Read all results from an archive file.
+
+        @param path: the name of the archive file
+        @type path: string
+
+        @return: all results in the archive
+        @rtype: L{NodeResultSet}
+
+        @raise RingException: if the file is not an archive
+    """
+    archive = ResultArchive(path)
+    try:
+        return archive.get_results()
+    finally:
+        archive.close()
+
+
+def _end_of_records(f, size):
+    """ Find the end of the last complete record of an archive, only
+        reading the record headers.
+    """
+    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        offset = len(MAGIC)
+        hsize = RECORD_HEADER.size
+        while offset + hsize <= size:
+            (ts, hlen, ssh, exitcode, vlen, olen) = RECORD_HEADER.unpack_from(m, offset)
+            end = offset + hsize + hlen + vlen + olen
+            if end > size:
+                break
+            offset = end
+        return offset
+    finally:
+        m.close()
+
+
+def _pack_lines(lines):
+    """ The lengths and bytes of the lines of output.
+    """
+    if lines == None:
+        return ([], [])
+    lines = [l.encode("utf-8") if isinstance(l, unicode) else l for l in lines]
+    return ([len(l) for l in lines], lines)
+
+
+def _pack_output(stdout, stderr):
+    """ Serialise the output of a result, keeping the bytes as received.
+    """
+    (slen, sdata) = _pack_lines(stdout)
+    (elen, edata) = _pack_lines(stderr)
+    lengths = slen + elen
+    return "".join(["\x00",
+        OUTPUT_HEADER.pack(-1 if stdout == None else len(slen), -1 if stderr == None else len(elen)),
+        struct.pack("!%dI" % len(lengths), *lengths)] + sdata + edata)
+
+
+def _unpack_output(data):
+    """ Read the output of a result, see L{_pack_output}.
+    """
+    if data[0] == "[":
+        # written by an older version
+        return json.loads(data)
+
+    (scount, ecount) = OUTPUT_HEADER.unpack_from(data, 1)
+    n = max(scount, 0) + max(ecount, 0)
+    lengths = struct.unpack_from("!%dI" % n, data, 1 + OUTPUT_HEADER.size)
+    pos = 1 + OUTPUT_HEADER.size + 4 * n
+    lines = []
+    for l in lengths:
+        lines.append(data[pos:pos + l])
+        pos += l
+    stdout = lines[:max(scount, 0)] if scount >= 0 else None
+    stderr = lines[max(scount, 0):] if ecount >= 0 else None
+    return (stdout, stderr)
+
+
+def _pack(result, timestamp):
+    """ Serialise a result to a record.
+    """
+    hostname = (result.get_hostname() or "").encode("utf-8")
+    values = [result.get_ssh_errormsg(), result.get_values()]
+    try:
+        values = json.dumps(values, separators=(',', ':'))
+    except UnicodeDecodeError:
+        # values taken from output which isn't valid UTF-8
+        values = json.dumps(_decode(values), separators=(',', ':'))
+    if result.get_stdout() == None and result.get_stderr() == None:
+        output = ""
+    else:
+        output = _pack_output(result.get_stdout(), result.get_stderr())
+    ssh = result.get_ssh_result()
+    exitcode = result.get_exitcode()
+
+    return "".join([
+        RECORD_HEADER.pack(timestamp, len(hostname),
+            _NONE_SSH if ssh == None else ssh,
+            _NONE_EXIT if exitcode == None else exitcode,
+            len(values), len(output)),
+        hostname, values, output])
+
+# ===========================================================================
+
+class ResultArchive:
+    """ A memory-mapped, read-only view of an archive file.
+
+        Only the record headers are read when opening the archive, so
+        looking up the results of a host or a sweep in a large archive
+        only decodes the records involved.
+    """
+
+    def __init__(self, path):
+        """ Open an archive file and index its records.
+
+            @param path: the name of the archive file
+            @type path: string
+
+            @raise RingException: if the file is not an archive
+        """
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = None
+        self.records = []
+        self.by_host = {}
+        self.by_time = {}
+
+        size = os.fstat(self.file.fileno()).st_size
+        if size > 0:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if size < len(MAGIC) or self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise RingException("%s is not a result archive." % path)
+
+        self._index(size)
+
+
+    def _index(self, size):
+        """ Walk all record headers and index them by host and timestamp.
+            A truncated record at the end (an interrupted write) is ignored.
+        """
+        offset = len(MAGIC)
+        hsize = RECORD_HEADER.size
+        while offset + hsize <= size:
+            (ts, hlen, ssh, exitcode, vlen, olen) = RECORD_HEADER.unpack_from(self.map, offset)
+            end = offset + hsize + hlen + vlen + olen
+            if end > size:
+                break
+
+            hostname = intern(self.map[offset + hsize:offset + hsize + hlen])
+            record = (offset, ts, hostname, ssh, exitcode, hlen, vlen, olen)
+            self.records.append(record)
+            self.by_host.setdefault(hostname, []).append(record)
+            self.by_time.setdefault(ts, []).append(record)
+            offset = end
+
+
+    def _unpack(self, record, output=True):
+        """ Turn a record into a L{NodeResult} object.
+        """
+        (offset, ts, hostname, ssh, exitcode, hlen, vlen, olen) = record
+        start = offset + RECORD_HEADER.size + hlen
+
+        result = NodeResult(
+            hostname=hostname,
+            ssh_result=None if ssh == _NONE_SSH else ssh,
+            exitcode=None if exitcode == _NONE_EXIT else exitcode)
+        (errormsg, values) = json.loads(self.map[start:start + vlen])
+        result.set_ssh_errormsg(errormsg)
+        for name in values:
+            result.add_value(name.encode("utf-8"), values[name])
+
+        if output and olen > 0:
+            (stdout, stderr) = _unpack_output(self.map[start + vlen:start + vlen + olen])
+            result.set_stdout(stdout)
+            result.set_stderr(stderr)
+
+        return result
+
+
+    def close(self):
+        """ Close the archive file.
+        """
+        if self.map != None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+    def count_results(self):
+        """ Count the number of results in the archive.
+
+            @return: the number of results
+            @rtype: integer
+        """
+        return len(self.records)
+
+
+    def get_hostnames(self):
+        """ Get the names of all hosts with results in the archive.
+
+            @return: a list of all hostnames
+            @rtype: list of strings
+        """
+        return self.by_host.keys()
+
+
+    def get_timestamps(self):
+        """ Get the timestamps of all sweeps stored in the archive.
+
+            @return: a sorted list of timestamps
+            @rtype: list of floats
+        """
+        return sorted(self.by_time.keys())
+
+
+    def get_results(self, hostname=None, timestamp=None, since=None, until=None, output=True):
+        """ Get results from the archive.
+
+            @param hostname: only return results for this host
+            @type hostname: string
+
+            @param timestamp: only return results of the sweep with this timestamp
+            @type timestamp: float
+
+            @param since: only return results written at or after this time
+            @type since: float
+
+            @param until: only return results written before this time
+            @type until: float
+
+            @param output: include the stdout and stderr output, if stored
+            @type output: boolean
+
+            @return: the requested results
+            @rtype: L{NodeResultSet}
+        """
+        if hostname != None:
+            records = self.by_host.get(hostname, [])
+        elif timestamp != None:
+            records = self.by_time.get(timestamp, [])
+        else:
+            records = self.records
+
+        results = []
+        for record in records:
+            if ((timestamp == None or record[1] == timestamp) and
+                (since == None or record[1] >= since) and
+                (until == None or record[1] < until)):
+                results.append(self._unpack(record, output))
+        return NodeResultSet(results)
+
+
+    def find(self, name, value, output=False):
+        """ Find all results with a specific value. Only the values of
+            the records are decoded, the output only for matching records.
+
+            @param name: the name of the value
+            @type name: string
+
+            @param value: the value to look for
+            @type value: any
+
+            @param output: include the stdout and stderr output, if stored
+            @type output: boolean
+
+            @return: the matching results
+            @rtype: L{NodeResultSet}
+        """
+        results = []
+        for record in self.records:
+            start = record[0] + RECORD_HEADER.size + record[5]
+            values = json.loads(self.map[start:start + record[6]])[1]
+            if values.get(name) == value:
+                results.append(self._unpack(record, output))
+        return NodeResultSet(results)
+
+
+    def __repr__(self):
+        """ Fancy textual representation of the object.
+
+            @return: textual representation
+            @rtype: string
+        """
+        return "<result archive %s: %d results, %d sweeps>" % (
+            self.path, len(self.records), len(self.by_time))
@@ -0,0 +1,317 @@
+#! /usr/bin/env python
+"""
+Command line options shared by the ring utilities.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+# Parsing the command line (and --help) does not load paramiko or anything
+# needed to talk to the ring API, the other modules of ringtools are only
+# imported by the functions needing them.
+
+import argparse
+
+
+DFLT_COUNT = 10
+DFLT_THREADS = 25
+
+# ===========================================================================
+
+def create_parser(description):
+    """ Create a parser for the command line of a ring utility.
+
+        @param description: description of the utility
+        @type description: string
+
+        @return: the parser
+        @rtype: I{argparse.ArgumentParser}
+    """
+    return argparse.ArgumentParser(
+        description=description,
+        epilog="Visit https://ring.nlnog.net for more information",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+
+def add_node_arguments(parser, action="run the command from", count=DFLT_COUNT):
+    """ Add the options for selecting nodes: the number of nodes, nodes,
+        countries and networks to include, exclude or require, ASes and
+        datacenters to require or exclude, and a location to pick the
+        closest nodes to. See L{pick_nodes}.
+
+        @param parser: the parser
+        @type parser: I{argparse.ArgumentParser}
+
+        @param action: what the nodes are used for, for the help text
+        @type action: string
+
+        @param count: the default number of nodes
+        @type count: integer
+    """
+    parser.add_argument(
+        "-c", "--count",
+        help="the number of nodes to %s" % action,
+        action="store", dest="count",
+        default=count, type=int)
+
+    parser.add_argument(
+        "-n", "--include-node", help="include specific node",
+        action="append", dest="in_nodes",
+        default=None, metavar="node")
+
+    parser.add_argument(
+        "-N", "--exclude-node", help="exclude specific node",
+        action="append", dest="ex_nodes",
+        default=None, metavar="node")
+
+    parser.add_argument(
+        "-o", "--include-country", help="include specific country",
+        action="append", dest="in_countries",
+        default=None, metavar="country")
+
+    parser.add_argument(
+        "-oo", "--only-country", help="only specific country",
+        action="append", dest="only_countries",
+        default=None, metavar="country")
+
+    parser.add_argument(
+        "-O", "--exclude-country", help="exclude specific country",
+        action="append", dest="ex_countries",
+        default=None, metavar="country")
+
+    parser.add_argument(
+        "-w", "--include-network", help="include specific network",
+        action="append", dest="in_networks",
+        default=None, metavar="network")
+
+    parser.add_argument(
+        "-ww", "--only-network", help="only specific network",
+        action="append", dest="only_networks",
+        default=None, metavar="network")
+
+    parser.add_argument(
+        "-W", "--exclude-network", help="exclude specific network",
+        action="append", dest="ex_networks",
+        default=None, metavar="network")
+
+    parser.add_argument(
+        "-a", "--only-asn", help="only nodes in specific AS",
+        action="append", dest="only_asns",
+        default=None, metavar="asn")
+
+    parser.add_argument(
+        "-A", "--exclude-asn", help="exclude nodes in specific AS",
+        action="append", dest="ex_asns",
+        default=None, metavar="asn")
+
+    parser.add_argument(
+        "--only-datacenter", help="only nodes in specific datacenter",
+        action="append", dest="only_datacenters",
+        default=None, metavar="datacenter")
+
+    parser.add_argument(
+        "--near", help="pick the nodes closest to a location instead of random nodes",
+        action="store", dest="near",
+        default=None, type=coordinates, metavar="lat,lon")
+
+    parser.add_argument(
+        "--max-distance", help="with --near, only nodes within this distance",
+        action="store", dest="max_distance",
+        default=None, type=float, metavar="km")
+
+
+def add_report_arguments(parser, quiet="quiet mode, print only results"):
+    """ Add the options for detailed error reporting (-e) and quiet mode (-q).
+
+        @param parser: the parser
+        @type parser: I{argparse.ArgumentParser}
+
+        @param quiet: help text of the quiet option
+        @type quiet: string
+    """
+    parser.add_argument(
+        "-e", "--errors",
+        help="detailed error reporting",
+        action="store_const", dest="errors",
+        default=False, const=True)
+
+    parser.add_argument(
+        "-q", "--quiet", help=quiet,
+        action="store_const", dest="quiet",
+        default=False, const=True)
+
+
+def add_thread_arguments(parser, action="command"):
+    """ Add the option for the number of concurrent threads.
+
+        @param parser: the parser
+        @type parser: I{argparse.ArgumentParser}
+
+        @param action: the kind of command run by the threads, for the help text
+        @type action: string
+    """
+    parser.add_argument(
+        "-t", "--threads",
+        help="the number of concurrent %s threads" % action,
+        action="store", dest="threads",
+        default=DFLT_THREADS, type=int)
+
+
+def add_output_arguments(parser):
+    """ Add the options for writing results to a file or the pastebin,
+        see L{open_output} and L{open_pastebin}.
+
+        @param parser: the parser
+        @type parser: I{argparse.ArgumentParser}
+    """
+    import export
+
+    parser.add_argument(
+        "--output", help="write results to a file as they arrive ('-' for stdout)",
+        action="store", dest="output",
+        default=None, metavar="file")
+
+    parser.add_argument(
+        "--output-format", help="format of the output file (default: based on file name)",
+        action="store", dest="output_format",
+        default=None, choices=export.FORMATS)
+
+    parser.add_argument(
+        "--pastebin", help="publish the results on the NLNOG pastebin",
+        action="store_const", dest="pastebin",
+        default=False, const=True)
+
+
+def coordinates(value):
+    """ Parse a location given as "latitude,longitude", for use as type
+        of an option.
+
+        @param value: the location
+        @type value: string
+
+        @return: the latitude and longitude
+        @rtype: tuple of (float, float)
+
+        @raise argparse.ArgumentTypeError: if the location is not valid
+    """
+    try:
+        (latitude, longitude) = [float(c) for c in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid location '%s', use latitude,longitude" % value)
+    if abs(latitude) > 90 or abs(longitude) > 180:
+        raise argparse.ArgumentTypeError("invalid location '%s', use latitude,longitude" % value)
+    return (latitude, longitude)
+
+
+def split_args(args):
+    """ Split the values of an option which can be given multiple times,
+        each time with a comma separated list of values.
+
+        @param args: the values of the option
+        @type args: list of strings
+
+        @return: all values
+        @rtype: list of strings
+    """
+    result = []
+    if args == None:
+        return []
+
+    for arg in args:
+        result.extend([r.strip() for r in arg.split(',')])
+    return result
+
+
+def pick_nodes(ns, active_only=True):
+    """ Pick nodes using the options added by L{add_node_arguments}.
+
+        @param ns: the parsed command line
+        @type ns: I{argparse.Namespace}
+
+        @param active_only: pick only from nodes which are active
+        @type active_only: boolean
+
+        @return: a list of nodes matching the options
+        @rtype: list of strings
+    """
+    import ring
+
+    return ring.pick_nodes(count=ns.count,
+        inc_hosts=split_args(ns.in_nodes), ex_hosts=split_args(ns.ex_nodes),
+        inc_countries=split_args(ns.in_countries), ex_countries=split_args(ns.ex_countries),
+        only_countries=split_args(ns.only_countries), inc_networks=split_args(ns.in_networks),
+        ex_networks=split_args(ns.ex_networks), only_networks=split_args(ns.only_networks),
+        only_asns=split_args(ns.only_asns), ex_asns=split_args(ns.ex_asns),
+        only_datacenters=ns.only_datacenters or [],
+        near=ns.near, max_distance=ns.max_distance,
+        active_only=active_only)
+
+
+def open_output(ns, values=None):
+    """ Open the output file given by the options added by
+        L{add_output_arguments}.
+
+        @param ns: the parsed command line
+        @type ns: I{argparse.Namespace}
+
+        @param values: the names of the values to export, see L{export.open_exporter}
+        @type values: list of strings
+
+        @return: the exporter, or None if no output file was given
+        @rtype: L{export.JSONLinesExporter} or L{export.CSVExporter}
+    """
+    if not ns.output:
+        return None
+
+    import export
+
+    return export.open_exporter(ns.output, ns.output_format, values=values)
+
+
+def open_pastebin(ns, title, values=None):
+    """ Start publishing results on the pastebin if asked for by the
+        options added by L{add_output_arguments}.
+
+        @param ns: the parsed command line
+        @type ns: I{argparse.Namespace}
+
+        @param title: the title of the report
+        @type title: string
+
+        @param values: the names of the values to publish
+        @type values: list of strings
+
+        @return: the exporter, or None if the results aren't published
+        @rtype: L{export.PastebinExporter}
+    """
+    if not ns.pastebin:
+        return None
+
+    import export
+
+    return export.PastebinExporter(title=title, values=values)
+
+
+def close_pastebin(exporter):
+    """ Wait for the results to be published and print the URLs.
+
+        @param exporter: the exporter returned by L{open_pastebin}
+        @type exporter: L{export.PastebinExporter}
+    """
+    urls = exporter.close()
+    errors = exporter.get_errors()
+    print "results published on the pastebin:"
+    for url in urls:
+        print "    %s" % url
+    for (part, error) in sorted(errors.items()):
+        print "    part %d failed: %s" % (part + 1, error)
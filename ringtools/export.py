@@ -0,0 +1,422 @@
+#! /usr/bin/env python
+"""
+Streaming export of results of commands performed on the ring.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import sys, csv, time, threading, Queue
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from exception import RingException
+from result import NodeResult
+
+
+FORMATS = ['jsonl', 'csv']
+
+# the NLNOG pastebin only takes text, reports are split into pastes of
+# at most this number of bytes
+PASTEBIN_CHUNK_SIZE = 256 * 1024
+PASTEBIN_THREADS = 4
+PASTEBIN_RETRIES = 1
+
+# ===========================================================================
+
+def open_exporter(path, format=None, values=None, output=False):
+    """ Create an exporter writing to a file.
+
+        @param path: the name of the file to write to, '-' for stdout
+        @type path: string
+
+        @param format: the output format ('jsonl' or 'csv'). If not specified
+        the format is derived from the file name: csv for I{.csv} files,
+        JSON Lines otherwise.
+        @type format: string
+
+        @param values: the names of the values to export. For JSON Lines
+        all values are exported if not specified, CSV files get a single
+        column containing all values JSON-encoded.
+        @type values: list of strings
+
+        @param output: include the stdout and stderr output of the command
+        @type output: boolean
+
+        @return: the exporter
+        @rtype: L{JSONLinesExporter} or L{CSVExporter}
+
+        @raise RingException: for unknown formats
+    """
+    if format == None:
+        format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+    if not format in FORMATS:
+        raise RingException("Unknown export format: %s." % format)
+
+    if path == '-':
+        f = sys.stdout
+    else:
+        f = open(path, 'wb' if format == 'csv' else 'w')
+
+    if format == 'csv':
+        return CSVExporter(f, values=values, output=output)
+    else:
+        return JSONLinesExporter(f, values=values, output=output)
+
+
+def _encode(value):
+    """ Make a value suitable for the csv module, which only handles
+        byte strings.
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+def _decode(value):
+    """ Decode the byte strings in a value (including lists, tuples and
+        dictionaries) as UTF-8, replacing what isn't valid UTF-8.
+    """
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    if isinstance(value, (list, tuple)):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        return dict([(_decode(k), _decode(v)) for (k, v) in value.iteritems()])
+    return value
+
+
+def _dumps(value):
+    """ Encode a value as JSON. Output of commands and values taken from it
+        can contain any bytes, which are not always valid UTF-8.
+    """
+    default = lambda v: str(v).decode('utf-8', 'replace')
+    try:
+        return json.dumps(value, default=default)
+    except UnicodeDecodeError:
+        return json.dumps(_decode(value), default=default)
+
+# ===========================================================================
+
+class JSONLinesExporter:
+    """ Write results as JSON Lines: one JSON object per result, written
+        as soon as the result is added.
+
+        Exporters can be passed as consumers to L{ring.run_command},
+        results are then written as they arrive from the nodes.
+    """
+
+    def __init__(self, f, values=None, output=False):
+        """ Create a new exporter.
+
+            @param f: the file to write to
+            @type f: file object
+
+            @param values: the names of the values to export, all values
+            are exported if not specified
+            @type values: list of strings
+
+            @param output: include the stdout and stderr output of the command
+            @type output: boolean
+        """
+        self.file = f
+        self.values = values
+        self.output = output
+        self.lock = threading.Lock()
+
+
+    def add_result(self, result):
+        """ Write a result.
+
+            @param result: the result to be written
+            @type result: L{NodeResult}
+        """
+        record = {
+            'timestamp': time.time(),
+            'hostname': result.get_hostname(),
+            'ssh_result': result.get_ssh_result(),
+            'ssh_errormsg': result.get_ssh_errormsg(),
+            'exitcode': result.get_exitcode(),
+        }
+        if self.values == None:
+            record['values'] = result.get_values()
+        else:
+            record['values'] = dict([(n, result.get_value(n)) for n in self.values])
+        if self.output:
+            record['stdout'] = result.get_stdout()
+            record['stderr'] = result.get_stderr()
+
+        line = _dumps(record)
+        self.lock.acquire()
+        try:
+            self.file.write(line + "\n")
+            self.file.flush()
+        finally:
+            self.lock.release()
+
+
+    def close(self):
+        """ Close the output file, unless it is stdout.
+        """
+        if self.file != sys.stdout:
+            self.file.close()
+
+
+class CSVExporter:
+    """ Write results as CSV: a header line followed by one line per
+        result, written as soon as the result is added.
+
+        Exporters can be passed as consumers to L{ring.run_command},
+        results are then written as they arrive from the nodes.
+    """
+
+    def __init__(self, f, values=None, output=False):
+        """ Create a new exporter and write the header line.
+
+            @param f: the file to write to
+            @type f: file object
+
+            @param values: the names of the values to export, each value
+            gets its own column. If not specified all values are written
+            JSON-encoded in a single I{values} column.
+            @type values: list of strings
+
+            @param output: include the stdout and stderr output of the command
+            @type output: boolean
+        """
+        self.file = f
+        self.writer = csv.writer(f)
+        self.values = values
+        self.output = output
+        self.lock = threading.Lock()
+
+        header = ['timestamp', 'hostname', 'ssh_result', 'ssh_errormsg', 'exitcode']
+        header.extend(values if values != None else ['values'])
+        if output:
+            header.extend(['stdout', 'stderr'])
+        self.writer.writerow(header)
+
+
+    def add_result(self, result):
+        """ Write a result.
+
+            @param result: the result to be written
+            @type result: L{NodeResult}
+        """
+        row = [
+            "%.3f" % time.time(),
+            result.get_hostname(),
+            result.get_ssh_result(),
+            result.get_ssh_errormsg(),
+            result.get_exitcode()]
+        if self.values != None:
+            row.extend([result.get_value(n) for n in self.values])
+        else:
+            row.append(_dumps(result.get_values()))
+        if self.output:
+            row.append("\n".join(result.get_stdout() or []))
+            row.append("\n".join(result.get_stderr() or []))
+
+        row = [_encode(v) for v in row]
+        self.lock.acquire()
+        try:
+            self.writer.writerow(row)
+            self.file.flush()
+        finally:
+            self.lock.release()
+
+
+    def close(self):
+        """ Close the output file, unless it is stdout.
+        """
+        if self.file != sys.stdout:
+            self.file.close()
+
+
+class PastebinExporter:
+    """ Publish results as a text report on the NLNOG pastebin.
+
+        The report is rendered as results are added, one line per result
+        (followed by the output of the command if requested). Every time
+        the report grows beyond I{chunk_size} bytes, the part so far is
+        uploaded in the background while results keep coming in, so large
+        reports are spread over several pastes. L{close} uploads the last
+        part, waits for all uploads and returns the URLs in report order.
+
+        Exporters can be passed as consumers to L{ring.run_command},
+        results are then written as they arrive from the nodes.
+    """
+
+    def __init__(self, title=None, values=None, output=False, chunk_size=PASTEBIN_CHUNK_SIZE,
+            max_threads=PASTEBIN_THREADS, retries=PASTEBIN_RETRIES):
+        """ Create a new exporter.
+
+            @param title: the first line of every part of the report
+            @type title: string
+
+            @param values: the names of the values to report, all values
+            are reported if not specified
+            @type values: list of strings
+
+            @param output: include the stdout and stderr output of the command
+            @type output: boolean
+
+            @param chunk_size: the maximum size in bytes of each paste
+            @type chunk_size: integer
+
+            @param max_threads: the number of concurrent uploads
+            @type max_threads: integer
+
+            @param retries: the number of times a failed upload is repeated
+            @type retries: integer
+
+            @raise RingException: if a part can't hold the title and at
+            least one character of the report
+        """
+        # room for the title line and the newline of each line in each part
+        limit = chunk_size - (len(title) + 16 if title else 0)
+        if limit < 2:
+            raise RingException("Chunk size %d is too small for the title of the report." % chunk_size)
+
+        # imported here, not in the upload threads
+        import ring
+
+        self.pastebin = ring.pastebin
+        self.title = title
+        self.values = values
+        self.output = output
+        self.limit = limit
+        self.retries = retries
+        self.lines = []
+        self.size = 0
+        self.parts = 0
+        self.urls = {}
+        self.errors = {}
+        self.closed = False
+        self.lock = threading.Lock()
+        self.queue = Queue.Queue()
+        self.threads = []
+        for i in range(max(1, max_threads)):
+            t = threading.Thread(target=self._upload)
+            t.setDaemon(True)
+            t.start()
+            self.threads.append(t)
+
+
+    def _render(self, result):
+        """ Render the lines of the report for a result.
+        """
+        if result.get_ssh_result() != NodeResult.SSH_OK:
+            status = "ssh error: %s" % (result.get_ssh_errormsg() or "timeout")
+        else:
+            status = "exitcode %s" % result.get_exitcode()
+
+        if self.values == None:
+            values = sorted(result.get_values().items())
+        else:
+            values = [(n, result.get_value(n)) for n in self.values]
+        lines = ["%-28s %s%s" % (result.get_hostname(), status,
+            "".join(["  %s=%s" % (n, _encode(v)) for (n, v) in values if v != None]))]
+
+        if self.output:
+            lines.extend(["    %s" % _encode(l) for l in (result.get_stdout() or []) + (result.get_stderr() or [])])
+        return lines
+
+
+    def _flush(self):
+        """ Hand the lines collected so far to the upload threads. The
+            lock must be held.
+        """
+        if not self.lines:
+            return
+        header = ["%s (part %d)" % (self.title, self.parts + 1)] if self.title else []
+        self.queue.put((self.parts, "\n".join(header + self.lines) + "\n"))
+        self.parts += 1
+        (self.lines, self.size) = ([], 0)
+
+
+    def _upload(self):
+        """ Upload parts of the report until the exporter is closed.
+        """
+        while True:
+            item = self.queue.get()
+            if item == None:
+                return
+            (part, text) = item
+            for attempt in range(self.retries + 1):
+                if attempt > 0:
+                    time.sleep(2 ** (attempt - 1))
+                try:
+                    self.urls[part] = self.pastebin(text)
+                    self.errors.pop(part, None)
+                    break
+                except RingException, e:
+                    self.errors[part] = e.message
+
+
+    def add_result(self, result):
+        """ Add a result to the report.
+
+            @param result: the result to be added
+            @type result: L{NodeResult}
+
+            @raise RingException: if the exporter was closed
+        """
+        lines = self._render(result)
+        self.lock.acquire()
+        try:
+            if self.closed:
+                raise RingException("The pastebin report is closed.")
+            for line in lines:
+                # overlong lines are split over parts
+                while line:
+                    if self.size + len(line) + 1 > self.limit and self.lines:
+                        self._flush()
+                    (chunk, line) = (line[:self.limit - 1], line[self.limit - 1:])
+                    self.lines.append(chunk)
+                    self.size += len(chunk) + 1
+        finally:
+            self.lock.release()
+
+
+    def get_errors(self):
+        """ Get the errors of the parts which could not be uploaded.
+
+            @return: the error message by number of the part (starting at 0)
+            @rtype: dictionary
+        """
+        return dict(self.errors)
+
+
+    def close(self):
+        """ Upload the rest of the report and wait for all uploads.
+
+            @return: the URLs of the parts of the report, in order. Parts
+            which could not be uploaded are left out, see L{get_errors}.
+            @rtype: list of strings
+        """
+        self.lock.acquire()
+        try:
+            if not self.closed:
+                self.closed = True
+                self._flush()
+                for t in self.threads:
+                    self.queue.put(None)
+        finally:
+            self.lock.release()
+
+        for t in self.threads:
+            t.join()
+        return [self.urls[p] for p in sorted(self.urls.keys())]
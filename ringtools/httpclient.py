@@ -0,0 +1,342 @@
+#! /usr/bin/env python
+"""
+A small HTTP client for the ring API and the pastebin, reusing connections.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import errno, httplib, socket, threading, time, urllib, urlparse, zlib
+
+from exception import RingException
+
+
+DFLT_CONNECT_TIMEOUT = 10
+DFLT_READ_TIMEOUT = 30
+DFLT_RETRIES = 2
+DFLT_BACKOFF = 0.5
+
+# idle connections kept per server
+DFLT_MAX_IDLE = 4
+
+USER_AGENT = "ringtools"
+
+# methods which can be repeated safely after a failure
+IDEMPOTENT = ['GET', 'HEAD', 'OPTIONS']
+
+# responses worth another attempt
+RETRY_STATUS = [502, 503, 504]
+
+# the client used by the other modules
+_default = None
+_default_lock = threading.Lock()
+
+# ===========================================================================
+
+def get_client():
+    """ Get the HTTP client shared by the other modules of ringtools.
+
+        @return: the shared client
+        @rtype: L{HTTPClient}
+    """
+    global _default
+
+    _default_lock.acquire()
+    try:
+        if _default == None:
+            _default = HTTPClient()
+        return _default
+    finally:
+        _default_lock.release()
+
+# ===========================================================================
+
+class HTTPClient:
+    """ An HTTP client keeping connections open for reuse.
+
+        Idle connections are kept per server. A request reuses one of
+        them if possible, and the connection is handed back when the
+        response has been read completely and closed. Responses are
+        requested gzip compressed and decompressed while reading.
+
+        Failed requests are repeated, after waiting I{backoff} seconds,
+        doubling for every next attempt. Only requests which can be
+        repeated safely are retried, except when an idle connection turns
+        out to be closed by the server before it got the request: then the
+        request is sent again over a new connection.
+    """
+
+    def __init__(self, connect_timeout=DFLT_CONNECT_TIMEOUT, read_timeout=DFLT_READ_TIMEOUT,
+            retries=DFLT_RETRIES, backoff=DFLT_BACKOFF, max_idle=DFLT_MAX_IDLE):
+        """ Create a new client.
+
+            @param connect_timeout: seconds to wait for a connection
+            @type connect_timeout: float
+
+            @param read_timeout: seconds to wait for data from the server
+            @type read_timeout: float
+
+            @param retries: the number of times a failed request is repeated
+            @type retries: integer
+
+            @param backoff: seconds to wait before the first retry
+            @type backoff: float
+
+            @param max_idle: the number of idle connections kept per server
+            @type max_idle: integer
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_idle = max_idle
+        self.idle = {}
+        self.proxies = urllib.getproxies()
+        self.lock = threading.Lock()
+
+
+    def _connect(self, key):
+        """ Get an idle connection to a server, or open a new one.
+
+            @return: the connection and whether it was used before
+            @rtype: tuple of (I{httplib.HTTPConnection}, boolean)
+        """
+        self.lock.acquire()
+        try:
+            idle = self.idle.get(key)
+            if idle:
+                return (idle.pop(), True)
+        finally:
+            self.lock.release()
+
+        (scheme, host, port) = key
+        proxy = self.proxies.get(scheme)
+        if proxy and not urllib.proxy_bypass(host):
+            proxy = urlparse.urlsplit(proxy)
+            (host, port, tunnel) = (proxy.hostname, proxy.port, (key[1], key[2]))
+        else:
+            tunnel = None
+
+        if scheme == "https":
+            conn = httplib.HTTPSConnection(host, port, timeout=self.connect_timeout)
+            if tunnel:
+                conn.set_tunnel(*tunnel)
+        else:
+            conn = httplib.HTTPConnection(host, port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        return (conn, False)
+
+
+    def _release(self, key, conn):
+        """ Keep a connection for the next request to the same server.
+        """
+        self.lock.acquire()
+        try:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        finally:
+            self.lock.release()
+        conn.close()
+
+
+    def request(self, method, url, body=None, headers=None):
+        """ Send a request. The response has to be closed when done
+            reading it, so the connection can be reused.
+
+            @param method: the HTTP method
+            @type method: string
+
+            @param url: the URL
+            @type url: string
+
+            @param body: the body of the request
+            @type body: string
+
+            @param headers: additional headers of the request
+            @type headers: dictionary
+
+            @return: the response, which can be read like a file
+            @rtype: L{HTTPResponse}
+
+            @raise RingException: if the server can't be reached
+        """
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ["http", "https"]:
+            raise RingException("Unsupported URL: %s" % url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+
+        if key[0] == "http" and self.proxies.get("http") and not urllib.proxy_bypass(key[1]):
+            # plain HTTP proxies get the full URL
+            path = url
+        else:
+            path = urlparse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+        allheaders = {"Accept-Encoding": "gzip", "User-Agent": USER_AGENT}
+        allheaders.update(headers or {})
+
+        attempt = 0
+        while True:
+            conn = None
+            # set when the server closed an idle connection before it got
+            # the request: nothing was done, so trying a new connection is
+            # safe for any method
+            stale = False
+            try:
+                (conn, reused) = self._connect(key)
+                try:
+                    conn.request(method, path, body, allheaders)
+                except socket.error, e:
+                    stale = reused and e.errno in (errno.ECONNRESET, errno.EPIPE)
+                    raise
+                try:
+                    response = conn.getresponse()
+                except httplib.BadStatusLine:
+                    # closed without sending a response
+                    stale = reused
+                    raise
+            except (socket.error, httplib.HTTPException), e:
+                if conn != None:
+                    conn.close()
+                if stale:
+                    continue
+                if method not in IDEMPOTENT or attempt >= self.retries:
+                    raise RingException("Request to %s failed: %s" % (url, e))
+            else:
+                response = HTTPResponse(self, key, conn, response)
+                if response.status not in RETRY_STATUS or method not in IDEMPOTENT or attempt >= self.retries:
+                    return response
+                try:
+                    response.read()
+                except (socket.error, httplib.HTTPException):
+                    pass
+                response.close()
+
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+
+    def get(self, url, headers=None):
+        """ Send a GET request, see L{request}.
+        """
+        return self.request("GET", url, headers=headers)
+
+
+    def post(self, url, fields, headers=None):
+        """ Post a form, see L{request}.
+
+            @param fields: the fields of the form
+            @type fields: list of (name, value) tuples
+        """
+        allheaders = {"Content-Type": "application/x-www-form-urlencoded"}
+        allheaders.update(headers or {})
+        return self.request("POST", url, urllib.urlencode(fields), allheaders)
+
+
+    def close(self):
+        """ Close all idle connections.
+        """
+        self.lock.acquire()
+        try:
+            (idle, self.idle) = (self.idle, {})
+        finally:
+            self.lock.release()
+        for conns in idle.itervalues():
+            for conn in conns:
+                conn.close()
+
+
+    def __repr__(self):
+        return "<HTTPClient: %d idle connections>" % sum([len(c) for c in self.idle.itervalues()])
+
+# ===========================================================================
+
+class HTTPResponse:
+    """ The response to a request of a L{HTTPClient}, which can be read
+        like a file. Compressed responses are decompressed while reading.
+    """
+
+    def __init__(self, client, key, conn, response):
+        self.client = client
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.status = response.status
+        self.reason = response.reason
+        if (response.getheader("Content-Encoding") or "").lower() == "gzip":
+            self.decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self.decoder = None
+
+
+    def getheader(self, name, default=None):
+        """ Get a header of the response.
+
+            @param name: the name of the header
+            @type name: string
+
+            @return: the value of the header
+            @rtype: string
+        """
+        return self.response.getheader(name, default)
+
+
+    def read(self, amt=None):
+        """ Read (part of) the body of the response.
+
+            @param amt: the maximum number of bytes to read, everything if None
+            @type amt: integer
+
+            @return: the data, an empty string at the end of the body
+            @rtype: string
+        """
+        if self.decoder == None:
+            if amt == None:
+                return self.response.read()
+            return self.response.read(amt)
+
+        if amt == None:
+            return self.decoder.decompress(self.response.read()) + self.decoder.flush()
+
+        data = ""
+        while not data:
+            raw = self.decoder.unconsumed_tail
+            if not raw:
+                raw = self.response.read(amt)
+                if not raw:
+                    return self.decoder.flush()
+            data = self.decoder.decompress(raw, amt)
+        return data
+
+
+    def close(self):
+        """ Close the response. The connection is reused if the response
+            was read completely and the server keeps it open.
+        """
+        if self.conn == None:
+            return
+        (conn, self.conn) = (self.conn, None)
+        if not self.response.isclosed() and self.response.length == 0:
+            # responses without a body (like 304) are closed by reading
+            self.response.read()
+        if self.response.isclosed() and not self.response.will_close:
+            self.client._release(self.key, conn)
+        else:
+            self.response.close()
+            conn.close()
+
+
+    def __repr__(self):
+        return "<HTTPResponse: %d %s>" % (self.status, self.reason)
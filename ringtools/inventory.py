@@ -0,0 +1,1075 @@
+#! /usr/bin/env python
+"""
+The inventory of ring nodes, as published by the ring API.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import threading, re, sys, time, math
+
+from exception import RingException
+
+
+# ring API
+RING_API = "https://ring.nlnog.net/api/1.0/"
+
+# domain of the node hostnames
+RING_DOMAIN = ".ring.nlnog.net"
+
+# seconds between refreshes of the inventory in the background
+DFLT_REFRESH_INTERVAL = 300
+
+# bytes read at a time from the API
+CHUNK_SIZE = 65536
+
+# size of the cells of the spatial index, as a distance between unit
+# vectors (0.2 is about 1275 km)
+GEO_CELL = 0.2
+
+EARTH_RADIUS = 6371.0
+
+# the network of a node is its name without the node number, see get_network
+_NETWORK = re.compile(r"^(.*?)(\d+)$")
+
+_NODES_START = re.compile(r'"nodes"\s*:\s*\[')
+_SEPARATORS = re.compile(r'[\s,]*')
+
+# the inventory used by the functions in L{ring}
+_default = None
+_default_lock = threading.Lock()
+
+# ===========================================================================
+
+def get_inventory():
+    """ Get the inventory shared by the functions in L{ring}.
+
+        @return: the shared inventory
+        @rtype: L{RingInventory}
+    """
+    global _default
+
+    _default_lock.acquire()
+    try:
+        if _default == None:
+            _default = RingInventory()
+        return _default
+    finally:
+        _default_lock.release()
+
+
+def _has_active_flags(view):
+    """ Check if the API tells which nodes of a view are active.
+    """
+    return all(["active" in h for h in view.itervalues()])
+
+
+def _str(value, shared=False):
+    """ Convert ASCII unicode strings from the API to byte strings, which take
+        less memory. Values shared by many nodes are interned.
+    """
+    if type(value) is unicode:
+        try:
+            value = value.encode('ascii')
+        except UnicodeError:
+            return value
+    if shared and type(value) is str:
+        return intern(value)
+    return value
+
+
+def _read_nodes(f, chunk_size=CHUNK_SIZE):
+    """ Read the list of nodes from an API response one node at a time, so
+        the response is never held in memory as a whole. Only the JSON
+        text around the list of nodes is parsed as a whole.
+
+        @return: the nodes by name, the rest of the response and the
+        number of bytes read
+        @rtype: tuple of (dictionary, dictionary, integer)
+
+        @raise ValueError: if the response is not valid
+    """
+    try:
+        import simplejson as json
+    except ImportError:
+        import json
+
+    # the scanner of the decoder parses a single value at a given position
+    scan = json.JSONDecoder(parse_int=int).scan_once
+    nodes = {}
+    size = 0
+
+    # everything up to the start of the list of nodes
+    buf = ""
+    while True:
+        m = _NODES_START.search(buf)
+        if m:
+            break
+        data = f.read(chunk_size)
+        if not data:
+            raise ValueError("no list of nodes in the response")
+        size += len(data)
+        buf += data
+    outside = [buf[:m.end()], "]"]
+    (buf, pos) = (buf[m.end():], 0)
+
+    # the nodes, one at a time
+    while True:
+        pos = _SEPARATORS.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == "]":
+            break
+        try:
+            if pos == len(buf):
+                raise ValueError("more data needed")
+            (host, pos) = scan(buf, pos)
+        except (ValueError, StopIteration):
+            # the node continues in the next chunk
+            data = f.read(chunk_size)
+            if not data:
+                raise ValueError("truncated list of nodes in the response")
+            size += len(data)
+            (buf, pos) = (buf[pos:] + data, 0)
+            continue
+        node = NodeInfo(host)
+        nodes[node.name] = node
+
+    # nodes numbered from 100 need the other nodes to tell their network
+    networks = get_networks(nodes.iterkeys())
+    for node in nodes.itervalues():
+        node.network = get_network(node.name, networks)
+
+    rest = buf[pos + 1:] + f.read()
+    size += len(rest) - len(buf[pos + 1:])
+    outside.append(rest)
+    return (nodes, json.loads("".join(outside)), size)
+
+
+def _changes(old, new):
+    """ Find the nodes added, removed and made inactive between two sets
+        of views.
+    """
+    def nodes(views):
+        (names, active) = (set(), set())
+        for ((active_only, country), view) in views.iteritems():
+            names.update(view.iterkeys())
+            if active_only:
+                active.update(view.iterkeys())
+            else:
+                active.update([n for (n, h) in view.iteritems() if h.get("active")])
+        return (names, active)
+
+    ((old_names, old_active), (new_names, new_active)) = (nodes(old), nodes(new))
+    return (sorted(new_names - old_names), sorted(old_names - new_names),
+            sorted((old_active & new_names) - new_active))
+
+def distance(lat1, lon1, lat2, lon2):
+    """ Calculate the great-circle distance between two locations.
+
+        @param lat1: latitude of the first location
+        @type lat1: float
+
+        @param lon1: longitude of the first location
+        @type lon1: float
+
+        @param lat2: latitude of the second location
+        @type lat2: float
+
+        @param lon2: longitude of the second location
+        @type lon2: float
+
+        @return: the distance in kilometers
+        @rtype: float
+    """
+    return _km(_chord2(_vector(lat1, lon1), _vector(lat2, lon2)))
+
+
+def _vector(latitude, longitude):
+    """ Convert a location to a unit vector.
+    """
+    (la, lo) = (math.radians(latitude), math.radians(longitude))
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
+
+
+def _chord2(a, b):
+    """ The squared distance between two unit vectors.
+    """
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+def _km(chord2):
+    """ Convert a squared distance between unit vectors to kilometers.
+    """
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(chord2) / 2))
+
+
+def get_network(name, networks=None):
+    """ Get the network of a node from its name: the name without the node
+        number at the end. Nodes are numbered with two digits, and with
+        three digits from the 100th node on: C{atrato01} and C{atrato101}
+        are both in network C{atrato}.
+
+        Networks can end in digits themselves, like C{init7} with node
+        C{init701}. A name ending in three or more digits is only taken
+        as a node number of 100 or more if the network is known to have
+        nodes numbered with two digits. The networks are found this way
+        in the node lists of the inventory; without them the whole number
+        is stripped.
+
+        @param name: the name of the node
+        @type name: string
+
+        @param networks: the networks with nodes numbered with two digits,
+        see L{get_networks}
+        @type networks: set of strings
+
+        @return: the name of the network
+        @rtype: string
+    """
+    # networks are shared by nodes, so interned
+    m = _NETWORK.match(name or "")
+    if not m or not m.group(1):
+        return name
+    (network, number) = m.groups()
+    if len(number) > 2 and networks != None and not network in networks:
+        # a network ending in digits, with a two digit node number
+        network = name[:-2]
+    return intern(network)
+
+
+def get_networks(names):
+    """ Get the networks with nodes numbered with two digits, needed by
+        L{get_network} for names ending in three or more digits.
+
+        @param names: the names of the nodes
+        @type names: iterable of strings
+
+        @return: the networks
+        @rtype: set of strings
+    """
+    networks = set()
+    for name in names:
+        m = _NETWORK.match(name or "")
+        if m and m.group(1) and len(m.group(2)) <= 2:
+            networks.add(m.group(1))
+    return networks
+
+
+def _asn(value):
+    """ Convert an AS number given as 1234 or "AS1234" to an integer.
+
+        @raise RingException: if the value is not an AS number
+    """
+    try:
+        value = str(value).strip().upper()
+        return int(value[2:] if value.startswith("AS") else value)
+    except (ValueError, UnicodeError):
+        raise RingException("Invalid AS number: %s." % value)
+
+# ===========================================================================
+
+class RingInventory:
+    """ A cached copy of the node list of the ring API.
+
+        The API can list all nodes, only the active ones, and both per
+        country. Each of these views is cached separately. A view which can
+        be derived from a cached one is never downloaded: the nodes of a
+        country are taken from the list of all nodes once that is known,
+        and the active nodes too if the API marks nodes as active or not.
+        A narrower view never replaces a wider one.
+
+        Long running processes can keep the inventory up to date using
+        L{start_refresh}: the downloaded views are then checked for changes
+        in the background, and replaced all at once when the API reports
+        changes. Listeners added with L{add_listener} are told which nodes
+        were added, removed or became inactive.
+    """
+
+    def __init__(self, api=RING_API, client=None):
+        """ Create a new, empty inventory.
+
+            @param api: the URL of the ring API
+            @type api: string
+
+            @param client: the HTTP client used for the API, the shared
+            client of L{httpclient} if None
+            @type client: L{httpclient.HTTPClient}
+        """
+        self.api = api
+        self.client = client
+        self.views = {}
+        self.validators = {}
+        self.generation = 0
+        self.listeners = []
+        self.refresher = None
+        self.stats = None
+        self.indexes = {}
+        self.lock = threading.RLock()
+
+
+    def _fetch(self, active_only, country, validators=None):
+        """ Download a view from the API. With the validators of an earlier
+            download, the view is only downloaded if it changed since.
+
+            @return: the nodes by name, or None if the view didn't change,
+            and the validators (ETag and Last-Modified headers) of the view
+            @rtype: tuple of (dictionary, tuple)
+
+            @raise RingException: if the API can't be reached or reports a failure
+        """
+        import httpclient, httplib
+
+        url = "%snodes%s%s" % (self.api, "/active" if active_only else "",
+            "/country/%s" % country if country != None else "")
+        headers = {}
+        if validators != None:
+            (etag, modified) = validators
+            if etag:
+                headers["If-None-Match"] = etag
+            if modified:
+                headers["If-Modified-Since"] = modified
+
+        start = time.time()
+        f = (self.client or httpclient.get_client()).get(url, headers)
+        try:
+            if f.status == 304:
+                return (None, validators)
+            if f.status != 200:
+                raise RingException("Failed to get the nodes from the ring API: HTTP %d %s" % (f.status, f.reason))
+            try:
+                (nodes, result, size) = _read_nodes(f)
+            except (IOError, ValueError, httplib.HTTPException), e:
+                raise RingException("Failed to get the nodes from the ring API: %s" % e)
+            validators = (f.getheader("ETag"), f.getheader("Last-Modified"))
+        finally:
+            f.close()
+
+        if result.get("info", {}).get("success") != 1:
+            raise RingException("The ring API failed to list the nodes.")
+
+        self.stats = {
+            'url': url,
+            'nodes': len(nodes),
+            'bytes': size,
+            'seconds': time.time() - start,
+            'memory': sys.getsizeof(nodes) + sum([n.get_size() for n in nodes.itervalues()])}
+        return (nodes, validators)
+
+
+    def _derive(self, active_only, country):
+        """ Derive a view from a wider cached view, if possible.
+
+            @return: the nodes by name, or None if the view can't be derived
+            @rtype: dictionary
+        """
+        for ((source_active, source_country), source) in self.views.items():
+            if source_country != None and source_country != country:
+                continue
+            if source_active and not active_only:
+                continue
+            if active_only and not source_active and not _has_active_flags(source):
+                continue
+            return dict([(n, h) for (n, h) in source.iteritems()
+                if (country == None or h["countrycode"] == country) and
+                   (not active_only or source_active or h["active"])])
+        return None
+
+
+    def _get_view(self, active_only, country):
+        """ Get a view from the cache, deriving or downloading it when needed.
+        """
+        key = (active_only, country)
+        view = self.views.get(key)
+        if view != None:
+            return view
+
+        view = self._derive(active_only, country)
+        if view == None:
+            (view, self.validators[key]) = self._fetch(active_only, country)
+            # drop the views which can be derived from the new one, so
+            # all views are consistent
+            for (a, c) in self.views.keys():
+                if (c != None and country == None and a == active_only) or (
+                    a and not active_only and (c == country or country == None) and _has_active_flags(view)):
+                    del self.views[(a, c)]
+                    self.validators.pop((a, c), None)
+            self.generation += 1
+        self.views[key] = view
+        return view
+
+
+    def get_nodes(self, country=None, active_only=False):
+        """ Get the nodes of the ring.
+
+            @param country: only get the nodes in this country
+            @type country: string
+
+            @param active_only: only get the active nodes
+            @type active_only: boolean
+
+            @return: the names of the nodes
+            @rtype: list of strings
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        self.lock.acquire()
+        try:
+            return self._get_view(bool(active_only), country.upper() if country else None).keys()
+        finally:
+            self.lock.release()
+
+
+    def get_node(self, name):
+        """ Get the details of a node, as published by the API.
+
+            @param name: the name of the node
+            @type name: string
+
+            @return: the details, or None for unknown nodes
+            @rtype: L{NodeInfo}
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        self.lock.acquire()
+        try:
+            # any cached view will do
+            for view in self.views.itervalues():
+                if name in view:
+                    return view[name]
+            return self._get_view(False, None).get(name)
+        finally:
+            self.lock.release()
+
+
+    def get_node_details(self, active_only=False):
+        """ Get the details of all nodes at once.
+
+            @param active_only: only get the active nodes
+            @type active_only: boolean
+
+            @return: a dictionary containing node->details mappings
+            @rtype: dictionary of L{NodeInfo}
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        self.lock.acquire()
+        try:
+            return dict(self._get_view(bool(active_only), None))
+        finally:
+            self.lock.release()
+
+
+    def get_countries(self):
+        """ Get the countries having ring nodes.
+
+            @return: the country codes
+            @rtype: list of strings
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        return self.get_nodes_by_country().keys()
+
+
+    def get_nodes_by_country(self):
+        """ Get all nodes per country.
+
+            @return: a dictionary containing country->list of nodes mappings
+            @rtype: dictionary
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        self.lock.acquire()
+        try:
+            view = self._get_view(False, None)
+        finally:
+            self.lock.release()
+
+        result = {}
+        for (name, host) in view.iteritems():
+            result.setdefault(host["countrycode"], []).append(name)
+        return result
+
+
+    def get_countries_by_node(self):
+        """ Get the country of each node.
+
+            @return: a dictionary containing node->country mappings
+            @rtype: dictionary
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        self.lock.acquire()
+        try:
+            view = self._get_view(False, None)
+        finally:
+            self.lock.release()
+
+        return dict([(name, host["countrycode"]) for (name, host) in view.iteritems()])
+
+
+    def _get_index(self, active_only):
+        """ Get the index of a view, building it when the view changed.
+            The lock must be held.
+        """
+        view = self._get_view(active_only, None)
+        (indexed, index) = self.indexes.get(active_only, (None, None))
+        if indexed is not view:
+            index = NodeIndex(view)
+            self.indexes[active_only] = (view, index)
+        return index
+
+
+    def get_nodes_by_network(self, active_only=False):
+        """ Get all nodes per network.
+
+            @param active_only: only get the active nodes
+            @type active_only: boolean
+
+            @return: a dictionary containing network->list of nodes mappings
+            @rtype: dictionary
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        self.lock.acquire()
+        try:
+            return dict([(n, list(nodes)) for (n, nodes) in self._get_index(bool(active_only)).networks.iteritems()])
+        finally:
+            self.lock.release()
+
+
+    def get_nodes_by_asn(self, asn, active_only=False):
+        """ Get the nodes in an AS.
+
+            @param asn: the AS number, as 1234 or "AS1234"
+            @type asn: integer or string
+
+            @param active_only: only get the active nodes
+            @type active_only: boolean
+
+            @return: the names of the nodes
+            @rtype: list of strings
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        asn = _asn(asn)
+        self.lock.acquire()
+        try:
+            return list(self._get_index(bool(active_only)).asns.get(asn, []))
+        finally:
+            self.lock.release()
+
+
+    def get_nodes_by_datacenter(self, datacenter, active_only=False):
+        """ Get the nodes in a datacenter, the name of the datacenter
+            is not case sensitive.
+
+            @param datacenter: the name of the datacenter
+            @type datacenter: string
+
+            @param active_only: only get the active nodes
+            @type active_only: boolean
+
+            @return: the names of the nodes
+            @rtype: list of strings
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        self.lock.acquire()
+        try:
+            return list(self._get_index(bool(active_only)).datacenters.get(datacenter.strip().lower(), []))
+        finally:
+            self.lock.release()
+
+
+    def get_nearest_nodes(self, latitude, longitude, count, active_only=False, max_distance=None, names=None):
+        """ Get the nodes closest to a location. Nodes without a known
+            location are never returned.
+
+            @param latitude: latitude of the location
+            @type latitude: float
+
+            @param longitude: longitude of the location
+            @type longitude: float
+
+            @param count: the (maximum) number of nodes
+            @type count: integer
+
+            @param active_only: only get the active nodes
+            @type active_only: boolean
+
+            @param max_distance: only get nodes within this number of kilometers
+            @type max_distance: float
+
+            @param names: only get nodes from this set of names
+            @type names: set of strings
+
+            @return: the nodes and their distance in kilometers, closest first
+            @rtype: list of (string, float) tuples
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        self.lock.acquire()
+        try:
+            index = self._get_index(bool(active_only))
+        finally:
+            self.lock.release()
+        return index.geo.get_nearest(latitude, longitude, count, max_distance, names)
+
+
+    def get_load_stats(self):
+        """ Get statistics of the last download of nodes from the API.
+
+            @return: a dictionary containing the I{url}, the number of
+            I{nodes}, the number of I{bytes} received, the number of
+            I{seconds} the download took and the estimated I{memory} in
+            bytes used by the nodes, or None if nothing was downloaded yet
+            @rtype: dictionary
+        """
+        return self.stats
+
+
+    def get_generation(self):
+        """ Get the generation of the inventory, which changes every time
+            nodes are downloaded or the cached nodes are replaced.
+
+            @return: the generation
+            @rtype: integer
+        """
+        return self.generation
+
+
+    def refresh(self):
+        """ Check all downloaded views for changes, and replace the cached
+            views at once if anything changed. Views are only downloaded
+            again if the API reports a change (ETag/If-Modified-Since).
+            If nothing was downloaded yet, the list of all nodes is.
+
+            @return: I{True} if the cached nodes changed
+            @rtype: boolean
+
+            @raise RingException: if the nodes can't be retrieved, the
+            cached views are left as they are
+        """
+        self.lock.acquire()
+        try:
+            fetched = dict(self.validators)
+        finally:
+            self.lock.release()
+        if not fetched:
+            fetched = {(False, None): None}
+
+        # downloads happen without holding the lock, lookups don't wait for them
+        views = {}
+        validators = {}
+        for ((active_only, country), v) in fetched.iteritems():
+            (view, validators[(active_only, country)]) = self._fetch(active_only, country, v)
+            if view != None:
+                views[(active_only, country)] = view
+        if not views:
+            return False
+
+        self.lock.acquire()
+        try:
+            old = self.views
+            new = dict([(k, v) for (k, v) in old.iteritems() if k in validators and not k in views])
+            new.update(views)
+            # keep views downloaded by lookups during the refresh
+            for (k, v) in self.validators.iteritems():
+                if not k in validators:
+                    (new[k], validators[k]) = (old[k], v)
+            # the derived views are derived again from the new views when needed
+            self.views = new
+            self.validators = validators
+            self.generation += 1
+            listeners = list(self.listeners)
+        finally:
+            self.lock.release()
+
+        (added, removed, deactivated) = _changes(old, new)
+        if added or removed or deactivated:
+            for listener in listeners:
+                listener(added, removed, deactivated)
+        return True
+
+
+    def add_listener(self, listener):
+        """ Add a function which is called when a refresh changed the nodes.
+            Arguments of the function are the lists of the names of the nodes
+            which were added, removed and became inactive. Removed nodes may
+            have become inactive if only active nodes were downloaded.
+
+            @param listener: the function
+            @type listener: function
+        """
+        self.lock.acquire()
+        try:
+            self.listeners.append(listener)
+        finally:
+            self.lock.release()
+
+
+    def remove_listener(self, listener):
+        """ Remove a listener added with L{add_listener}.
+
+            @param listener: the function
+            @type listener: function
+        """
+        self.lock.acquire()
+        try:
+            self.listeners.remove(listener)
+        finally:
+            self.lock.release()
+
+
+    def start_refresh(self, interval=DFLT_REFRESH_INTERVAL):
+        """ Refresh the inventory in the background, see L{refresh}. The
+            first refresh starts right away, so the nodes are downloaded
+            before they are needed.
+
+            @param interval: the number of seconds between refreshes
+            @type interval: float
+        """
+        self.lock.acquire()
+        try:
+            if self.refresher == None:
+                self.refresher = RefreshThread(self, interval)
+                self.refresher.start()
+        finally:
+            self.lock.release()
+
+
+    def stop_refresh(self):
+        """ Stop refreshing the inventory in the background.
+        """
+        self.lock.acquire()
+        try:
+            refresher = self.refresher
+            self.refresher = None
+        finally:
+            self.lock.release()
+
+        if refresher != None:
+            refresher.stop()
+            refresher.join()
+
+
+    def clear(self):
+        """ Forget all cached views, the next request downloads them again.
+        """
+        self.lock.acquire()
+        try:
+            self.views = {}
+            self.validators = {}
+            self.generation += 1
+        finally:
+            self.lock.release()
+
+
+    def __repr__(self):
+        """ Fancy textual representation of the object.
+
+            @return: textual representation
+            @rtype: string
+        """
+        return "<ring inventory: %d cached views>" % len(self.views)
+
+# ===========================================================================
+
+class NodeInfo(object):
+    """ The details of a node, as published by the ring API.
+
+        Only the fields used by ringtools are kept. The fields can be read
+        as attributes or like a dictionary, e.g. C{node["countrycode"]};
+        fields the API didn't provide are None.
+    """
+
+    FIELDS = ('name', 'hostname', 'network', 'countrycode', 'ipv4', 'ipv6', 'asn',
+              'active', 'datacenter', 'latitude', 'longitude')
+
+    # no per-instance __dict__: an inventory holds a record per node
+    __slots__ = FIELDS
+
+    # fields which can be read, including the ones calculated from others
+    KEYS = FIELDS + ('geo',)
+
+
+    def __init__(self, host):
+        """ Create a new NodeInfo object.
+
+            @param host: the details of the node from the API
+            @type host: dictionary
+        """
+        get = host.get
+        self.hostname = _str(get("hostname"))
+        self.name = self.hostname
+        if self.hostname and self.hostname.endswith(RING_DOMAIN):
+            self.name = self.hostname[:-len(RING_DOMAIN)]
+        self.network = get_network(self.name)
+        self.countrycode = _str(get("countrycode"), True)
+        self.ipv4 = _str(get("ipv4"))
+        self.ipv6 = _str(get("ipv6"))
+        try:
+            self.asn = _asn(get("asn")) if get("asn") != None else None
+        except RingException:
+            self.asn = get("asn")
+        self.active = get("active")
+        self.datacenter = _str(get("datacenter"), True)
+
+        # the location is given as "latitude,longitude"
+        (self.latitude, self.longitude) = (None, None)
+        try:
+            if get("geo"):
+                (self.latitude, self.longitude) = [float(c) for c in host["geo"].split(",")]
+            elif get("latitude") != None:
+                (self.latitude, self.longitude) = (float(host["latitude"]), float(host["longitude"]))
+        except (ValueError, TypeError):
+            pass
+
+
+    def _get_geo(self):
+        if self.latitude == None:
+            return None
+        return "%s,%s" % (self.latitude, self.longitude)
+
+    # the location as published by the API
+    geo = property(_get_geo)
+
+
+    def __getitem__(self, field):
+        if not field in NodeInfo.KEYS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+
+    def __contains__(self, field):
+        return field in NodeInfo.KEYS and getattr(self, field) != None
+
+
+    def get(self, field, default=None):
+        """ Get a field, like dict.get.
+
+            @param field: the name of the field
+            @type field: string
+
+            @param default: the value to return if the field is not available
+            @type default: any
+
+            @return: the value of the field
+            @rtype: any
+        """
+        value = getattr(self, field, None) if field in NodeInfo.KEYS else None
+        return default if value == None else value
+
+
+    def keys(self):
+        """ Get the names of the fields available.
+
+            @return: the names of the fields
+            @rtype: list of strings
+        """
+        return [f for f in NodeInfo.KEYS if getattr(self, f) != None]
+
+
+    def get_size(self):
+        """ Estimate the memory used by the record.
+
+            @return: the size in bytes
+            @rtype: integer
+        """
+        # networks, country codes and None are shared by many records
+        return sys.getsizeof(self) + sum([sys.getsizeof(getattr(self, f))
+            for f in NodeInfo.FIELDS if not f in ('network', 'countrycode') and getattr(self, f) != None])
+
+
+    def __repr__(self):
+        """ Fancy textual representation of the object.
+
+            @return: textual representation
+            @rtype: string
+        """
+        # fields with non-ASCII characters are still unicode, the result
+        # has to be a byte string
+        def encode(value):
+            if isinstance(value, unicode):
+                return value.encode('utf-8')
+            return value
+
+        return "<node %s: %s>" % (encode(self.name), ", ".join(
+            ["%s=%s" % (f, encode(getattr(self, f))) for f in NodeInfo.FIELDS[1:] if getattr(self, f) != None]))
+
+# ===========================================================================
+
+class NodeIndex:
+    """ Indexes of the nodes of a view, by network, by AS number, by
+        datacenter and by location. An index is built once for a view and
+        used until the view changes.
+    """
+
+    def __init__(self, view):
+        """ Build the indexes of a view.
+
+            @param view: the nodes by name
+            @type view: dictionary
+        """
+        self.networks = {}
+        self.asns = {}
+        self.datacenters = {}
+        self.geo = GeoIndex()
+
+        for (name, node) in view.iteritems():
+            self.networks.setdefault(node.network, []).append(name)
+            if node.asn != None:
+                self.asns.setdefault(node.asn, []).append(name)
+            if node.datacenter:
+                self.datacenters.setdefault(node.datacenter.strip().lower(), []).append(name)
+            if node.latitude != None:
+                self.geo.add(name, node.latitude, node.longitude)
+
+
+class GeoIndex:
+    """ A spatial index of nodes, for finding the nodes closest to a
+        location.
+
+        Locations are stored as unit vectors, in a grid of cubes of
+        I{GEO_CELL} wide. The distance between unit vectors grows with
+        the great-circle distance, so a lookup visits the cubes in order
+        of their distance to the location, and stops at the first cube
+        which is further away than the nodes found so far.
+    """
+
+    def __init__(self, cell=GEO_CELL):
+        """ Create a new, empty index.
+
+            @param cell: the size of the cubes
+            @type cell: float
+        """
+        self.cell = cell
+        self.cells = {}
+
+
+    def add(self, name, latitude, longitude):
+        """ Add a node to the index.
+
+            @param name: the name of the node
+            @type name: string
+
+            @param latitude: latitude of the node
+            @type latitude: float
+
+            @param longitude: longitude of the node
+            @type longitude: float
+        """
+        v = _vector(latitude, longitude)
+        key = tuple([int(math.floor(c / self.cell)) for c in v])
+        self.cells.setdefault(key, []).append((v, name))
+
+
+    def get_nearest(self, latitude, longitude, count, max_distance=None, names=None):
+        """ Find the nodes closest to a location.
+
+            @param latitude: latitude of the location
+            @type latitude: float
+
+            @param longitude: longitude of the location
+            @type longitude: float
+
+            @param count: the (maximum) number of nodes
+            @type count: integer
+
+            @param max_distance: only find nodes within this number of kilometers
+            @type max_distance: float
+
+            @param names: only find nodes from this set of names
+            @type names: set of strings
+
+            @return: the nodes and their distance in kilometers, closest first
+            @rtype: list of (string, float) tuples
+        """
+        if count <= 0:
+            return []
+        (x, y, z) = q = _vector(latitude, longitude)
+        cell = self.cell
+
+        # the squared distance from the location to the nearest point of each cube
+        (kx, ky, kz) = (x / cell, y / cell, z / cell)
+        order = []
+        for key in self.cells:
+            (i, j, k) = key
+            d = ((i - kx if kx < i else kx - i - 1 if kx > i + 1 else 0) ** 2 +
+                 (j - ky if ky < j else ky - j - 1 if ky > j + 1 else 0) ** 2 +
+                 (k - kz if kz < k else kz - k - 1 if kz > k + 1 else 0) ** 2) * cell * cell
+            order.append((d, key))
+        order.sort()
+
+        if max_distance != None:
+            limit = (2 * math.sin(min(math.pi / 2, max_distance / (2 * EARTH_RADIUS)))) ** 2
+        else:
+            limit = 4.0
+
+        # the closest nodes so far, as (squared distance, name)
+        best = []
+        for (d, key) in order:
+            if d > limit:
+                break
+            best.extend([(d2, name) for (d2, name) in
+                [((a - x) ** 2 + (b - y) ** 2 + (c - z) ** 2, name) for ((a, b, c), name) in self.cells[key]]
+                if d2 <= limit and (names == None or name in names)])
+            if len(best) >= count:
+                best.sort()
+                del best[count:]
+                limit = best[-1][0]
+        best.sort()
+
+        return [(name, _km(d2)) for (d2, name) in best]
+
+
+    def __repr__(self):
+        return "<GeoIndex: %d nodes in %d cells>" % (sum([len(c) for c in self.cells.itervalues()]), len(self.cells))
+
+# ===========================================================================
+
+class RefreshThread(threading.Thread):
+    ''' a thread refreshing an inventory at a fixed interval
+    '''
+
+    def __init__(self, inventory, interval=DFLT_REFRESH_INTERVAL):
+        """ Create a new RefreshThread object.
+
+            @param inventory: the inventory to refresh
+            @type inventory: L{RingInventory}
+
+            @param interval: the number of seconds between refreshes
+            @type interval: float
+        """
+        self.inventory = inventory
+        self.interval = interval
+        self.stopped = threading.Event()
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+
+
+    def run(self):
+        """ Execution of the thread.
+        """
+        while not self.stopped.isSet():
+            try:
+                self.inventory.refresh()
+            except RingException:
+                # keep the nodes we have, try again next time
+                pass
+            self.stopped.wait(self.interval)
+
+
+    def stop(self):
+        """ Stop the thread after the current refresh.
+        """
+        self.stopped.set()
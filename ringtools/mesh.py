@@ -0,0 +1,429 @@
+#! /usr/bin/env python
+"""
+Full-mesh measurements between nodes of the NLNOG ring.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import threading, Queue, socket
+from array import array
+from paramiko import SSHException
+
+import parsers
+from exception import RingException
+from node import NodePool, DFLT_MAX_THREADS, _describe
+from result import NodeResult
+
+
+DFLT_MAX_PER_TARGET = 5         # number of sources probing a target at the same time
+DFLT_BATCH_SIZE = 10            # number of targets probed by a single command on a source
+
+# marks the exit status of a command in the output of a batch
+MESH_MARKER = "@@RING-MESH@@"
+
+# status of a source/target pair, other values are the exitcode of the command
+PAIR_NOT_RUN = -1
+PAIR_SSH_ERROR = -2
+PAIR_TIMEOUT = -3
+
+_NAN = float('nan')
+
+# ===========================================================================
+
+def run_mesh(command, sources, targets=None, values=None,
+             max_threads=DFLT_MAX_THREADS, max_per_target=DFLT_MAX_PER_TARGET,
+             analyse=None, timeout=None, pool=None, parser=None,
+             batch_size=DFLT_BATCH_SIZE):
+    ''' Run a command from every source node to every target.
+
+        All commands of a source run over one SSH connection. The commands
+        towards up to I{batch_size} targets are started by a single remote
+        command, running them at the same time; their output on stderr is
+        part of stdout. The targets are visited in a different order by
+        each source, and at most I{max_per_target} sources run a command
+        towards the same target at the same moment.
+
+        @param command: the command to be executed. I{%%TARGET%%} is replaced by
+        the name of the target, I{%%HOST%%} by the name of the source node,
+        e.g. C{ping -c3 -q %%TARGET%%.ring.nlnog.net}.
+        @type command: string
+
+        @param sources: the nodes on which the commands are executed
+        @type sources: list of strings
+
+        @param targets: the targets of the commands. If not specified the
+        sources are used, giving a full mesh between the nodes. Commands from
+        a node to itself are skipped.
+        @type targets: list of strings
+
+        @param values: the names of the (numerical) values to store in the
+        matrix. These values are set by the I{analyse} function.
+        @type values: list of strings
+
+        @param max_threads: the number of sources running commands concurrently
+        @type max_threads: int
+
+        @param max_per_target: the maximum number of sources running a
+        command towards the same target at the same time
+        @type max_per_target: int
+
+        @param analyse: a function which is called with the L{NodeResult} of
+        each command, the result has the name of the target as I{target} value.
+        @type analyse: function
+
+        @param timeout: the maximum time in seconds the commands of a batch
+        may run
+        @type timeout: float
+
+        @param pool: a pool of nodes whose connections are reused, see
+        L{ring.run_command}. If not specified connections are closed
+        when the mesh is done.
+        @type pool: L{NodePool}
+
+        @param parser: a function which is called with the L{NodeResult} of each
+        command before I{analyse}, or the name of a parser from L{parsers}
+        @type parser: function or string
+
+        @param batch_size: the number of targets probed by a single remote
+        command
+        @type batch_size: int
+
+        @return: the matrix with results
+        @rtype: L{MeshResult}
+    '''
+    if isinstance(parser, basestring):
+        parser = parsers.get_parser(parser)
+    if targets == None:
+        targets = sources
+    matrix = MeshResult(sources, targets, values or [])
+    semaphores = dict([(t, threading.Semaphore(max_per_target)) for t in targets])
+    own_pool = pool == None
+    if own_pool:
+        pool = NodePool()
+
+    queue = Queue.Queue()
+    threads = []
+    for i in range(min(max_threads, len(sources))):
+        t = MeshThread(queue, command, targets, semaphores, matrix, analyse, timeout, pool, parser, batch_size)
+        t.setDaemon(True)
+        t.start()
+        threads.append(t)
+
+    # each source starts at a different target to spread the load
+    for (i, source) in enumerate(sources):
+        queue.put((source, targets[i % len(targets):] + targets[:i % len(targets)]))
+    for t in threads:
+        queue.put(None)
+    for t in threads:
+        t.join()
+
+    if own_pool:
+        pool.close()
+
+    return matrix
+
+def _batch_command(commands):
+    """ Build a shell command running commands at the same time. Each line
+        of their output is prefixed with the number of the command, the
+        last line of each command is L{MESH_MARKER} and its exit status.
+    """
+    parts = []
+    for (i, command) in enumerate(commands):
+        # the newline ends a comment at the end of the command
+        parts.append("{ ( %s\n) </dev/null 2>&1; echo \"%s $?\"; } | awk '{ print \"%d \" $0; fflush() }' &" % (
+            command, MESH_MARKER, i))
+    parts.append("wait")
+    return "\n".join(parts)
+
+
+def _split_result(result, count):
+    """ Split the result of a command built by L{_batch_command} into the
+        results of the commands.
+    """
+    stdout = [[] for i in range(count)]
+    exitcodes = [None] * count
+    for line in result.get_stdout() or []:
+        (n, sep, rest) = line.partition(" ")
+        if not n.isdigit() or int(n) >= count:
+            continue
+        rest = rest.strip()
+        (marker, sep, status) = rest.partition(" ")
+        if marker == MESH_MARKER and status.isdigit():
+            exitcodes[int(n)] = int(status)
+        else:
+            stdout[int(n)].append(rest)
+
+    results = []
+    for i in range(count):
+        r = NodeResult(result.get_hostname(), NodeResult.SSH_OK, exitcodes[i], stdout[i], [])
+        if exitcodes[i] == None and result.get_ssh_result() == NodeResult.SSH_TIMEOUT:
+            r.set_ssh_result(NodeResult.SSH_TIMEOUT)
+            r.set_ssh_errormsg(result.get_ssh_errormsg())
+        elif exitcodes[i] == None:
+            r.set_ssh_result(NodeResult.SSH_ERROR)
+            r.set_ssh_errormsg(result.get_ssh_errormsg() or "No exit status of the command.")
+        results.append(r)
+    return results
+
+# ===========================================================================
+
+class MeshThread(threading.Thread):
+    ''' a thread running the commands of a source node towards all targets
+    '''
+
+    def __init__(self, queue, command, targets, semaphores, matrix, analyse, timeout, pool, parser=None, batch_size=DFLT_BATCH_SIZE):
+        """ Create a new MeshThread object. See L{run_mesh} for the arguments.
+        """
+        self.queue = queue
+        self.command = command
+        self.targets = targets
+        self.semaphores = semaphores
+        self.matrix = matrix
+        self.analyse = analyse
+        self.timeout = timeout
+        self.pool = pool
+        self.parser = parser
+        self.batch_size = max(1, batch_size)
+        threading.Thread.__init__(self)
+
+
+    def run(self):
+        """ Execution of the thread.
+        """
+        while True:
+            work = self.queue.get()
+            if work == None:
+                break
+            (source, targets) = work
+            try:
+                self.run_source(source, targets)
+            except (RingException, SSHException, socket.error), e:
+                # the node is unreachable, no use trying the other targets
+                self.pool.discard(source)
+                for target in targets:
+                    if self.matrix.get_status(source, target) == PAIR_NOT_RUN and source != target:
+                        self.matrix.set_status(source, target, PAIR_SSH_ERROR)
+
+
+    def run_source(self, source, targets):
+        """ Run the command towards all targets from one source, a batch of
+            targets at a time. Targets which already have enough sources
+            probing them are postponed.
+        """
+        node = self.pool.get_node(source)
+        pending = [t for t in targets if t != source]
+
+        while pending:
+            # take the targets which are not busy, wait for the first one
+            # if all of them are
+            batch = []
+            for target in pending:
+                if len(batch) < self.batch_size and self.semaphores[target].acquire(False):
+                    batch.append(target)
+            if not batch:
+                batch.append(pending[0])
+                self.semaphores[pending[0]].acquire()
+            pending = [t for t in pending if not t in batch]
+
+            try:
+                cmd = _batch_command([self.command.replace("%%TARGET%%", target).replace("%%HOST%%", source)
+                    for target in batch])
+                results = _split_result(node.run_command(cmd, timeout=self.timeout), len(batch))
+            finally:
+                for target in batch:
+                    self.semaphores[target].release()
+
+            for (target, result) in zip(batch, results):
+                result.add_value('target', target)
+                for (name, function) in [('parser', self.parser), ('analyse', self.analyse)]:
+                    if function:
+                        try:
+                            function(result)
+                        except Exception, e:
+                            result.add_value('error', "%s failed: %s" % (name, _describe(e)))
+                self.matrix.set_result(source, target, result)
+
+# ===========================================================================
+
+class MeshResult:
+    ''' results of a mesh measurement, stored as compact matrices
+    '''
+
+    def __init__(self, sources, targets, values):
+        """ Create a new, empty MeshResult object.
+
+            @param sources: the source nodes (rows)
+            @type sources: list of strings
+
+            @param targets: the targets (columns)
+            @type targets: list of strings
+
+            @param values: the names of the numerical values to store
+            @type values: list of strings
+        """
+        self.sources = list(sources)
+        self.targets = list(targets)
+        self.source_index = dict([(s, i) for (i, s) in enumerate(self.sources)])
+        self.target_index = dict([(t, i) for (i, t) in enumerate(self.targets)])
+        size = len(self.sources) * len(self.targets)
+        self.status = array('h', [PAIR_NOT_RUN]) * size
+        self.values = dict([(v, array('f', [_NAN]) * size) for v in values])
+
+
+    def _index(self, source, target):
+        try:
+            return self.source_index[source] * len(self.targets) + self.target_index[target]
+        except KeyError:
+            raise RingException("No pair %s -> %s in the mesh." % (source, target))
+
+
+    def set_status(self, source, target, status):
+        """ Set the status of a pair.
+
+            @param source: the name of the source
+            @type source: string
+
+            @param target: the name of the target
+            @type target: string
+
+            @param status: the exitcode of the command or one of
+            L{PAIR_NOT_RUN}, L{PAIR_SSH_ERROR} or L{PAIR_TIMEOUT}
+            @type status: integer
+        """
+        self.status[self._index(source, target)] = status
+
+
+    def set_result(self, source, target, result):
+        """ Store the status and values of a command result.
+
+            @param source: the name of the source
+            @type source: string
+
+            @param target: the name of the target
+            @type target: string
+
+            @param result: the result of the command
+            @type result: L{NodeResult}
+        """
+        i = self._index(source, target)
+        if result.get_ssh_result() == NodeResult.SSH_TIMEOUT:
+            self.status[i] = PAIR_TIMEOUT
+        elif result.get_ssh_result() != NodeResult.SSH_OK:
+            self.status[i] = PAIR_SSH_ERROR
+        else:
+            self.status[i] = result.get_exitcode()
+
+        for (name, matrix) in self.values.iteritems():
+            v = result.get_value(name)
+            if isinstance(v, (int, long, float)):
+                matrix[i] = v
+
+
+    def get_sources(self):
+        """ Get the source nodes.
+
+            @return: the names of the sources
+            @rtype: list of strings
+        """
+        return self.sources
+
+
+    def get_targets(self):
+        """ Get the targets.
+
+            @return: the names of the targets
+            @rtype: list of strings
+        """
+        return self.targets
+
+
+    def get_status(self, source, target):
+        """ Get the status of a pair.
+
+            @param source: the name of the source
+            @type source: string
+
+            @param target: the name of the target
+            @type target: string
+
+            @return: the exitcode of the command or one of
+            L{PAIR_NOT_RUN}, L{PAIR_SSH_ERROR} or L{PAIR_TIMEOUT}
+            @rtype: integer
+
+            @raise RingException: if the pair is not in the mesh
+        """
+        return self.status[self._index(source, target)]
+
+
+    def get_value(self, name, source, target):
+        """ Get a value of a pair.
+
+            @param name: the name of the value
+            @type name: string
+
+            @param source: the name of the source
+            @type source: string
+
+            @param target: the name of the target
+            @type target: string
+
+            @return: the value, or None if not available
+            @rtype: float
+
+            @raise RingException: if the pair is not in the mesh
+        """
+        v = self.values[name][self._index(source, target)]
+        return None if v != v else v
+
+
+    def get_row(self, name, source):
+        """ Get a value for all targets of a source.
+
+            @param name: the name of the value
+            @type name: string
+
+            @param source: the name of the source
+            @type source: string
+
+            @return: the value (or None) per target
+            @rtype: list of (string, float) tuples
+        """
+        start = self._index(source, self.targets[0]) if self.targets else 0
+        row = self.values[name][start:start + len(self.targets)]
+        return [(t, None if v != v else v) for (t, v) in zip(self.targets, row)]
+
+
+    def get_column(self, name, target):
+        """ Get a value for all sources towards a target.
+
+            @param name: the name of the value
+            @type name: string
+
+            @param target: the name of the target
+            @type target: string
+
+            @return: the value (or None) per source
+            @rtype: list of (string, float) tuples
+        """
+        return [(s, self.get_value(name, s, target)) for s in self.sources]
+
+
+    def __repr__(self):
+        """ Fancy textual representation of the object.
+
+            @return: textual representation
+            @rtype: string
+        """
+        return "<mesh result: %d sources, %d targets, values: %s>" % (
+            len(self.sources), len(self.targets), ", ".join(self.values.keys()))
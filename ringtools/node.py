@@ -26,6 +26,8 @@ from result import NodeResult, NodeResultSet
 DFLT_SSH_TIMEOUT = 20           # seconds
 DFLT_FQDN = "ring.nlnog.net"    # fqdn for nodes
 DFLT_MAX_THREADS = 25           # number of concurrent threads
+DFLT_KEEPALIVE = 60             # seconds between keepalives on pooled connections
+POLL_INTERVAL = 0.5             # seconds to wait for output when reading incrementally
 
 # ===========================================================================
 
@@ -38,7 +40,7 @@ class RingNode:
     STATE_CONNECTED = 1
     STATE_AUTHENTICATED = 2
 
-    def __init__(self, hostname=None, username=None, ssh_client=None, ssh_agent=None, ssh_config=None, timeout=DFLT_SSH_TIMEOUT):
+    def __init__(self, hostname=None, username=None, ssh_client=None, ssh_agent=None, ssh_config=None, timeout=DFLT_SSH_TIMEOUT, keepalive=0):
         """ Create a new RingNode object.
 
             @param hostname: the host in the ring to connect to
@@ -77,12 +79,18 @@ class RingNode:
 
             @param timeout: SSH timeout in seconds
             @type timeout: integer
+
+            @param keepalive: interval in seconds for sending keepalive packets 
+            over the connection, 0 disables keepalives. Useful for connections
+            which are kept open between commands.
+            @type keepalive: integer
         """
         self.hostname = hostname
         self.username = username
         self.ssh_client = ssh_client
         self.ssh_config = ssh_config
         self.timeout = timeout
+        self.keepalive = keepalive
         self.state = RingNode.STATE_DISCONNECTED
         self.stdin = None
         self.stdout = None
@@ -140,6 +148,8 @@ class RingNode:
                 allow_agent=True, 
                 look_for_keys=True, 
                 timeout=self.timeout) 
+            if self.keepalive:
+                self.ssh_client.get_transport().set_keepalive(self.keepalive)
             self.state = RingNode.STATE_CONNECTED
             return RingNode.STATE_CONNECTED
         except BadHostKeyException, e:
@@ -188,17 +198,36 @@ class RingNode:
             raise RingException(e)
 
 
-    def run_command(self, command):
+    def run_command(self, command, reader=None, timeout=None):
         """ Execute a command using the SSH connection.
             Create a connection and authenticate if not done yet.
 
             @param command: the command to be executed
             @type command: string
 
+            @param reader: function called for every line the command writes to
+            stdout, as soon as it is received. Arguments are the L{NodeResult} 
+            object for this command (which holds the output received so far) 
+            and the line.
+            @type reader: function
+
+            @param timeout: the maximum time in seconds the command may run. If
+            the command doesn't finish in time it is aborted, the result then 
+            has I{SSH_TIMEOUT} as ssh result, no exitcode and the output (and 
+            values added by I{reader}) up to that moment. The command is run
+            on a terminal, so it is hung up on when aborted instead of
+            running on at the node; its stderr is then part of stdout.
+            @type timeout: float
+
             @return: object containing the exitcode, 
             output of stdout and stderr and additional data
             @rtype NodeResult
         """
+        if self.state != RingNode.STATE_DISCONNECTED and not self.is_active():
+            # the connection was lost since the last command
+            self.close()
+            self.state = RingNode.STATE_DISCONNECTED
+
         if self.state == RingNode.STATE_DISCONNECTED:
             self.connect()
 
@@ -212,8 +241,15 @@ class RingNode:
             self.stdout = channel.makefile('rb')
             self.stderr = channel.makefile_stderr('rb') 
             self.state = RingNode.STATE_AUTHENTICATED
+            if timeout != None:
+                # closing the channel on timeout hangs up the terminal,
+                # without one the command would keep running
+                channel.get_pty()
             channel.exec_command(command)
 
+        if reader != None or timeout != None:
+            return self._read_incremental(channel, reader, timeout)
+
         result = NodeResult(
             hostname = self.hostname,
             ssh_result= NodeResult.SSH_OK,
@@ -224,6 +260,80 @@ class RingNode:
         return result
 
 
+    def _read_incremental(self, channel, reader, timeout):
+        """ Read the output of a running command as it arrives.
+
+            @return: object containing the exitcode, 
+            output of stdout and stderr and additional data
+            @rtype NodeResult
+        """
+        stdout = []
+        result = NodeResult(
+            hostname = self.hostname,
+            ssh_result = NodeResult.SSH_OK,
+            stdout = stdout,
+            stderr = [])
+        deadline = time.time() + timeout if timeout != None else None
+        channel.settimeout(POLL_INTERVAL)
+        buf = ""
+        err = ""
+
+        while True:
+            if deadline != None and time.time() >= deadline:
+                channel.close()
+                result.set_ssh_result(NodeResult.SSH_TIMEOUT)
+                result.set_ssh_errormsg('Command timeout.')
+                break
+
+            while channel.recv_stderr_ready():
+                err += channel.recv_stderr(4096)
+
+            try:
+                data = channel.recv(4096)
+            except socket.timeout:
+                continue
+
+            if data == "":
+                # end of output
+                result.set_exitcode(channel.recv_exit_status())
+                while True:
+                    try:
+                        data = channel.recv_stderr(4096)
+                    except socket.timeout:
+                        break
+                    if data == "":
+                        break
+                    err += data
+                break
+
+            lines = (buf + data).split("\n")
+            buf = lines.pop()
+            for line in lines:
+                stdout.append(line.strip())
+                if reader != None:
+                    reader(result, stdout[-1])
+
+        if buf:
+            stdout.append(buf.strip())
+            if reader != None:
+                reader(result, stdout[-1])
+        result.set_stderr([line.strip() for line in err.splitlines()])
+
+        return result
+
+
+    def is_active(self):
+        """ Check if the SSH connection to the node is still up.
+
+            @return: I{True} if the connection is active, else I{False}
+            @rtype: boolean
+        """
+        if self.ssh_client == None:
+            return False
+        transport = self.ssh_client.get_transport()
+        return transport != None and transport.is_active()
+
+
     def get_state(self):
         """ Return the state of the SSH connection.
 
@@ -236,15 +346,103 @@ class RingNode:
 # ===========================================================================
 
 
+class NodePool:
+    """ A pool of L{RingNode} objects whose SSH connections are kept open, so
+        running commands repeatedly on the same nodes only needs one SSH 
+        handshake per node.
+    """
+
+    def __init__(self, agent=None, timeout=DFLT_SSH_TIMEOUT, keepalive=DFLT_KEEPALIVE):
+        """ Create a new NodePool object.
+
+            @param agent: a I{paramiko.Agent} SSH-agent object shared by all 
+            nodes. If none is specified a new agent object is created.
+            @type agent: I{paramiko.Agent} object
+
+            @param timeout: the SSH timeout in seconds
+            @type timeout: integer
+
+            @param keepalive: interval in seconds for sending keepalive packets,
+            keeping idle connections open. 0 disables keepalives.
+            @type keepalive: integer
+        """
+        self.agent = agent if agent != None else Agent()
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.nodes = {}
+        self.lock = threading.Lock()
+
+
+    def get_node(self, hostname):
+        """ Get the node object for a host, create it if it doesn't exist yet.
+            The connection is made when a command is run on the node.
+
+            @param hostname: the name of the node
+            @type hostname: string
+
+            @return: the node
+            @rtype: L{RingNode}
+        """
+        self.lock.acquire()
+        try:
+            node = self.nodes.get(hostname)
+            if node == None:
+                node = RingNode(hostname, ssh_agent=self.agent, 
+                    timeout=self.timeout, keepalive=self.keepalive)
+                self.nodes[hostname] = node
+            return node
+        finally:
+            self.lock.release()
+
+
+    def discard(self, hostname):
+        """ Close the connection to a node and remove it from the pool,
+            for example after an error.
+
+            @param hostname: the name of the node
+            @type hostname: string
+        """
+        self.lock.acquire()
+        try:
+            node = self.nodes.pop(hostname, None)
+        finally:
+            self.lock.release()
+        if node != None:
+            node.close()
+
+
+    def close(self):
+        """ Close all connections in the pool.
+        """
+        self.lock.acquire()
+        try:
+            nodes = self.nodes.values()
+            self.nodes = {}
+        finally:
+            self.lock.release()
+        for node in nodes:
+            node.close()
+
+
+# ===========================================================================
+
+
+def _describe(e):
+    """ Describe an exception for a result.
+    """
+    return "%s: %s" % (e.__class__.__name__, e)
+
+
 class NodeCommandThread(threading.Thread):
     ''' a thread for processing commands to a node via SSH
     '''
 
-    def __init__(self, queue, command, agent, timeout=DFLT_SSH_TIMEOUT, analyse=None):
+    def __init__(self, queue, command, agent, timeout=DFLT_SSH_TIMEOUT, analyse=None, keep_output=True, consumers=None, pool=None, reader=None, command_timeout=None, parser=None):
         """ Create a new NodeCommandThread object.
 
-            @param queue: a list of nodes on which the commands is to be executed
-            @type queue: list of strings
+            @param queue: the queue of hosts on which the command is to be
+            executed, the thread stops when it gets None from the queue
+            @type queue: I{Queue.Queue} or L{scheduler.WorkScheduler}
             
             @param command: the command to be executed
             @type command: string
@@ -258,6 +456,36 @@ class NodeCommandThread(threading.Thread):
             @param analyse: callback analyse function. This function is called after
             the command has been executed. Argument for the function is a L{NodeResult} object.
             @type analyse: function
+
+            @param keep_output: keep the stdout and stderr output in the results after
+            they have been analysed. 
+            @type keep_output: boolean
+
+            @param consumers: objects with an I{add_result} method, which is called 
+            with each L{NodeResult} as soon as it is complete. Consumers must be 
+            thread safe since all threads call them.
+            @type consumers: list of objects
+
+            @param pool: a pool of nodes to use. Connections to nodes in the pool 
+            are left open after the command has been executed.
+            @type pool: L{NodePool}
+
+            @param reader: function called for each line of output as soon as it
+            is received, see L{RingNode.run_command}.
+            @type reader: function
+
+            @param command_timeout: the maximum time in seconds the command may run,
+            see L{RingNode.run_command}.
+            @type command_timeout: float
+
+            @param parser: function called with the L{NodeResult} before the analyse
+            function, see L{parsers}.
+            @type parser: function
+
+            Exceptions raised while running the command, by the reader, the
+            parser, the analyse function or a consumer don't stop the thread:
+            a failure running the command gives an I{SSH_ERROR} result with
+            the exception as message, other failures add the value I{error}.
         """
         self.queue = queue
         self.command = command
@@ -265,6 +493,12 @@ class NodeCommandThread(threading.Thread):
         self.timeout = timeout
         self.result = NodeResultSet()
         self.analyse = analyse
+        self.keep_output = keep_output
+        self.consumers = consumers or []
+        self.pool = pool
+        self.reader = reader
+        self.command_timeout = command_timeout
+        self.parser = parser
         threading.Thread.__init__(self)
 
 
@@ -280,32 +514,55 @@ class NodeCommandThread(threading.Thread):
         ssh.set_missing_host_key_policy(AutoAddPolicy())
         ssh.load_system_host_keys()
 
-        # continue to process hosts until the queue is empty
+        # continue to process hosts until there is no more work
         while True:
+            # pick the next available host, None means we're done
+            host = self.queue.get()
+            if host == None:
+                self.queue.task_done()
+                break
+
             try:
                 starttime = time.time()
-                # pick the next available host
-                host = self.queue.get()
                 result = NodeResult(host)
-                node = RingNode(host)
+                node = None
                 try:
+                    if self.pool != None:
+                        node = self.pool.get_node(host)
+                    else:
+                        node = RingNode(host, ssh_agent=self.agent, timeout=self.timeout)
                     # some template replacements
                     cmd = self.command.replace("%%HOST%%", host)
-                    result = node.run_command(cmd)
-                except RingException, e:
+                    result = node.run_command(cmd, self.reader, self.command_timeout)
+                except Exception, e:
+                    # anything going wrong here (including a reader failing)
+                    # only fails this host, the thread goes on with the others
                     result.set_ssh_result(NodeResult.SSH_ERROR)
-                    result.set_ssh_errormsg(e.__str__())
+                    result.set_ssh_errormsg(_describe(e))
+                    if self.pool != None:
+                        # don't reuse a broken connection
+                        self.pool.discard(host)
                 finally:
-                    node.close()
-                    if self.analyse:
-                        self.analyse(result)
-
-                result.add_value('runtime', time.time() - starttime)
+                    if self.pool == None and node != None:
+                        node.close()
+                    result.add_value('runtime', time.time() - starttime)
+
+                for (name, function) in [('parser', self.parser), ('analyse', self.analyse)]:
+                    if function:
+                        try:
+                            function(result)
+                        except Exception, e:
+                            result.add_value('error', "%s failed: %s" % (name, _describe(e)))
+
+                for consumer in self.consumers:
+                    try:
+                        consumer.add_result(result)
+                    except Exception, e:
+                        result.add_value('error', "%s failed: %s" % (consumer.__class__.__name__, _describe(e)))
+                if not self.keep_output:
+                    result.drop_output()
                 self.result.append(result)
 
-            except Queue.Empty:
-                # we're done!
-                pass
             finally:
                 self.queue.task_done() 
 
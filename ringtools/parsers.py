@@ -0,0 +1,380 @@
+#! /usr/bin/env python
+"""
+Parsers for the output of common commands run on the ring.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+# A parser is a function taking a L{NodeResult}, which adds values parsed
+# from the output to it, just like the I{analyse} callback of
+# L{ring.run_command}. A reader is called for every line of output as soon
+# as it arrives, see the I{reader} argument of L{ring.run_command}. Parsers
+# and readers can be selected by name in L{ring.run_command}.
+
+import re
+
+from exception import RingException
+
+
+# --write-out format for curl, see L{parse_curl_writeout}
+CURL_WRITEOUT_MARKER = "@@RING-CURL@@"
+CURL_WRITEOUT = ("\\n%s %%{time_namelookup} %%{time_connect} %%{time_appconnect} "
+    "%%{time_starttransfer} %%{time_total}\\n" % CURL_WRITEOUT_MARKER)
+
+_PING_SENT = re.compile(r"(\d+) packets transmitted, (\d+) (?:packets )?received")
+_PING_LOSS = re.compile(r"([\d.]+)% packet loss")
+_PING_RTT = re.compile(r"^(?:rtt|round-trip) min/avg/max/(?:mdev|stddev) = ([\d.]+)/([\d.]+)/([\d.]+)/([\d.]+)")
+# BSD: "PING host (address): 56 data bytes", macOS: "PING6(56=40+8+8 bytes) ..."
+_PING_BSD_HEADER = re.compile(r"^PING6\(|^PING \S+ \([^)]*\): ")
+_PING_REPLY = re.compile(r"icmp_[sr]eq=(\d+)(?:.*? time[=<]([\d.]+))?")
+
+_TRACE_HOP = re.compile(r"^\s*(\d+)\s+(.*)$")
+_TRACE_TOKEN = re.compile(r"(?P<name>[^\s()]+) \((?P<addr>[^)]+)\)|(?P<rtt>[\d.]+) ms|(?P<star>\*)|(?P<note>![\w<>]*)|(?P<bare>\S+)")
+
+_MTR_HOP = re.compile(r"^\s*(\d+)\.[|\s]-*\s*(\S+)\s+([\d.]+)%?\s+(\d+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+([\d.]+)")
+
+_DIG_HEADER = re.compile(r"^;; ->>HEADER<<- opcode: \w+, status: (\w+)")
+_DIG_QUESTION = re.compile(r"^;(\S+)\s+(?:\w+\s+)?(\w+)$")
+_DIG_RECORD = re.compile(r"^(\S+)\s+(\d+)\s+(\w+)\s+(\w+)\s+(.*)$")
+_DIG_TIME = re.compile(r"^;; Query time: (\d+) msec")
+_DIG_SERVER = re.compile(r"^;; SERVER: (\S+)")
+
+# registries
+_parsers = {}
+_readers = {}
+
+# ===========================================================================
+
+def register_parser(name, parser):
+    """ Register a parser, making it available by name.
+
+        @param name: the name of the parser
+        @type name: string
+
+        @param parser: function called with a L{NodeResult}
+        @type parser: function
+    """
+    _parsers[name] = parser
+
+
+def get_parser(name):
+    """ Look up a parser by name.
+
+        @param name: the name of the parser
+        @type name: string
+
+        @return: the parser
+        @rtype: function
+
+        @raise RingException: if there is no parser with this name
+    """
+    try:
+        return _parsers[name]
+    except KeyError:
+        raise RingException("No parser named %s." % name)
+
+
+def get_parser_names():
+    """ Get the names of all registered parsers.
+
+        @return: the names of the parsers
+        @rtype: list of strings
+    """
+    return sorted(_parsers.keys())
+
+
+def register_reader(name, reader):
+    """ Register a reader, making it available by name.
+
+        @param name: the name of the reader
+        @type name: string
+
+        @param reader: function called with a L{NodeResult} and a line of output
+        @type reader: function
+    """
+    _readers[name] = reader
+
+
+def get_reader(name):
+    """ Look up a reader by name.
+
+        @param name: the name of the reader
+        @type name: string
+
+        @return: the reader
+        @rtype: function
+
+        @raise RingException: if there is no reader with this name
+    """
+    try:
+        return _readers[name]
+    except KeyError:
+        raise RingException("No reader named %s." % name)
+
+# ===========================================================================
+
+def parse_ping(result):
+    """ Parse the summary of ping or ping6 (quiet or not). Adds the values
+        I{sent}, I{received} and I{loss} (percentage), and if ping exited
+        successfully I{min}, I{avg}, I{max} and I{mdev} (milliseconds).
+
+        @param result: the result of the ping command
+        @type result: L{NodeResult}
+    """
+    # the summary is at the end of the output, round trip times of failed
+    # pings are left out
+    ok = result.get_exitcode() == 0
+    for line in reversed(result.get_stdout() or []):
+        m = _PING_RTT.match(line)
+        if m and ok:
+            (rmin, ravg, rmax, mdev) = m.groups()
+            result.add_value('min', float(rmin))
+            result.add_value('avg', float(ravg))
+            result.add_value('max', float(rmax))
+            result.add_value('mdev', float(mdev))
+            continue
+
+        m = _PING_SENT.search(line)
+        if m:
+            result.add_value('sent', int(m.group(1)))
+            result.add_value('received', int(m.group(2)))
+            m = _PING_LOSS.search(line)
+            if m:
+                result.add_value('loss', float(m.group(1)))
+            break
+
+
+def ping_reader(result, line):
+    """ Parse a reply line of a (non-quiet) ping as soon as it arrives,
+        keeping running values: I{sent} (probes up to the highest sequence
+        number seen), I{received}, I{loss}, I{avg}, I{last} and I{jitter}
+        (interarrival jitter as defined in RFC 3550). These are also
+        available when the ping is aborted because of a timeout. Duplicate
+        replies are ignored.
+
+        Linux numbers the probes from 1, BSD and macOS from 0. The first
+        sequence number is taken from the header of the output or a reply
+        with sequence number 0, and kept as I{first_seq}.
+
+        @param result: the result of the ping command
+        @type result: L{NodeResult}
+
+        @param line: a line of output
+        @type line: string
+    """
+    if line.startswith("PING"):
+        if _PING_BSD_HEADER.match(line):
+            result.add_value('first_seq', 0)
+        return
+    # duplicate replies have the sequence number of a reply already counted
+    if "DUP!" in line:
+        return
+    m = _PING_REPLY.search(line)
+    if not m:
+        return
+
+    seq = int(m.group(1))
+    sent = result.get_value('sent') or 0
+    first = result.get_value('first_seq')
+    if first == None:
+        first = 1
+    if seq < first:
+        # numbered from 0 after all
+        sent += first - seq
+        first = seq
+        result.add_value('first_seq', first)
+    sent = max(seq - first + 1, sent)
+    received = result.get_value('received') or 0
+    result.add_value('sent', sent)
+
+    if m.group(2) != None:
+        rtt = float(m.group(2))
+        received += 1
+        last = result.get_value('last')
+        if last != None:
+            jitter = result.get_value('jitter') or 0.0
+            result.add_value('jitter', jitter + (abs(rtt - last) - jitter) / 16)
+        avg = result.get_value('avg') or 0.0
+        result.add_value('avg', avg + (rtt - avg) / received)
+        result.add_value('last', rtt)
+        result.add_value('received', received)
+
+    if sent > 0:
+        result.add_value('loss', max(0.0, 100.0 * (sent - received) / sent))
+
+
+def parse_traceroute(result):
+    """ Parse the output of traceroute or traceroute6, with or without -n.
+        Adds the value I{hops}: a list of dictionaries with the keys I{hop}
+        (number), I{address}, I{name} and I{rtts} (list of milliseconds),
+        one for each address replying for a hop. Hops without any reply
+        have None as address.
+
+        @param result: the result of the traceroute command
+        @type result: L{NodeResult}
+    """
+    hops = []
+    for line in result.get_stdout() or []:
+        m = _TRACE_HOP.match(line)
+        if not m:
+            continue
+
+        hop = int(m.group(1))
+        current = None
+        for t in _TRACE_TOKEN.finditer(m.group(2)):
+            if t.group('addr'):
+                current = {'hop': hop, 'address': t.group('addr'), 'name': t.group('name'), 'rtts': []}
+                hops.append(current)
+            elif t.group('rtt'):
+                if current != None:
+                    current['rtts'].append(float(t.group('rtt')))
+            elif t.group('bare'):
+                current = {'hop': hop, 'address': t.group('bare'), 'name': None, 'rtts': []}
+                hops.append(current)
+        if current == None:
+            hops.append({'hop': hop, 'address': None, 'name': None, 'rtts': []})
+
+    result.add_value('hops', hops)
+
+
+def parse_mtr(result):
+    """ Parse the output of mtr --report (optionally with -n). Adds the value
+        I{hops}: a list of dictionaries with the keys I{hop}, I{address}
+        (None for hops without replies), I{loss} (percentage), I{sent},
+        I{last}, I{avg}, I{best}, I{worst} and I{stdev} (milliseconds).
+
+        @param result: the result of the mtr command
+        @type result: L{NodeResult}
+    """
+    hops = []
+    for line in result.get_stdout() or []:
+        m = _MTR_HOP.match(line)
+        if not m:
+            continue
+        g = m.groups()
+        hops.append({
+            'hop': int(g[0]),
+            'address': g[1] if g[1] != '???' else None,
+            'loss': float(g[2]),
+            'sent': int(g[3]),
+            'last': float(g[4]),
+            'avg': float(g[5]),
+            'best': float(g[6]),
+            'worst': float(g[7]),
+            'stdev': float(g[8])})
+
+    result.add_value('hops', hops)
+
+
+def parse_dig(result):
+    """ Parse the (default) output of dig, containing one or more queries.
+        Adds the value I{queries}: a list of dictionaries with the keys
+        I{name}, I{type}, I{status}, I{answers} (list of (name, ttl, type,
+        data) tuples), I{query_time} (milliseconds) and I{server}. For the
+        first query I{status}, I{answers} and I{query_time} are added as
+        values as well.
+
+        @param result: the result of the dig command
+        @type result: L{NodeResult}
+    """
+    queries = []
+    query = None
+    section = None
+    for line in result.get_stdout() or []:
+        if not line:
+            section = None
+            continue
+
+        m = _DIG_HEADER.match(line)
+        if m:
+            query = {'name': None, 'type': None, 'status': m.group(1),
+                     'answers': [], 'query_time': None, 'server': None}
+            queries.append(query)
+            continue
+        if query == None:
+            continue
+
+        if line.startswith(";; ") and line.endswith(" SECTION:"):
+            section = line[3:-9]
+            continue
+
+        if section == "QUESTION":
+            m = _DIG_QUESTION.match(line)
+            if m:
+                query['name'] = m.group(1)
+                query['type'] = m.group(2)
+        elif section == "ANSWER":
+            m = _DIG_RECORD.match(line)
+            if m:
+                query['answers'].append((m.group(1), int(m.group(2)), m.group(4), m.group(5)))
+        else:
+            m = _DIG_TIME.match(line)
+            if m:
+                query['query_time'] = int(m.group(1))
+                continue
+            m = _DIG_SERVER.match(line)
+            if m:
+                query['server'] = m.group(1)
+
+    result.add_value('queries', queries)
+    if queries:
+        result.add_value('status', queries[0]['status'])
+        result.add_value('answers', queries[0]['answers'])
+        result.add_value('query_time', queries[0]['query_time'])
+
+
+def parse_curl_writeout(result):
+    """ Parse the timings printed by curl using L{CURL_WRITEOUT} as
+        --write-out format, on stdout or (using %{stderr}) on stderr. The
+        line is removed from stdout. Adds the values I{dns}, I{connect}
+        (TCP handshake), I{tls} (only for TLS connections), I{ttfb}, I{total}
+        and I{ssh_overhead}: the part of the I{runtime} not spent by curl.
+        All values are in seconds.
+
+        @param result: the result of the curl command
+        @type result: L{NodeResult}
+    """
+    stdout = result.get_stdout() or []
+    stderr = result.get_stderr() or []
+    if stdout and stdout[-1].startswith(CURL_WRITEOUT_MARKER):
+        line = stdout.pop()
+    elif stderr and stderr[-1].startswith(CURL_WRITEOUT_MARKER):
+        line = stderr[-1]
+    else:
+        return
+
+    # the times are measured from the start of the request, store the
+    # duration of each phase instead
+    (namelookup, connect, appconnect, starttransfer, total) = [
+        float(t.replace(",", ".")) for t in line.split()[1:6]]
+    result.add_value('dns', namelookup)
+    result.add_value('connect', connect - namelookup)
+    if appconnect > 0:
+        result.add_value('tls', appconnect - connect)
+    result.add_value('ttfb', starttransfer)
+    result.add_value('total', total)
+    if result.get_value('runtime') != None:
+        result.add_value('ssh_overhead', result.get_value('runtime') - total)
+
+
+register_parser('ping', parse_ping)
+register_parser('ping6', parse_ping)
+register_parser('traceroute', parse_traceroute)
+register_parser('traceroute6', parse_traceroute)
+register_parser('mtr', parse_mtr)
+register_parser('dig', parse_dig)
+register_parser('curl-writeout', parse_curl_writeout)
+
+register_reader('ping', ping_reader)
+register_reader('ping6', ping_reader)
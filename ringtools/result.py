@@ -16,16 +16,36 @@ Results of commands performed on the ring.
 # ======
 # Teun Vink - teun@teun.tv
 
-import operator
+import operator, math
 from exception import RingException
 
-class NodeResult:
+
+def _intern(name):
+    """ Intern a string so identical hostnames and value names
+        share a single object over all results.
+
+        @param name: the string to intern
+        @type name: string
+
+        @return: the interned string, or I{name} itself if it
+        can't be interned (unicode, None, ...)
+    """
+    if type(name) is str:
+        return intern(name)
+    return name
+
+
+class NodeResult(object):
     ''' a class containing results of a specific node
     '''
     SSH_OK      = 0
     SSH_TIMEOUT = 1
     SSH_ERROR   = 2
 
+    # no per-instance __dict__: collectors keep tens of thousands of these
+    __slots__ = ('hostname', 'ssh_result', 'ssh_errormsg', 'exitcode', 
+                 'stdout', 'stderr', 'values')
+
 
     def __init__(self, hostname=None, ssh_result=None, exitcode=None, 
                  stdout=None, stderr=None):
@@ -48,7 +68,7 @@ class NodeResult:
             @param stderr: the data printed by the command to stderr
             @type stderr: list of strings
         """
-        self.hostname = hostname
+        self.hostname = _intern(hostname)
         self.ssh_result = ssh_result
         self.ssh_errormsg = None
         self.exitcode = exitcode
@@ -72,7 +92,7 @@ class NodeResult:
             @param hostname: name of the host
             @type hostname: string
         """
-        self.hostname = hostname
+        self.hostname = _intern(hostname)
 
 
     def get_ssh_result(self):
@@ -167,6 +187,15 @@ class NodeResult:
         self.stderr = stderr
 
 
+    def drop_output(self):
+        """ Discard the stdout and stderr output of the command. Useful
+            once the output has been analysed and only the values are
+            needed, since the output is by far the largest part of a result.
+        """
+        self.stdout = None
+        self.stderr = None
+
+
     def add_value(self, name, value):
         """ Add a name/value pair to the result dictionary.
         
@@ -176,7 +205,7 @@ class NodeResult:
             @param value: value of the pair
             @type value: any
         """
-        self.values[name] = value
+        self.values[_intern(name)] = value
 
 
     def get_value(self, name):
@@ -217,6 +246,47 @@ class NodeResult:
 # ===========================================================================
 
 
+def _value_key(name):
+    """ Build a function returning the value(s) stored under a 
+        name (or list of names) in a L{NodeResult}.
+
+        @param name: the name(s) of the value(s)
+        @type name: string or list of strings
+
+        @return: a function taking a L{NodeResult} object
+        @rtype: function
+    """
+    if isinstance(name, (list, tuple)):
+        names = tuple(name)
+        return lambda r: tuple([r.get_value(n) for n in names])
+    else:
+        return lambda r: r.get_value(name)
+
+
+def threshold(delta, relative=False):
+    """ Create a comparator for L{NodeResultSet.diff} which only reports 
+        numerical values as changed if they differ more than a threshold.
+        A value which appeared or disappeared is always a change.
+
+        @param delta: the maximum difference which is not seen as a change
+        @type delta: float
+
+        @param relative: I{delta} is a fraction of the old value instead
+        of an absolute difference
+        @type relative: boolean
+
+        @return: a comparator function
+        @rtype: function
+    """
+    def compare(old, new):
+        if old is None or new is None:
+            return old is not new
+        if relative:
+            return abs(new - old) > abs(old) * delta
+        return abs(new - old) > delta
+    return compare
+
+
 class NodeResultSet:
     '''Set of node results
     '''
@@ -325,6 +395,103 @@ class NodeResultSet:
         return NodeResultSet(results)
 
     
+    def drop_output(self):
+        """ Discard the stdout and stderr output of all results in 
+            the result set. See L{NodeResult.drop_output}.
+        """
+        for r in self.results:
+            r.drop_output()
+
+
+    def dump(self, path, append=True):
+        """ Write the result set to a binary archive file. 
+            See L{archive.dump}.
+
+            @param path: the name of the archive file
+            @type path: string
+
+            @param append: add the results to an existing archive. If 
+            I{False} an existing archive is overwritten.
+            @type append: boolean
+        """
+        import archive
+        archive.dump(self, path, append)
+
+
+    @staticmethod
+    def load(path):
+        """ Read all results from a binary archive file. Use 
+            L{archive.ResultArchive} to query large archives without
+            reading everything.
+
+            @param path: the name of the archive file
+            @type path: string
+
+            @return: all results in the archive
+            @rtype: L{NodeResultSet}
+        """
+        import archive
+        return archive.load(path)
+
+
+    def diff(self, other, names=None, comparators=None):
+        """ Compare this result set with another one, typically a later run 
+            of the same command. Results are matched by hostname, if a set
+            contains more than one result for a host the last one is used.
+
+            @param other: the result set to compare with
+            @type other: L{NodeResultSet}
+
+            @param names: the names of the values to compare. If not specified 
+            all values are compared, except for I{runtime}.
+            @type names: list of strings
+
+            @param comparators: per value name a function which is called with 
+            the old and the new value and returns I{True} if the value changed,
+            for example L{threshold}. Values without comparator are compared 
+            on equality.
+            @type comparators: dictionary
+
+            @return: the differences between the result sets
+            @rtype: L{NodeResultDiff}
+        """
+        comparators = comparators or {}
+        old = dict([(r.get_hostname(), r) for r in self.results])
+        new = dict([(r.get_hostname(), r) for r in other.get_results()])
+
+        added = []
+        changed = []
+        for (host, n) in new.iteritems():
+            o = old.get(host)
+            if o is None:
+                added.append(n)
+                continue
+
+            changes = {}
+            if o.get_ssh_result() != n.get_ssh_result():
+                changes['ssh_result'] = (o.get_ssh_result(), n.get_ssh_result())
+            if o.get_exitcode() != n.get_exitcode():
+                changes['exitcode'] = (o.get_exitcode(), n.get_exitcode())
+
+            if names is None:
+                keys = set(o.get_values()) | set(n.get_values())
+                keys.discard('runtime')
+            else:
+                keys = names
+            for k in keys:
+                ov = o.get_value(k)
+                nv = n.get_value(k)
+                compare = comparators.get(k)
+                if (compare(ov, nv) if compare else ov != nv):
+                    changes[k] = (ov, nv)
+
+            if changes:
+                changed.append((o, n, changes))
+
+        removed = [r for (host, r) in old.iteritems() if not host in new]
+        return NodeResultDiff(added, removed, changed)
+
+
     def count_results(self):
         """ Count the number of results in the result set.
 
@@ -334,6 +501,13 @@ class NodeResultSet:
         return len(self.results)
 
 
+    def _get_last_results(self):
+        """ The last result of each host, in the order of the results.
+        """
+        last = dict([(r.get_hostname(), r) for r in self.results])
+        return [r for r in self.results if last[r.get_hostname()] is r]
+
+
     def get_value(self, name):
         """ Get a value from all results in the result set.
 
@@ -393,6 +567,43 @@ class NodeResultSet:
         return tot/count if count > 0 else 0
 
 
+    def get_value_percentiles(self, name, percentiles):
+        """ Get percentiles of a value stored in the results in 
+            the result set, using the nearest-rank method. Results
+            without the value are skipped.
+
+            @param name: the name of the value to lookup
+            @type name: string
+
+            @param percentiles: the percentiles to calculate (0-100)
+            @type percentiles: list of numbers
+
+            @return: per percentile the value, or None if no 
+            results have the value
+            @rtype: list of (percentile, value) tuples
+
+            @raise RingException: if there are non-numerical
+            values.
+        """
+        values = []
+        for r in self.results:
+            val = r.get_value(name)
+            if isinstance(val, (int, long, float)):
+                values.append(val)
+            elif val != None:
+                raise RingException("Cannot calculate percentiles over non-numeric values.")
+
+        values.sort()
+        result = []
+        for p in percentiles:
+            if values:
+                rank = int(math.ceil(p / 100.0 * len(values)))
+                result.append((p, values[min(max(rank, 1), len(values)) - 1]))
+            else:
+                result.append((p, None))
+        return result
+
+
     def get_value_grouped(self, name, sort_by_hostcount=False):
         """ Get the values for a specific result value from all
             result sets, group the output by value. 
@@ -400,31 +611,102 @@ class NodeResultSet:
             This function can be used to find all hosts with
             identical values. 
 
-            @param name: the name of the value to lookup
-            @type name: string
+            @param name: the name of the value to lookup. If a list
+            of names is given the results are grouped by the 
+            combination of these values.
+            @type name: string or list of strings
 
             @param sort_by_hostcount: sort the output based
             on the number of hosts for a given value
             @type sort_by_hostcount: boolean
 
             @return: a list (optionally sorted) list containing
-            per value the corresponding hosts.
+            per value the corresponding hosts. If a list of names
+            was given the value is a tuple of values.
             @rtype: list of (value, list of strings) tuples
         """
-        rev = {}
-        res = self.get_value(name)
+        return self.get_grouped(_value_key(name), sort_by_hostcount)
+
 
-        for host in res:
-            if res[host] in rev.keys():
-                rev[res[host]].append(host)
+    def get_grouped(self, key, sort_by_hostcount=False):
+        """ Group the hosts in the result set by the outcome of a 
+            function applied to their results. 
+
+            @param key: function called with a L{NodeResult} object, 
+            returning the (hashable) value to group by
+            @type key: function
+
+            @param sort_by_hostcount: sort the output based
+            on the number of hosts for a given value
+            @type sort_by_hostcount: boolean
+
+            @return: a list (optionally sorted) list containing
+            per value the corresponding hosts. Like L{get_value}, only
+            the last result of a host is used.
+            @rtype: list of (value, list of strings) tuples
+        """
+        rev = {}
+        for r in self._get_last_results():
+            k = key(r)
+            hosts = rev.get(k)
+            if hosts is None:
+                rev[k] = [r.get_hostname()]
             else:
-                rev[res[host]] = [host]
+                hosts.append(r.get_hostname())
+
         if sort_by_hostcount:
-            return [(s, rev[s]) for s in sorted(rev.keys(), key=lambda l: len(rev[l]))]
+            return sorted(rev.iteritems(), key=lambda i: len(i[1]))
         else:
             return sorted(rev.iteritems(), key=operator.itemgetter(1))
 
 
+    def get_value_histogram(self, name, sort_by_hostcount=False):
+        """ Count the number of hosts for each value of a specific
+            result value. Like L{get_value_grouped}, without building
+            the lists of hosts.
+
+            @param name: the name of the value to lookup. If a list
+            of names is given the hosts are counted by the 
+            combination of these values.
+            @type name: string or list of strings
+
+            @param sort_by_hostcount: sort the output based on 
+            the number of hosts for a given value instead of 
+            the value itself
+            @type sort_by_hostcount: boolean
+
+            @return: a sorted list containing per value the number of hosts
+            @rtype: list of (value, integer) tuples
+        """
+        return self.get_histogram(_value_key(name), sort_by_hostcount)
+
+
+    def get_histogram(self, key, sort_by_hostcount=False):
+        """ Count the number of hosts for each outcome of a function
+            applied to their results.
+
+            @param key: function called with a L{NodeResult} object, 
+            returning the (hashable) value to count
+            @type key: function
+
+            @param sort_by_hostcount: sort the output based on 
+            the number of hosts for a given value instead of 
+            the value itself
+            @type sort_by_hostcount: boolean
+
+            @return: a sorted list containing per value the number of hosts.
+            Like L{get_value}, only the last result of a host is counted.
+            @rtype: list of (value, integer) tuples
+        """
+        counts = {}
+        for r in self._get_last_results():
+            k = key(r)
+            counts[k] = counts.get(k, 0) + 1
+
+        return sorted(counts.iteritems(), 
+            key=operator.itemgetter(1 if sort_by_hostcount else 0))
+
+
     def __repr__(self):
         """ Fancy textual representation of the object.
 
@@ -432,3 +714,81 @@ class NodeResultSet:
             @rtype: string
         """
         return "<result set for: %s>" % ", ".join(self.get_hostnames())
+
+
+# ===========================================================================
+
+
+class NodeResultDiff:
+    '''Differences between two result sets, see L{NodeResultSet.diff}
+    '''
+
+    def __init__(self, added, removed, changed):
+        """ Create a new object.
+
+            @param added: results for hosts which are only in the new set
+            @type added: list of L{NodeResult} objects
+
+            @param removed: results for hosts which are only in the old set
+            @type removed: list of L{NodeResult} objects
+
+            @param changed: per changed host the old and the new result
+            and a dictionary with the changes
+            @type changed: list of (L{NodeResult}, L{NodeResult}, dictionary) tuples
+        """
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+
+    def get_added(self):
+        """ Get the results for hosts which are only in the new set.
+
+            @return: the added results
+            @rtype: L{NodeResultSet}
+        """
+        return NodeResultSet(self.added)
+
+
+    def get_removed(self):
+        """ Get the results for hosts which are only in the old set.
+
+            @return: the removed results
+            @rtype: L{NodeResultSet}
+        """
+        return NodeResultSet(self.removed)
+
+
+    def get_changed(self):
+        """ Get the hosts with changed results. The changes are a dictionary
+            with per changed value (including I{ssh_result} and I{exitcode}) 
+            a tuple with the old and the new value.
+
+            @return: per host the old result, new result and the changes
+            @rtype: list of (L{NodeResult}, L{NodeResult}, dictionary) tuples
+        """
+        return self.changed
+
+
+    def get_new_failures(self):
+        """ Get the hosts which succeeded before, but failed in the new set.
+
+            @return: the new results of the failing hosts
+            @rtype: L{NodeResultSet}
+        """
+        results = []
+        for (old, new, changes) in self.changed:
+            if ((old.get_ssh_result() == NodeResult.SSH_OK and old.get_exitcode() == 0) and
+                not (new.get_ssh_result() == NodeResult.SSH_OK and new.get_exitcode() == 0)):
+                results.append(new)
+        return NodeResultSet(results)
+
+
+    def __repr__(self):
+        """ Fancy textual representation of the object.
+
+            @return: textual representation
+            @rtype: string
+        """
+        return "<result diff: %d added, %d removed, %d changed>" % (
+            len(self.added), len(self.removed), len(self.changed))
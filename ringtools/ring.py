@@ -16,12 +16,16 @@ A python module to interact with the NLNOG ring.
 # ======
 # Teun Vink - teun@teun.tv
 
-import Queue, random, time, sys, urllib, urllib2, simplejson
-from paramiko import Agent
+# paramiko (through node) and the HTTP client take a long time to import, they
+# are only imported by the functions needing them. RingNode, NodePool and
+# NodeCommandThread are in ringtools.node.
 
+import parsers
 from exception import RingException
-from node import RingNode, NodeCommandThread
+from inventory import get_inventory, RING_API
 from result import NodeResult, NodeResultSet
+from scheduler import WorkScheduler
+from selector import NodeSelector
 
 # ===========================================================================
 
@@ -31,17 +35,9 @@ DFLT_MAX_THREADS = 25
 # pastebin address
 PASTEBIN = "https://ring.nlnog.net/paste/"
 
-# ring API
-RING_API = "https://ring.nlnog.net/api/1.0/"
 
-# ===========================================================================
-
-# caches for data
-_nodes = {}
-_countries = {}
-
-
-def run_command(command, hosts, max_threads=DFLT_MAX_THREADS, analyse=None):
+def run_command(command, hosts, max_threads=DFLT_MAX_THREADS, analyse=None, keep_output=True, consumers=None, pool=None, 
+                reader=None, timeout=None, parser=None, priority=None, spread=None):
     ''' Run a command over a set of hosts using threading.
         A working SSH agent is needed for authentication.
         
@@ -60,29 +56,84 @@ def run_command(command, hosts, max_threads=DFLT_MAX_THREADS, analyse=None):
         of the function should be a L{NodeResult} variable.
         @type analyse: function
 
+        @param keep_output: keep the output of the command in the results.
+        If I{False} stdout and stderr are dropped after the I{analyse}
+        function has been called, which saves a lot of memory when only
+        values are needed.
+        @type keep_output: boolean
+
+        @param consumers: objects with an I{add_result} method, such as 
+        the exporters in L{export}. The method is called with each 
+        L{NodeResult} as soon as it is complete (after I{analyse}), so 
+        results can be processed while other hosts are still running.
+        @type consumers: list of objects
+
+        @param pool: a pool of nodes whose connections are reused. Passing the
+        same pool to consecutive calls saves an SSH handshake per node for 
+        every command. If not specified a new connection is made to each host.
+        @type pool: L{NodePool}
+
+        @param reader: a function which is called for every line of output 
+        as soon as it is received from a host. Arguments of the function are
+        the L{NodeResult} for the host and the line, see L{RingNode.run_command}.
+        Registered readers can be given by name, see L{parsers}.
+        @type reader: function or string
+
+        @param timeout: the maximum time in seconds the command may run on a 
+        host. Hosts which don't finish in time get a result with I{SSH_TIMEOUT}
+        as ssh result, containing the output received up to that moment.
+        @type timeout: float
+
+        @param parser: a function which is called with the L{NodeResult} of each
+        host before I{analyse}, or the name of a parser from L{parsers}, such as
+        I{ping}, I{traceroute}, I{mtr}, I{dig} or I{curl-writeout}.
+        @type parser: function or string
+
+        @param priority: the priority of each host, hosts with lower values
+        are started first. Hosts missing in a dictionary get priority 0. See
+        L{scheduler.runtime_priority} to start the slowest hosts of an earlier
+        run first.
+        @type priority: function or dictionary
+
+        @param spread: spread the hosts of each network (I{network}) or
+        country (I{country}) evenly over the run, so no network gets all
+        commands at the same time. A function returning the group of a host
+        can be given as well. By default (None) the hosts are started in the
+        order given.
+        @type spread: string or function
+
         @return: a L{NodeResultSet} with results for all hosts
         @rtype: NodeResultSet
+
+        @raise RingException: for unknown parser or reader names, or
+        unknown ways to spread hosts
     '''
 
-    agent = Agent()
-    queue = Queue.Queue()
+    from paramiko import Agent
+    from node import NodeCommandThread
+
+    if isinstance(parser, basestring):
+        parser = parsers.get_parser(parser)
+    if isinstance(reader, basestring):
+        reader = parsers.get_reader(reader)
+
+    agent = pool.agent if pool != None else Agent()
     threads = {}
 
+    # the threads take the hosts in the planned order from a shared queue
+    scheduler = WorkScheduler(hosts, priority=priority, spread=spread)
+
     # fork enough (but not too many) threads
     for i in range(min(max_threads, len(hosts))):
-        threads[i] = NodeCommandThread(queue, command, agent, analyse=analyse)
+        threads[i] = NodeCommandThread(scheduler, command, agent, analyse=analyse, 
+            keep_output=keep_output, consumers=consumers, pool=pool,
+            reader=reader, command_timeout=timeout, parser=parser)
         threads[i].setDaemon(True)
         threads[i].start()
 
-    # add all hosts to the work queue
-    for host in hosts:
-        queue.put(host)
-
-    # wait for threads to be done
-    queue.join()
-
-    # fix for some threading problems
-    time.sleep(1)
+    # wait for the threads to run out of hosts
+    for i in threads:
+        threads[i].join()
 
     # gather results
     result = NodeResultSet()
@@ -102,33 +153,14 @@ def get_ring_nodes(country=None, active_only=False):
         @param active_only: list only active nodes
         @type active_only: boolean
 
-        @return: a list of node names
+        @return: a list of node names, empty if the ring API can't be reached
 
         @rtype: list of strings
     '''
-    global _nodes, _countries
-
-    if _nodes and not country:
-        return _nodes.keys()
-    elif _nodes and _countries:
-        return _countries[country.upper()].keys()
-
     try:
-        req = urllib2.Request("%snodes%s%s" % (RING_API, "/active" if active_only else "", "/country/%s" % country.upper() if country != None else ''))
-        opener = urllib2.build_opener()
-        f = opener.open(req)
-        result = simplejson.load(f)
-        if result["info"]["success"] == 1:
-            nodes = {}
-            for host in result["results"]["nodes"]:
-                nodes[host["hostname"].replace(".ring.nlnog.net", "")] = host
-                if not _countries.has_key(host['countrycode']):
-                    _countries[host['countrycode']] = {}
-                _countries[host["countrycode"]][host["hostname"].replace(".ring.nlnog.net", "")] = host
-        _nodes = nodes
-        return nodes.keys()
-    except Exception, e:
-        return {}
+        return get_inventory().get_nodes(country, active_only)
+    except RingException:
+        return []
 
 
 def get_ring_countries():
@@ -137,16 +169,10 @@ def get_ring_countries():
         @return: a list of country codes
         @rtype: list of strings
     '''
-
-    global _countries
-    if _countries:
-        return _countries.keys()
-    
-    # update node list
-    nodes = get_ring_nodes()
-
-    # _countries is now available
-    return _countries.keys()
+    try:
+        return get_inventory().get_countries()
+    except RingException:
+        return []
 
 
 def get_ring_networks():
@@ -155,12 +181,10 @@ def get_ring_networks():
         @return: a list of all network names
         @rtype: list of strings
     '''
-
-    networks = {}
-    hosts = get_ring_nodes()
-    for h in hosts:
-        networks[h[:-2]] = 1
-    return networks.keys()
+    try:
+        return get_inventory().get_nodes_by_network().keys()
+    except RingException:
+        return []
     
 
 def pick_nodes(count, 
@@ -168,9 +192,12 @@ def pick_nodes(count,
                inc_countries=[], ex_countries=[], only_countries=[],  
                inc_networks=[], ex_networks=[], only_networks=[],
                support_ipv4=None, support_ipv6_only=None,
-               active_only=True):
+               active_only=True,
+               only_asns=[], ex_asns=[], only_datacenters=[],
+               near=None, max_distance=None):
     ''' Pick a set of ring hosts based on given criteria. If more nodes match
-        the given criteria random nodes are picked.
+        the given criteria random nodes are picked, or the nodes closest to
+        a location if I{near} is given.
 
         @param count: the number of hosts to be picked (at most)
         @type count: integer
@@ -208,132 +235,39 @@ def pick_nodes(count,
         @param active_only: pick only from nodes which are active
         @type active_only: boolean
 
+        @param only_asns: all nodes picked must be in these ASes
+        @type only_asns: integer, string or list of integers or strings
+
+        @param ex_asns: ASes which must be excluded
+        @type ex_asns: integer, string or list of integers or strings
+
+        @param only_datacenters: all nodes picked must be in these datacenters
+        @type only_datacenters: string or list of strings
+
+        @param near: pick the nodes closest to this location instead of
+        random nodes, nodes without a known location are not picked
+        @type near: (latitude, longitude) tuple
+
+        @param max_distance: with I{near}, only pick nodes within this
+        number of kilometers
+        @type max_distance: float
+
         @return: a list of nodes matching the given criteria
         @rtype: list of strings
     '''
-    random.seed(time.time())
-    nodes = get_ring_nodes(active_only=active_only)
-    nbc = get_nodes_by_country()
-    cbn = get_countries_by_node()
-    nbn = get_nodes_by_network()
-    networks = get_ring_networks()
-    v4 = {} 
-
-    if count == 0:
-        count = sys.maxint
-
-    if support_ipv4 != None and support_ipv4 == False:
-        support_ipv6_only = True
-
-    for node in nodes:
-        v4[node] = get_node_details(node)["ipv4"] != None
-        
-    if isinstance(inc_hosts, str):
-        inc_hosts = [inc_hosts]
-    elif inc_hosts == None:
-        inc_hosts = []
-
-    if isinstance(ex_hosts, str):
-        ex_hosts = [ex_hosts]
-    elif ex_hosts == None:
-        ex_hosts = []
-
-    if isinstance(inc_networks, str):
-        inc_networks = [inc_networks]
-    elif inc_networks == None:
-        inc_networks = []
-
-    if isinstance(ex_networks, str):
-        ex_networks = [ex_networks]
-    elif ex_networks == None:
-        ex_networks = []
-
-    if isinstance(only_networks, str):
-        only_networks = [only_networks]
-    elif only_networks == None:
-        only_networks = []
-
-    if isinstance(inc_countries, str):
-        inc_countries = [inc_countries.upper()]
-    elif inc_countries == None:
-        inc_countries = []
-    else:
-        inc_countries = [c.upper() for c in inc_countries]
-
-    if isinstance(ex_countries, str):
-        ex_countries = [ex_countries.upper()]
-    elif ex_countries == None:
-        ex_countries = []
-    else:
-        ex_countries = [c.upper() for c in ex_countries]
-
-    if isinstance(only_countries, str):
-        only_countries = [only_countries.upper()]
-    elif only_countries == None:
-        only_countries = []
-    else:
-        only_countries = [c.upper() for c in only_countries]
-
-
-    newlist = []
-
-    # start with all explicitly included hosts
-    if inc_hosts:
-        for h in inc_hosts:
-            if h in nodes:
-                newlist.append(h)
-                nodes.remove(h)
-
-    # for each network to be included pick a node
-    for n in inc_networks:
-        valid = []
-        for h in nbn.get(n, ''):
-            if ((not h in newlist) and (not h in ex_hosts) and
-               ((support_ipv4 != None and ((support_ipv4 and v4.get(h, False)) or not support_ipv4)) or support_ipv4 == None) and
-               ((support_ipv6_only != None and ((support_ipv6_only and not v4.get(h, True)) or not support_ipv6_only)) or support_ipv6_only == None) and
-               (cbn.get(h, '').upper() not in ex_countries) and 
-               (cbn.get(h, '').upper() in only_countries or len(only_countries) == 0)):
-                    valid.append(h)
-        if len(valid) > 0:
-            r = random.randint(0, len(valid) - 1)
-            newlist.append(valid[r])
-            nodes.remove(valid[r])
-
-    # for each country to be included pick a host
-    for c in inc_countries:
-        valid = []
-        for h in nbc.get(c, ''):
-            if ((not h in newlist) and (not h in ex_hosts) and
-               ((support_ipv4 != None and ((support_ipv4 and v4.get(h, False)) or not support_ipv4)) or support_ipv4 == None) and
-               ((support_ipv6_only != None and ((support_ipv6_only and not v4.get(h, True)) or not support_ipv6_only)) or support_ipv6_only == None) and
-               (nbn.get(h, '') not in ex_networks) and
-               (h[:-2] in only_networks or len(only_networks) == 0)):
-                    valid.append(h)
-        if len(valid) > 0:
-            r = random.randint(0, len(valid) - 1)
-            newlist.append(valid[r])
-            nodes.remove(valid[r])
-
-    # select all possibly valid hosts 
-    valid = []
-    for h in nodes:
-        if ((not h in newlist) and (not h in ex_hosts) and
-           ((support_ipv4 != None and ((support_ipv4 and v4.get(h, False)) or not support_ipv4)) or support_ipv4 == None) and
-           ((support_ipv6_only != None and ((support_ipv6_only and not v4.get(h, True)) or not support_ipv6_only)) or support_ipv6_only == None) and
-           (nbn.get(h, '').upper() not in ex_networks) and (cbn.get(h, '') not in ex_countries) and
-           (cbn.get(h, '').upper() in only_countries or len(only_countries) == 0) and
-           (h[:-2] in only_networks or len(only_networks) == 0)):
-                valid.append(h)
-
-    # add enough nodes upto the requested number
-    if len(valid) + len(newlist) <= count:
-        [newlist.append(v) for v in valid]
-    elif len(valid) > 0:
-        for i in range(count - len(newlist)):
-            r = random.randint(0, len(valid) - 1)
-            newlist.append(valid[r])
-            valid.remove(valid[r])
-    return newlist
+    # see L{NodeSelector} to pick nodes repeatedly using the same criteria
+    selector = NodeSelector(count,
+        inc_hosts=inc_hosts, ex_hosts=ex_hosts,
+        inc_countries=inc_countries, ex_countries=ex_countries, only_countries=only_countries,
+        inc_networks=inc_networks, ex_networks=ex_networks, only_networks=only_networks,
+        support_ipv4=support_ipv4, support_ipv6_only=support_ipv6_only,
+        active_only=active_only,
+        only_asns=only_asns, ex_asns=ex_asns, only_datacenters=only_datacenters,
+        near=near, max_distance=max_distance)
+    try:
+        return selector.pick()
+    except RingException:
+        return []
 
 
 def is_ring_node(name):
@@ -366,14 +300,10 @@ def get_countries_by_node():
         @return: a dictionary containing node->country mappings
         @rtype: dictionary
     '''
-    result = {}
-    countries = get_ring_countries()
-    for country in countries:
-        nodes = get_ring_nodes(country) 
-        for node in nodes:
-            result[node] = country
-
-    return result
+    try:
+        return get_inventory().get_countries_by_node()
+    except RingException:
+        return {}
 
 
 def get_nodes_by_country():
@@ -382,15 +312,10 @@ def get_nodes_by_country():
         @return: a dictonary containing country->list of nodes mappings
         @rtype: dictionary
     '''
-    result = {}
-    countries = get_ring_countries()
-    for country in countries:
-        result[country] = []
-        nodes = get_ring_nodes(country) 
-        for node in nodes:
-            result[country].append(node)
-
-    return result
+    try:
+        return get_inventory().get_nodes_by_country()
+    except RingException:
+        return {}
 
 
 def get_nodes_by_network():
@@ -399,14 +324,10 @@ def get_nodes_by_network():
         @return: a dictionary containing network->list of nodes mappings
         @rtype: dictionary
     '''
-    result = {}
-    nodes = get_ring_nodes()
-    for node in nodes:
-        if not node[:-2] in result.keys():
-            result[node[:-2]] = []
-        result[node[:-2]].append(node)
-    
-    return result
+    try:
+        return get_inventory().get_nodes_by_network()
+    except RingException:
+        return {}
 
 
 def get_node_country(node):
@@ -422,24 +343,103 @@ def get_node_country(node):
     return get_countries_by_node()[node]
 
 
+def get_node_network(node):
+    ''' Get the network of a node.
+
+        @param node: the name of the node
+        @type node: string
+
+        @return: the name of the network, None for unknown nodes
+        @rtype: string
+    '''
+    details = get_node_details(node)
+    return details.network if details != None else None
+
+
 def get_node_details(node):
     ''' Get detailed information of a node
 
         @param node: the name of the node
         @type node: string
         
-        @return: a dictionary with detailed info
-        @rtype: dictionary
+        @return: the details of the node (which can be used like a
+        dictionary), None for unknown nodes
+        @rtype: L{NodeInfo}
     '''
-    global _nodes
-
-    nodes = get_ring_nodes()
-    if node in nodes:
-        return _nodes[node]
-    else:
+    try:
+        return get_inventory().get_node(node)
+    except RingException:
         return None
 
 
+def get_nodes_by_asn(asn, active_only=False):
+    ''' Get the nodes in an AS.
+
+        @param asn: the AS number, as 1234 or "AS1234"
+        @type asn: integer or string
+
+        @param active_only: only get the active nodes
+        @type active_only: boolean
+
+        @return: the names of the nodes
+        @rtype: list of strings
+    '''
+    try:
+        return get_inventory().get_nodes_by_asn(asn, active_only=active_only)
+    except RingException:
+        return []
+
+
+def get_nodes_by_datacenter(datacenter, active_only=False):
+    ''' Get the nodes in a datacenter (not case sensitive).
+
+        @param datacenter: the name of the datacenter
+        @type datacenter: string
+
+        @param active_only: only get the active nodes
+        @type active_only: boolean
+
+        @return: the names of the nodes
+        @rtype: list of strings
+    '''
+    try:
+        return get_inventory().get_nodes_by_datacenter(datacenter, active_only=active_only)
+    except RingException:
+        return []
+
+
+def get_nearest_nodes(latitude, longitude, count, active_only=False, max_distance=None, names=None):
+    ''' Get the nodes closest to a location, using the location published
+        by the API. Nodes without a known location are never returned.
+
+        @param latitude: latitude of the location
+        @type latitude: float
+
+        @param longitude: longitude of the location
+        @type longitude: float
+
+        @param count: the (maximum) number of nodes
+        @type count: integer
+
+        @param active_only: only get the active nodes
+        @type active_only: boolean
+
+        @param max_distance: only get nodes within this number of kilometers
+        @type max_distance: float
+
+        @param names: only get nodes from this set of names
+        @type names: set of strings
+
+        @return: the nodes and their distance in kilometers, closest first
+        @rtype: list of (string, float) tuples
+    '''
+    try:
+        return get_inventory().get_nearest_nodes(latitude, longitude, count,
+            active_only=active_only, max_distance=max_distance, names=names)
+    except RingException:
+        return []
+
+
 def pastebin(text):
     ''' Put text on the NLNOG pastebin
         
@@ -451,18 +451,24 @@ def pastebin(text):
 
         @raise RingException: if the paste fails
     '''
+    import httpclient, httplib, urlparse
+
     postarray = [
         ("content", text),
         ("mimetype", "text/html"),
         ("ttl", 604800)
     ]
-    postdata = urllib.urlencode(postarray)
+    # a successful paste redirects to the url of the paste
     try:
-        req = urllib2.Request(url=PASTEBIN, data=postdata)   
-        result = urllib2.urlopen(req)
-        if result.url == PASTEBIN:
-            raise RingException("failed to put the text on the pastebin.")
-        else:
-            return result.url
-    except:
-        raise RingException("failed to put the text on the pastebin.")
+        response = httpclient.get_client().post(PASTEBIN, postarray)
+        try:
+            response.read()
+        finally:
+            response.close()
+    except (IOError, httplib.HTTPException), e:
+        raise RingException("failed to put the text on the pastebin: %s" % e)
+
+    location = response.getheader("Location")
+    if response.status not in [301, 302, 303, 307] or not location or location.rstrip("/") == PASTEBIN.rstrip("/"):
+        raise RingException("failed to put the text on the pastebin: HTTP %d %s" % (response.status, response.reason))
+    return urlparse.urljoin(PASTEBIN, location)
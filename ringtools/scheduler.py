@@ -0,0 +1,222 @@
+#! /usr/bin/env python
+"""
+Scheduling of hosts over the worker threads of L{ring.run_command}.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import collections, math
+
+from exception import RingException
+from inventory import get_inventory, get_network, RING_DOMAIN
+
+# ===========================================================================
+
+def _name(host):
+    """ The node name of a host given by name or hostname.
+    """
+    if host.endswith(RING_DOMAIN):
+        return host[:-len(RING_DOMAIN)]
+    return host
+
+
+def get_spread_key(spread):
+    """ Get the function telling which group a host belongs to, for
+        spreading the hosts of each group over a run.
+
+        @param spread: I{network} or I{country} (looked up in the
+        inventory, networks are derived from the name if the inventory
+        can't be retrieved), or a function taking a host and returning
+        its group
+        @type spread: string or function
+
+        @return: a function returning the group of a host
+        @rtype: function
+
+        @raise RingException: for unknown ways to spread hosts
+    """
+    if callable(spread):
+        return spread
+    if spread == 'network':
+        try:
+            details = get_inventory().get_node_details()
+        except RingException:
+            details = {}
+        def network(host):
+            node = details.get(_name(host))
+            return node.network if node != None else get_network(_name(host))
+        return network
+    if spread == 'country':
+        try:
+            cbn = get_inventory().get_countries_by_node()
+        except RingException:
+            # without the API all hosts are in the same group
+            cbn = {}
+        return lambda host: cbn.get(_name(host))
+    raise RingException("Unknown way to spread hosts: %s." % spread)
+
+
+def runtime_priority(results, slowest_first=True):
+    """ Build a priority from the runtimes of an earlier run, see
+        L{plan}. Starting the slowest hosts first shortens the total time
+        of a run, since no slow host is left when the other hosts are
+        done; starting the fastest hosts first gives most results sooner.
+        Hosts without a runtime are treated as the slowest hosts. Hosts
+        with runtimes within a factor 2 of each other get the same
+        priority.
+
+        @param results: the results of an earlier run
+        @type results: L{NodeResultSet}
+
+        @param slowest_first: start with the slowest hosts
+        @type slowest_first: boolean
+
+        @return: a function returning the priority of a host
+        @rtype: function
+    """
+    # runtimes within a factor 2 get the same priority, so the hosts can
+    # still be spread, see L{plan}
+    levels = {}
+    for r in results.get_results():
+        if r.get_value('runtime') != None:
+            levels[r.get_hostname()] = int(math.floor(math.log(max(r.get_value('runtime'), 0.001), 2)))
+    slowest = max(levels.values() or [0])
+    if slowest_first:
+        return lambda host: -levels.get(host, slowest)
+    return lambda host: levels.get(host, slowest)
+
+
+def spread_evenly(hosts, key):
+    """ Reorder hosts so the hosts of each group are spread evenly over
+        the list, keeping their order within the group. A group with a
+        tenth of the hosts gets every tenth place, instead of all places
+        at the start or the end of the list.
+
+        @param hosts: the hosts
+        @type hosts: list of strings
+
+        @param key: function returning the group of a host
+        @type key: function
+
+        @return: the reordered hosts
+        @rtype: list of strings
+    """
+    groups = {}
+    order = []
+    for host in hosts:
+        k = key(host)
+        if not k in groups:
+            groups[k] = []
+            order.append(k)
+        groups[k].append(host)
+
+    # each host gets the middle of its share of the run as position, ties
+    # are broken by the order in which the groups first appear
+    places = []
+    for (g, k) in enumerate(order):
+        members = groups[k]
+        n = float(len(members))
+        for (i, host) in enumerate(members):
+            places.append(((i + 0.5) / n, g, host))
+    places.sort()
+    return [host for (place, g, host) in places]
+
+
+def plan(hosts, priority=None, spread=None):
+    """ Determine the order in which hosts are started: by priority, and
+        within the same priority with the hosts of each group spread
+        evenly.
+
+        @param hosts: the hosts
+        @type hosts: list of strings
+
+        @param priority: the priority of each host, lower values are
+        started first. Hosts missing in a dictionary get priority 0.
+        @type priority: function or dictionary
+
+        @param spread: how to spread hosts, see L{get_spread_key}
+        @type spread: string or function
+
+        @return: the hosts in the order to start them
+        @rtype: list of strings
+    """
+    hosts = list(hosts)
+    key = get_spread_key(spread) if spread != None else None
+
+    if priority == None:
+        levels = [hosts]
+    else:
+        if isinstance(priority, dict):
+            priority = (lambda p: lambda host: p.get(host, 0))(priority)
+        byprio = collections.defaultdict(list)
+        for host in hosts:
+            byprio[priority(host)].append(host)
+        levels = [byprio[p] for p in sorted(byprio.keys())]
+
+    if key == None:
+        return [h for level in levels for h in level]
+    return [h for level in levels for h in spread_evenly(level, key)]
+
+# ===========================================================================
+
+class WorkScheduler:
+    """ The queue of hosts of a run, shared by the worker threads.
+
+        The hosts are put in order by L{plan} and handed out from this
+        single queue, so whichever worker is done first starts the next
+        host in that order and no worker sits idle while hosts are left.
+        It has the methods of I{Queue.Queue} used by L{NodeCommandThread},
+        I{get} returns None when all hosts have been handed out.
+    """
+
+    def __init__(self, hosts, priority=None, spread=None):
+        """ Create a new WorkScheduler object.
+
+            @param hosts: the hosts
+            @type hosts: list of strings
+
+            @param priority: the priority of each host, see L{plan}
+            @type priority: function or dictionary
+
+            @param spread: how to spread hosts, see L{plan}
+            @type spread: string or function
+        """
+        self.hosts = collections.deque(plan(hosts, priority, spread))
+
+
+    def get(self):
+        """ Get the next host.
+
+            @return: the host, None if all hosts have been handed out
+            @rtype: string
+        """
+        # popleft is atomic, no lock needed
+        try:
+            return self.hosts.popleft()
+        except IndexError:
+            return None
+
+
+    def task_done(self):
+        """ Nothing to do, the hosts aren't joined.
+        """
+        pass
+
+
+    def __len__(self):
+        return len(self.hosts)
+
+
+    def __repr__(self):
+        return "<WorkScheduler: %d hosts left>" % len(self)
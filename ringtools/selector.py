@@ -0,0 +1,245 @@
+#! /usr/bin/env python
+"""
+Selection of ring nodes based on criteria, compiled once and reused.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import random
+
+from inventory import get_inventory
+
+# ===========================================================================
+
+def _list(value, upper=False, types=(str, unicode)):
+    """ Make a list of an argument given as a single value, a list or None.
+    """
+    if value == None:
+        return []
+    if isinstance(value, types):
+        value = [value]
+    if upper:
+        return [v.upper() for v in value]
+    return list(value)
+
+# ===========================================================================
+
+class NodeSelector:
+    """ Picks nodes matching a set of criteria, see L{ring.pick_nodes}
+        for the criteria.
+
+        The criteria are compiled against the inventory the first time
+        nodes are picked: the nodes matching all criteria and the
+        candidates for each included country and network are looked up
+        once. The compiled criteria are used until the inventory changes,
+        so picking nodes again (for instance in a loop running the same
+        command every minute) only takes a random sample.
+    """
+
+    def __init__(self, count,
+                 inc_hosts=None, ex_hosts=None,
+                 inc_countries=None, ex_countries=None, only_countries=None,
+                 inc_networks=None, ex_networks=None, only_networks=None,
+                 support_ipv4=None, support_ipv6_only=None,
+                 active_only=True,
+                 only_asns=None, ex_asns=None, only_datacenters=None,
+                 near=None, max_distance=None, inventory=None):
+        """ Create a new NodeSelector object. The arguments are the same
+            as those of L{ring.pick_nodes}.
+
+            @param inventory: the inventory to pick nodes from, the inventory
+            shared by the functions in L{ring} if not specified
+            @type inventory: L{RingInventory}
+        """
+        self.count = count
+        self.inc_hosts = _list(inc_hosts)
+        self.ex_hosts = set(_list(ex_hosts))
+        self.inc_countries = _list(inc_countries, upper=True)
+        self.ex_countries = set(_list(ex_countries, upper=True))
+        self.only_countries = set(_list(only_countries, upper=True))
+        self.inc_networks = _list(inc_networks)
+        self.ex_networks = set(_list(ex_networks))
+        self.only_networks = set(_list(only_networks))
+        if support_ipv4 == False:
+            support_ipv6_only = True
+        self.support_ipv4 = support_ipv4
+        self.support_ipv6_only = support_ipv6_only
+        self.active_only = active_only
+        self.only_asns = _list(only_asns, types=(str, unicode, int, long))
+        self.ex_asns = _list(ex_asns, types=(str, unicode, int, long))
+        self.only_datacenters = _list(only_datacenters)
+        self.near = near
+        self.max_distance = max_distance
+        self.inventory = inventory
+        self.random = random.Random()
+
+        # the compiled criteria
+        self.generation = None
+        self.included = []
+        self.groups = []
+        self.candidates = []
+        self.candidate_set = frozenset()
+
+
+    def _get_inventory(self):
+        return self.inventory or get_inventory()
+
+
+    def _ip_ok(self, node):
+        """ Check the IPv4/IPv6-only criteria for a node.
+        """
+        v4 = node.ipv4 != None
+        if self.support_ipv4 and not v4:
+            return False
+        if self.support_ipv6_only and v4:
+            return False
+        return True
+
+
+    def compile(self):
+        """ Look up the nodes matching the criteria in the inventory.
+            This is done by L{pick} when needed, but can be done in
+            advance to keep it out of a time critical loop.
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        inventory = self._get_inventory()
+        # the generation is read first: a change during compilation is
+        # picked up the next time
+        generation = inventory.get_generation()
+        details = inventory.get_node_details(active_only=self.active_only)
+        names = details.keys()
+
+        excluded = set(self.ex_hosts)
+        for asn in self.ex_asns:
+            excluded.update(inventory.get_nodes_by_asn(asn))
+
+        allowed = None
+        if self.only_asns:
+            allowed = set()
+            for asn in self.only_asns:
+                allowed.update(inventory.get_nodes_by_asn(asn))
+        if self.only_datacenters:
+            dc = set()
+            for d in self.only_datacenters:
+                dc.update(inventory.get_nodes_by_datacenter(d))
+            allowed = dc if allowed == None else allowed & dc
+
+        # nodes which can be picked at all
+        usable = [n for n in names if not n in excluded and self._ip_ok(details[n]) and
+            (allowed == None or n in allowed)]
+
+        # one node is picked from each included network and country; the
+        # country criteria don't apply to included networks and vice versa
+        groups = []
+        if self.inc_networks:
+            nbn = inventory.get_nodes_by_network(active_only=self.active_only)
+            usable_set = set(usable)
+        for network in self.inc_networks:
+            groups.append([n for n in nbn.get(network, []) if n in usable_set and
+                not details[n].countrycode in self.ex_countries and
+                (not self.only_countries or details[n].countrycode in self.only_countries)])
+        for country in self.inc_countries:
+            groups.append([n for n in usable if details[n].countrycode == country and
+                not details[n].network in self.ex_networks and
+                (not self.only_networks or details[n].network in self.only_networks)])
+
+        candidates = [n for n in usable if
+            not details[n].network in self.ex_networks and
+            (not self.only_networks or details[n].network in self.only_networks) and
+            not details[n].countrycode in self.ex_countries and
+            (not self.only_countries or details[n].countrycode in self.only_countries)]
+
+        self.included = [h for h in self.inc_hosts if h in details]
+        self.groups = groups
+        self.candidates = candidates
+        self.candidate_set = frozenset(candidates)
+        self.generation = generation
+
+
+    def _sample(self, nodes, count, chosen):
+        """ Pick random nodes from a list, leaving out the nodes already
+            chosen. Takes time in the order of I{count} plus the number
+            of chosen nodes, not the size of the list.
+        """
+        k = min(len(nodes), count + len(chosen))
+        return [n for n in self.random.sample(nodes, k) if not n in chosen][:count]
+
+
+    def pick(self, count=None):
+        """ Pick nodes matching the criteria. The criteria are compiled
+            first if this wasn't done yet or the inventory changed.
+
+            @param count: the number of nodes to pick (at most), the count
+            given when creating the selector if not specified. 0 picks
+            all matching nodes.
+            @type count: integer
+
+            @return: the nodes picked
+            @rtype: list of strings
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        if self.generation == None or self.generation != self._get_inventory().get_generation():
+            self.compile()
+
+        if count == None:
+            count = self.count
+        if count == 0:
+            count = len(self.included) + len(self.groups) + len(self.candidates)
+
+        picked = list(self.included)
+        chosen = set(picked)
+        for group in self.groups:
+            node = self._sample(group, 1, chosen)
+            if node:
+                picked.extend(node)
+                chosen.add(node[0])
+
+        wanted = count - len(picked)
+        if wanted <= 0:
+            return picked
+        if self.near != None:
+            (latitude, longitude) = self.near
+            nearest = self._get_inventory().get_nearest_nodes(latitude, longitude, wanted + len(chosen),
+                max_distance=self.max_distance, names=self.candidate_set)
+            picked.extend([n for (n, d) in nearest if not n in chosen][:wanted])
+        else:
+            picked.extend(self._sample(self.candidates, wanted, chosen))
+        return picked
+
+
+    def get_candidates(self):
+        """ Get all nodes which can be picked, apart from the included
+            hosts, countries and networks.
+
+            @return: the nodes matching all criteria
+            @rtype: list of strings
+
+            @raise RingException: if the nodes can't be retrieved
+        """
+        if self.generation == None or self.generation != self._get_inventory().get_generation():
+            self.compile()
+        return list(self.candidates)
+
+
+    def __repr__(self):
+        """ Fancy textual representation of the object.
+
+            @return: textual representation
+            @rtype: string
+        """
+        if self.generation == None:
+            return "<NodeSelector: %d nodes, not compiled>" % self.count
+        return "<NodeSelector: %d nodes from %d candidates>" % (self.count, len(self.candidates))
@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+"""
+Benchmarks for the startup time of the utilities, the memory used by
+results and the title scanner of ring-curl. Nothing is sent to the ring.
+
+Run from the top of the source tree:
+
+    % python tests/benchmark.py
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, time, subprocess, timeit
+
+TOP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, TOP)
+sys.path.insert(0, os.path.join(TOP, 'utils'))
+
+# number of runs of which the median is taken
+RUNS = 15
+
+# ===========================================================================
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) / 2]
+
+
+def run(args, cwd=TOP):
+    """ The time it takes to run a command, in milliseconds.
+    """
+    devnull = open(os.devnull, "w")
+    try:
+        start = time.time()
+        subprocess.call(args, cwd=cwd, stdout=devnull, stderr=devnull,
+            env=dict(os.environ, PYTHONPATH=TOP, PYTHONDONTWRITEBYTECODE="1"))
+        return (time.time() - start) * 1000
+    finally:
+        devnull.close()
+
+
+def startup():
+    """ Startup time of the utilities and of importing ringtools.ring,
+        which should not load paramiko.
+    """
+    print "startup, median of %d runs:" % RUNS
+    commands = [
+        ("python -c pass", [sys.executable, "-c", "pass"], TOP),
+        ("import ringtools.ring", [sys.executable, "-c", "import ringtools.ring"], TOP),
+        ("ring-ping.py --help", [sys.executable, "ring-ping.py", "--help"], os.path.join(TOP, "utils")),
+        ("ring-curl.py --help", [sys.executable, "ring-curl.py", "--help"], os.path.join(TOP, "utils")),
+    ]
+    for (name, args, cwd) in commands:
+        print "  %-24s %6.1f ms" % (name, median([run(args, cwd) for i in range(RUNS)]))
+
+    loaded = subprocess.check_output([sys.executable, "-c",
+        "import sys, ringtools.ring; print 'paramiko' in sys.modules"], cwd=TOP).strip()
+    print "  paramiko loaded by import ringtools.ring: %s" % loaded
+
+
+RESULTS = """
+import resource
+from ringtools.result import NodeResult, NodeResultSet
+
+def rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+before = rss()
+results = NodeResultSet()
+for i in range(%(count)d):
+    # hostnames and value names arrive as new strings, as read from SSH
+    r = NodeResult("node%%03d.ring.nlnog.net" %% (i %% 500), NodeResult.SSH_OK, 0,
+        ["line %%d of the output" %% l for l in range(3)], [])
+    r.add_value("".join(["run", "time"]), i / 1000.0)
+    r.add_value("".join(["a", "vg"]), i / 100.0)
+    results.append(r)
+    if %(drop)s:
+        r.drop_output()
+print (rss() - before) / 1024.0
+"""
+
+
+def results(count=50000):
+    """ Memory used by results, as the growth of the maximum resident set
+        size of a separate process.
+    """
+    print "memory of %d results (500 hosts, 3 output lines, 2 values):" % count
+    for drop in [False, True]:
+        growth = float(subprocess.check_output([sys.executable, "-c",
+            RESULTS % {'count': count, 'drop': drop}], cwd=TOP))
+        print "  %-24s %6.1f MB" % ("with drop_output()" if drop else "keeping the output", growth)
+
+
+def page(size):
+    """ An HTML page of about the given size with a title in its head.
+    """
+    lines = ["<!DOCTYPE html>", "<html>", "<head>", '<meta charset="utf-8">',
+        "<title>The Book &amp; its\n  print version</title>", "</head>", "<body>"]
+    row = '<p class="text">Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>'
+    lines.extend([row] * (size / (len(row) + 1)))
+    lines.extend(["</body>", "</html>"])
+    return lines
+
+
+def titles():
+    """ Time to find the title of large pages, compared to BeautifulSoup
+        if it is installed.
+    """
+    import curlhtml
+    try:
+        from BeautifulSoup import BeautifulSoup
+    except ImportError:
+        BeautifulSoup = None
+
+    print "title of a page, median of %d runs:" % RUNS
+    for size in [300000, 1300000, 1900000]:
+        lines = page(size)
+        timer = timeit.Timer(lambda: curlhtml.extract_title(lines))
+        scanner = median(timer.repeat(RUNS, 1)) * 1000
+        line = "  %4.2f MB: TitleScanner %8.3f ms" % (size / 1e6, scanner)
+        if BeautifulSoup != None:
+            timer = timeit.Timer(lambda: BeautifulSoup("\n".join(lines)).title.string)
+            line += ", BeautifulSoup %8.1f ms" % (median(timer.repeat(3, 1)) * 1000)
+        print line
+
+
+if __name__ == '__main__':
+    startup()
+    results()
+    titles()
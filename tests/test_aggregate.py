@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+"""
+Tests for the accumulators in L{ringtools.aggregate}.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools import aggregate
+from ringtools.result import NodeResult
+
+
+def result(hostname, avg, ssh_result=NodeResult.SSH_OK, exitcode=0):
+    r = NodeResult(hostname, ssh_result, exitcode)
+    r.add_value('avg', avg)
+    return r
+
+
+RESULTS = [
+    result('nl01', 10.0),
+    result('nl02', 20.0),
+    result('de01', 30.0),
+    # partial results of a ping which lost replies and one which timed out
+    result('de02', 500.0, exitcode=1),
+    result('us01', 900.0, NodeResult.SSH_TIMEOUT, None),
+    result('us02', None),
+]
+
+# ===========================================================================
+
+class ValueAccumulatorTest(unittest.TestCase):
+
+    def test_all(self):
+        acc = aggregate.ValueAccumulator('avg')
+        for r in RESULTS:
+            acc.add_result(r)
+        self.assertEqual((acc.get_count(), acc.get_min(), acc.get_max()), (5, 10.0, 900.0))
+        self.assertAlmostEqual(acc.get_avg(), 292.0)
+
+    def test_successful_only(self):
+        acc = aggregate.ValueAccumulator('avg', successful_only=True)
+        for r in RESULTS:
+            acc.add_result(r)
+        self.assertEqual((acc.get_count(), acc.get_min(), acc.get_max()), (3, 10.0, 30.0))
+        self.assertAlmostEqual(acc.get_avg(), 20.0)
+
+
+class GroupedAccumulatorTest(unittest.TestCase):
+
+    def test_successful_only(self):
+        acc = aggregate.GroupedAccumulator('avg', lambda r: r.get_hostname()[:2], successful_only=True)
+        for r in RESULTS:
+            acc.add_result(r)
+        groups = acc.get_groups()
+        self.assertEqual(dict([(g, a.get_avg()) for (g, a) in groups.items() if a.get_count() > 0]),
+            {'nl': 15.0, 'de': 30.0})
+        self.assertEqual(groups['us'].get_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
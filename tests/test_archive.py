@@ -0,0 +1,121 @@
+#! /usr/bin/env python
+"""
+Tests for the result archives in L{ringtools.archive}.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest, tempfile, shutil, json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools import archive
+from ringtools.exception import RingException
+from ringtools.result import NodeResult
+
+
+def result(hostname, stdout=None, stderr=None, **values):
+    r = NodeResult(hostname, NodeResult.SSH_OK, 0, stdout, stderr)
+    for (name, value) in values.items():
+        r.add_value(name, value)
+    return r
+
+# ===========================================================================
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "results.ring")
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+    def test_roundtrip(self):
+        archive.dump([result("a01", ["up"], [], avg=1.5), result("b01", avg=2.5)], self.path, timestamp=100.0)
+        archive.dump(result("a01", ["down"], ["oops"], avg=3.5), self.path, timestamp=200.0)
+
+        a = archive.ResultArchive(self.path)
+        try:
+            self.assertEqual(a.count_results(), 3)
+            self.assertEqual(sorted(a.get_hostnames()), ["a01", "b01"])
+            self.assertEqual(a.get_timestamps(), [100.0, 200.0])
+            self.assertEqual([r.get_stdout() for r in a.get_results(hostname="a01").get_results()],
+                [["up"], ["down"]])
+            self.assertEqual(a.get_results(timestamp=200.0).get_results()[0].get_stderr(), ["oops"])
+            # output which was dropped stays None
+            b = a.get_results(hostname="b01").get_results()[0]
+            self.assertEqual((b.get_stdout(), b.get_stderr(), b.get_value("avg")), (None, None, 2.5))
+            self.assertEqual([r.get_hostname() for r in a.find("avg", 3.5).get_results()], ["a01"])
+        finally:
+            a.close()
+
+
+    def test_overwrite(self):
+        archive.dump(result("a01"), self.path)
+        archive.dump(result("b01"), self.path, append=False)
+        self.assertEqual([r.get_hostname() for r in archive.load(self.path).get_results()], ["b01"])
+
+
+    def test_raw_output(self):
+        # output which isn't valid UTF-8 is kept as it was received
+        stdout = ["<title>Caf\xe9</title>", "", "\xff\xfe"]
+        archive.dump(result("a01", stdout, ["\x80"], title="Caf\xe9"), self.path)
+        r = archive.load(self.path).get_results()[0]
+        self.assertEqual(r.get_stdout(), stdout)
+        self.assertEqual(r.get_stderr(), ["\x80"])
+        self.assertEqual(r.get_value("title"), u"Caf\ufffd")
+
+
+    def test_truncated(self):
+        archive.dump([result("a01", ["1"]), result("b01", ["2"])], self.path)
+        # an interrupted write
+        f = open(self.path, "ab")
+        f.write("\x00" * 10)
+        f.close()
+        self.assertEqual(archive.load(self.path).count_results(), 2)
+
+        archive.dump(result("c01", ["3"]), self.path)
+        self.assertEqual([r.get_stdout() for r in archive.load(self.path).get_results()],
+            [["1"], ["2"], ["3"]])
+
+
+    def test_old_records(self):
+        # records of older versions have JSON output
+        values = json.dumps([None, {"avg": 1.0}])
+        output = json.dumps([["up"], []])
+        f = open(self.path, "wb")
+        f.write(archive.MAGIC)
+        f.write(archive.RECORD_HEADER.pack(100.0, 3, 0, 0, len(values), len(output)))
+        f.write("a01" + values + output)
+        f.close()
+        archive.dump(result("b01", ["down"]), self.path)
+
+        results = archive.load(self.path).get_results()
+        self.assertEqual([r.get_stdout() for r in results], [[u"up"], ["down"]])
+        self.assertEqual(results[0].get_value("avg"), 1.0)
+
+
+    def test_not_an_archive(self):
+        f = open(self.path, "wb")
+        f.write("hello world\n")
+        f.close()
+        self.assertRaises(RingException, archive.dump, result("a01"), self.path)
+        self.assertRaises(RingException, archive.ResultArchive, self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
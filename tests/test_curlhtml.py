@@ -0,0 +1,76 @@
+#! /usr/bin/env python
+"""
+Tests for the title scanner of ring-curl in utils/curlhtml.py.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+
+from curlhtml import TitleScanner, extract_title, get_charset
+
+# ===========================================================================
+
+class TitleScannerTest(unittest.TestCase):
+
+    def test_title(self):
+        self.assertEqual(extract_title(['<html><head>', '<title>NLNOG RING</title>', '</head>']), 'NLNOG RING')
+
+    def test_multiline(self):
+        self.assertEqual(extract_title(['<TITLE>', '  NLNOG', '  RING  ', '</TITLE>']), 'NLNOG RING')
+
+    def test_entities(self):
+        self.assertEqual(extract_title(['<title>Caf\xc3\xa9 &amp; Bar</title>']), 'Caf\xc3\xa9 & Bar')
+        self.assertEqual(extract_title(['<title>R&eacute;seau &#8212; ring</title>']), 'R\xc3\xa9seau \xe2\x80\x94 ring')
+
+    def test_type(self):
+        # titles are UTF-8 encoded byte strings, with or without entities
+        for lines in [['<title>plain</title>'], ['<title>a &amp; b</title>'], ['<title>Caf\xc3\xa9</title>']]:
+            self.assertEqual(type(extract_title(lines)), str)
+
+    def test_charset(self):
+        self.assertEqual(extract_title(['<title>Caf\xe9</title>'], 'iso-8859-1'), 'Caf\xc3\xa9')
+        self.assertEqual(extract_title(['<head><meta charset="windows-1252">', '<title>Caf\xe9</title>']), 'Caf\xc3\xa9')
+        self.assertEqual(extract_title(['<meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-1">',
+            '<title>Caf\xe9</title>']), 'Caf\xc3\xa9')
+
+    def test_invalid(self):
+        # not UTF-8 and no charset given: the byte is replaced
+        self.assertEqual(extract_title(['<title>Caf\xe9</title>']), 'Caf\xef\xbf\xbd')
+        self.assertEqual(extract_title(['<title>Caf\xe9</title>'], 'no-such-charset'), 'Caf\xef\xbf\xbd')
+
+    def test_no_title(self):
+        self.assertEqual(extract_title(['<html><head></head>', '<body><title>late</title>']), None)
+        self.assertEqual(extract_title([]), None)
+
+    def test_truncated(self):
+        self.assertEqual(extract_title(['<head><title>cut off']), 'cut off')
+
+    def test_stops_early(self):
+        scanner = TitleScanner()
+        self.assertFalse(scanner.feed('<html><head>'))
+        self.assertTrue(scanner.feed('<title>done</title>'))
+        self.assertTrue(scanner.feed('<title>ignored</title>'))
+        self.assertEqual(scanner.get_title(), 'done')
+
+    def test_get_charset(self):
+        self.assertEqual(get_charset('text/html; charset=UTF-8'), 'UTF-8')
+        self.assertEqual(get_charset('text/html'), None)
+        self.assertEqual(get_charset(None), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#! /usr/bin/env python
+"""
+Tests for the exporters in L{ringtools.export}.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest, json, csv, StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools import export
+from ringtools.result import NodeResult
+
+
+def result(title):
+    r = NodeResult('test01', NodeResult.SSH_OK, 0, ['<title>%s</title>' % title], [])
+    r.add_value('title', title)
+    r.add_value('total', 0.25)
+    return r
+
+# ===========================================================================
+
+class JSONLinesExporterTest(unittest.TestCase):
+
+    def test_values(self):
+        f = StringIO.StringIO()
+        export.JSONLinesExporter(f, values=['total']).add_result(result('Cafe'))
+        record = json.loads(f.getvalue())
+        self.assertEqual(record['hostname'], 'test01')
+        self.assertEqual(record['values'], {'total': 0.25})
+
+    def test_bytes(self):
+        # titles in latin-1 and in UTF-8
+        f = StringIO.StringIO()
+        exporter = export.JSONLinesExporter(f, output=True)
+        exporter.add_result(result('Caf\xe9'))
+        exporter.add_result(result('Caf\xc3\xa9'))
+        records = [json.loads(l) for l in f.getvalue().splitlines()]
+        self.assertEqual(records[0]['values']['title'], u'Caf\ufffd')
+        self.assertEqual(records[0]['stdout'], [u'<title>Caf\ufffd</title>'])
+        self.assertEqual(records[1]['values']['title'], u'Caf\xe9')
+
+
+class CSVExporterTest(unittest.TestCase):
+
+    def test_bytes(self):
+        f = StringIO.StringIO()
+        exporter = export.CSVExporter(f)
+        exporter.add_result(result('Caf\xe9'))
+        rows = list(csv.reader(StringIO.StringIO(f.getvalue())))
+        self.assertEqual(rows[0][:2], ['timestamp', 'hostname'])
+        self.assertEqual(json.loads(rows[1][5])['title'], u'Caf\ufffd')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,240 @@
+#! /usr/bin/env python
+"""
+Tests for L{ringtools.httpclient}, against a local HTTP server standing in
+for the ring API.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest, threading, time, gzip, socket, StringIO
+import BaseHTTPServer, SocketServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools.httpclient import HTTPClient
+from ringtools.exception import RingException
+
+
+BODY = "".join(["node%05d\n" % i for i in range(20000)])
+
+# ===========================================================================
+
+class StandIn(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ A local HTTP server counting connections and requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), Handler)
+        self.connections = 0
+        self.requests = {}
+        self.failures = 0
+        self.lock = threading.Lock()
+
+
+    def count(self, path):
+        self.lock.acquire()
+        try:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            return self.requests[path]
+        finally:
+            self.lock.release()
+
+
+    def url(self, path):
+        return "http://127.0.0.1:%d%s" % (self.server_address[1], path)
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Serves the paths used by the tests:
+
+        - /plain: a small body
+        - /gzip: L{BODY} gzip compressed if accepted
+        - /etag: a body, or 304 if the ETag matches
+        - /flaky: 503 for the first I{failures} requests
+        - /once: a small body, after which the connection is dropped
+        - /slow: a body after a second
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.lock.acquire()
+        self.server.connections += 1
+        self.server.lock.release()
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def send_body(self, status, body, headers=None):
+        self.send_response(status)
+        for (name, value) in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def do_GET(self):
+        n = self.server.count(self.path)
+        if self.path == "/plain":
+            self.send_body(200, "hello")
+        elif self.path == "/gzip":
+            if "gzip" in (self.headers.getheader("Accept-Encoding") or ""):
+                data = StringIO.StringIO()
+                f = gzip.GzipFile(fileobj=data, mode="wb")
+                f.write(BODY)
+                f.close()
+                self.send_body(200, data.getvalue(), {"Content-Encoding": "gzip"})
+            else:
+                self.send_body(200, BODY)
+        elif self.path == "/etag":
+            if self.headers.getheader("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.send_header("ETag", '"v1"')
+                self.end_headers()
+            else:
+                self.send_body(200, "nodes", {"ETag": '"v1"'})
+        elif self.path == "/flaky":
+            if n <= self.server.failures:
+                self.send_body(503, "try again")
+            else:
+                self.send_body(200, "ok")
+        elif self.path == "/once":
+            self.send_body(200, "bye")
+            # drop the connection without telling the client
+            self.close_connection = 1
+        else:
+            self.send_body(404, "not found")
+
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader("Content-Length") or 0))
+        self.server.count("POST " + self.path)
+        if self.path == "/slow":
+            time.sleep(1)
+        self.send_body(200, "posted")
+
+# ===========================================================================
+
+class HTTPClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandIn()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.client = HTTPClient(backoff=0.05)
+
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def fetch(self, path, headers=None):
+        response = self.client.get(self.server.url(path), headers)
+        try:
+            return (response.status, response.read())
+        finally:
+            response.close()
+
+
+    def test_gzip(self):
+        self.assertEqual(self.fetch("/gzip"), (200, BODY))
+
+        # reading in parts decompresses in parts
+        response = self.client.get(self.server.url("/gzip"))
+        parts = []
+        while True:
+            data = response.read(4096)
+            if not data:
+                break
+            self.assertTrue(len(data) <= 4096)
+            parts.append(data)
+        response.close()
+        self.assertEqual("".join(parts), BODY)
+
+
+    def test_not_modified(self):
+        self.assertEqual(self.fetch("/etag"), (200, "nodes"))
+        self.assertEqual(self.fetch("/etag", {"If-None-Match": '"v1"'}), (304, ""))
+        # the connection is still usable after a response without a body
+        self.assertEqual(self.fetch("/plain"), (200, "hello"))
+        self.assertEqual(self.server.connections, 1)
+
+
+    def test_keepalive(self):
+        for i in range(5):
+            self.assertEqual(self.fetch("/plain"), (200, "hello"))
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.requests["/plain"], 5)
+
+
+    def test_retry(self):
+        self.server.failures = 2
+        start = time.time()
+        self.assertEqual(self.fetch("/flaky"), (200, "ok"))
+        # waited 0.05 and 0.1 seconds before the retries
+        self.assertTrue(time.time() - start >= 0.15)
+        self.assertEqual(self.server.requests["/flaky"], 3)
+        # the connection was kept over the retries
+        self.assertEqual(self.server.connections, 1)
+
+
+    def test_retries_exhausted(self):
+        self.server.failures = 5
+        self.assertEqual(self.fetch("/flaky"), (503, "try again"))
+        self.assertEqual(self.server.requests["/flaky"], 3)
+
+
+    def test_unreachable(self):
+        # a port nobody listens on
+        s = socket.socket()
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+        s.close()
+        client = HTTPClient(retries=1, backoff=0.01)
+        self.assertRaises(RingException, client.get, "http://127.0.0.1:%d/plain" % port)
+
+
+    def test_stale_connection(self):
+        # the idle connection was closed by the server, the POST is sent
+        # once over a new connection
+        self.assertEqual(self.fetch("/once"), (200, "bye"))
+        time.sleep(0.1)
+        response = self.client.post(self.server.url("/plain"), [("content", "x")])
+        self.assertEqual((response.status, response.read()), (200, "posted"))
+        response.close()
+        self.assertEqual(self.server.requests["POST /plain"], 1)
+        self.assertEqual(self.server.connections, 2)
+
+
+    def test_post_not_repeated(self):
+        # a POST over a reused connection which times out after it was sent
+        # is not sent again
+        self.client = HTTPClient(read_timeout=0.3, backoff=0.01)
+        self.assertEqual(self.fetch("/plain"), (200, "hello"))
+        self.assertRaises(RingException, self.client.post, self.server.url("/slow"), [("content", "x")])
+        time.sleep(1.5)
+        self.assertEqual(self.server.requests["POST /slow"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+"""
+Tests for the node names and networks in L{ringtools.inventory}.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest, json, StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools import inventory
+
+
+def response(names):
+    """ An API response listing nodes with the given names.
+    """
+    return StringIO.StringIO(json.dumps({"info": {"success": 1}, "results": {"nodes": [
+        {"hostname": name + inventory.RING_DOMAIN, "active": 1} for name in names]}}))
+
+# ===========================================================================
+
+class GetNetworkTest(unittest.TestCase):
+
+    def test_two_digits(self):
+        self.assertEqual(inventory.get_network("atrato01"), "atrato")
+        self.assertEqual(inventory.get_network("bit01"), "bit")
+
+    def test_hundred_nodes(self):
+        # without context the whole number is stripped
+        self.assertEqual(inventory.get_network("atrato101"), "atrato")
+        self.assertEqual(inventory.get_network("atrato1234"), "atrato")
+        # networks ending in digits need the other nodes, see below
+        self.assertEqual(inventory.get_network("init701"), "init")
+
+    def test_known_networks(self):
+        networks = inventory.get_networks(["atrato01", "atrato02", "init701", "level302"])
+        self.assertEqual(networks, set(["atrato"]))
+        self.assertEqual(inventory.get_network("atrato101", networks), "atrato")
+        # only seen with three digits: a network ending in a digit
+        self.assertEqual(inventory.get_network("init701", networks), "init7")
+        self.assertEqual(inventory.get_network("level301", networks), "level3")
+        self.assertEqual(inventory.get_network("as286", networks), "as2")
+        self.assertEqual(inventory.get_network("init701", set(["init7"])), "init7")
+
+    def test_no_number(self):
+        self.assertEqual(inventory.get_network("ringnode"), "ringnode")
+        self.assertEqual(inventory.get_network("1234"), "1234")
+        self.assertEqual(inventory.get_network(""), "")
+        self.assertEqual(inventory.get_network(None), None)
+
+
+class ReadNodesTest(unittest.TestCase):
+
+    def test_networks(self):
+        (nodes, rest, size) = inventory._read_nodes(response([
+            "atrato01", "atrato02", "atrato101", "init701", "init702", "1und101", "bit01"]))
+        self.assertEqual(dict([(n, nodes[n].network) for n in nodes]), {
+            "atrato01": "atrato", "atrato02": "atrato", "atrato101": "atrato",
+            "init701": "init7", "init702": "init7", "1und101": "1und1", "bit01": "bit"})
+        self.assertEqual(sorted(inventory.NodeIndex(nodes).networks.keys()),
+            ["1und1", "atrato", "bit", "init7"])
+
+
+if __name__ == '__main__':
+    unittest.main()
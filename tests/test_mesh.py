@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+"""
+Tests for L{ringtools.mesh}, with the source nodes replaced by stand-ins
+running the commands locally.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest, subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools import mesh
+from ringtools.exception import RingException
+from ringtools.result import NodeResult
+
+
+class StandInNode:
+    """ A node running its commands with the local shell.
+    """
+
+    def __init__(self, host, pool):
+        self.host = host
+        self.pool = pool
+
+
+    def run_command(self, command, reader=None, timeout=None):
+        self.pool.commands.append(self.host)
+        p = subprocess.Popen(["/bin/sh", "-c", command], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (stdout, stderr) = p.communicate()
+        return NodeResult(self.host, NodeResult.SSH_OK, p.returncode,
+            [l.strip() for l in stdout.splitlines()], [l.strip() for l in stderr.splitlines()])
+
+
+class StandInPool:
+    """ A pool of stand-in nodes, nodes called I{down} can't be reached.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.discarded = []
+
+
+    def get_node(self, host):
+        if host == "down":
+            raise RingException("Failed to connect.")
+        return StandInNode(host, self)
+
+
+    def discard(self, host):
+        self.discarded.append(host)
+
+# ===========================================================================
+
+class MeshTest(unittest.TestCase):
+
+    def test_batches(self):
+        pool = StandInPool()
+        def analyse(result):
+            result.add_value('lines', len(result.get_stdout()))
+
+        matrix = mesh.run_mesh('echo %%HOST%%; echo %%TARGET%% >&2; test %%TARGET%% != c', ["a", "b", "c"],
+            values=["lines"], pool=pool, analyse=analyse, batch_size=2)
+        # one command per batch of two targets
+        self.assertEqual(len(pool.commands), 3)
+        self.assertEqual([matrix.get_status("a", t) for t in ["a", "b", "c"]], [mesh.PAIR_NOT_RUN, 0, 1])
+        self.assertEqual(matrix.get_status("c", "b"), 0)
+        # stderr is part of stdout
+        self.assertEqual(matrix.get_value("lines", "b", "a"), 2)
+
+
+    def test_analyse_fails(self):
+        results = []
+        def analyse(result):
+            results.append(result)
+            if result.get_value('target') == "b":
+                raise ValueError("no value")
+            result.add_value('lines', len(result.get_stdout()))
+
+        matrix = mesh.run_mesh('echo %%TARGET%%', ["a"], ["b", "c", "d"], values=["lines"],
+            pool=StandInPool(), analyse=analyse)
+        self.assertEqual([matrix.get_status("a", t) for t in ["b", "c", "d"]], [0, 0, 0])
+        self.assertEqual(matrix.get_row("lines", "a"), [("b", None), ("c", 1.0), ("d", 1.0)])
+        self.assertEqual([r.get_value('error') for r in results if r.get_value('target') == "b"],
+            ["analyse failed: ValueError: no value"])
+
+
+    def test_parser(self):
+        matrix = mesh.run_mesh('printf "rtt min/avg/max/mdev = 1.0/%%HOST%%.5/3.0/0.5 ms\\n"', ["1", "2"],
+            values=["avg"], pool=StandInPool(), parser="ping")
+        self.assertEqual(matrix.get_value("avg", "1", "2"), 1.5)
+        self.assertEqual(matrix.get_value("avg", "2", "1"), 2.5)
+
+
+    def test_unreachable(self):
+        pool = StandInPool()
+        matrix = mesh.run_mesh('true', ["a", "down"], pool=pool)
+        self.assertEqual(matrix.get_status("down", "a"), mesh.PAIR_SSH_ERROR)
+        self.assertEqual(matrix.get_status("a", "down"), 0)
+        self.assertEqual(pool.discarded, ["down"])
+
+
+    def test_split(self):
+        result = NodeResult("a", NodeResult.SSH_TIMEOUT, None,
+            ["1 partial", "0 done", "0 %s 0" % mesh.MESH_MARKER, "x", "7 other"], [])
+        result.set_ssh_errormsg("Command timeout.")
+        (done, partial) = mesh._split_result(result, 2)
+        self.assertEqual((done.get_ssh_result(), done.get_exitcode(), done.get_stdout()),
+            (NodeResult.SSH_OK, 0, ["done"]))
+        self.assertEqual((partial.get_ssh_result(), partial.get_exitcode(), partial.get_stdout()),
+            (NodeResult.SSH_TIMEOUT, None, ["partial"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+"""
+Tests for L{ringtools.node.NodeCommandThread}, with the nodes replaced by
+stand-ins which don't connect anywhere.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest, tempfile, shutil, Queue, socket, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools import node, parsers
+from ringtools.result import NodeResult, NodeResultSet
+
+
+class StandInNode:
+    """ A node answering every command with its own name.
+    """
+
+    def __init__(self, host, ssh_agent=None, timeout=None):
+        self.host = host
+
+
+    def run_command(self, command, reader=None, timeout=None):
+        if self.host == "broken01":
+            raise ValueError("no such node")
+        return NodeResult(self.host, NodeResult.SSH_OK, 0, [self.host], [])
+
+
+    def close(self):
+        pass
+
+class StandInChannel:
+    """ A channel of a command which writes some lines and then hangs.
+    """
+
+    def __init__(self, lines):
+        self.data = ["%s\r\n" % line for line in lines]
+        self.pty = False
+        self.closed = False
+
+
+    def get_pty(self):
+        self.pty = True
+
+
+    def exec_command(self, command):
+        self.command = command
+
+
+    def makefile(self, mode):
+        return None
+
+
+    def makefile_stderr(self, mode):
+        return None
+
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+
+    def recv_stderr_ready(self):
+        return False
+
+
+    def recv(self, size):
+        if self.data:
+            return self.data.pop(0)
+        time.sleep(self.timeout)
+        raise socket.timeout()
+
+
+    def close(self):
+        self.closed = True
+
+
+class StandInClient:
+    """ An SSH client with an authenticated connection opening a single
+        channel.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.is_authenticated = True
+
+
+    def get_transport(self):
+        return self
+
+
+    def is_active(self):
+        return True
+
+
+    def open_session(self):
+        return self.channel
+
+# ===========================================================================
+
+class RingNodeTest(unittest.TestCase):
+
+    def test_timeout(self):
+        # a command which is aborted runs on a terminal, so it is hung up on
+        channel = StandInChannel(["PING example.net (192.0.2.1) 56(84) bytes of data.",
+            "64 bytes from 192.0.2.1: icmp_seq=1 ttl=57 time=10.0 ms"])
+        n = node.RingNode("test01", ssh_client=StandInClient(channel), ssh_agent=object())
+        n.state = node.RingNode.STATE_AUTHENTICATED
+        interval = node.POLL_INTERVAL
+        node.POLL_INTERVAL = 0.01
+        try:
+            result = n.run_command("ping example.net", reader=parsers.get_reader("ping"), timeout=0.2)
+        finally:
+            node.POLL_INTERVAL = interval
+        self.assertTrue(channel.pty)
+        self.assertTrue(channel.closed)
+        self.assertEqual(result.get_ssh_result(), NodeResult.SSH_TIMEOUT)
+        self.assertEqual(result.get_stdout()[1], "64 bytes from 192.0.2.1: icmp_seq=1 ttl=57 time=10.0 ms")
+        self.assertEqual(result.get_value("received"), 1)
+
+
+class NodeCommandThreadTest(unittest.TestCase):
+
+    def setUp(self):
+        # the threads read the SSH configuration of the user
+        self.home = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.home, ".ssh"))
+        open(os.path.join(self.home, ".ssh", "config"), "w").close()
+        self.environ = os.environ.get("HOME")
+        os.environ["HOME"] = self.home
+        self.node = node.RingNode
+        node.RingNode = StandInNode
+
+
+    def tearDown(self):
+        node.RingNode = self.node
+        os.environ["HOME"] = self.environ
+        shutil.rmtree(self.home)
+
+
+    def run_hosts(self, hosts, threads=2, **kwargs):
+        queue = Queue.Queue()
+        for host in hosts:
+            queue.put(host)
+        workers = []
+        for i in range(threads):
+            queue.put(None)
+            t = node.NodeCommandThread(queue, "uptime", None, **kwargs)
+            t.start()
+            workers.append(t)
+        results = NodeResultSet()
+        for t in workers:
+            t.join()
+            results.append(t.get_result().get_results())
+        return dict([(r.get_hostname(), r) for r in results.get_results()])
+
+
+    def test_analyse_fails(self):
+        def analyse(result):
+            if result.get_hostname() in ["h1", "h3"]:
+                raise KeyError("avg")
+            result.add_value("ok", True)
+
+        results = self.run_hosts(["h%d" % i for i in range(6)], analyse=analyse)
+        self.assertEqual(sorted(results.keys()), ["h%d" % i for i in range(6)])
+        self.assertEqual(results["h1"].get_value("error"), "analyse failed: KeyError: 'avg'")
+        self.assertEqual(results["h2"].get_value("ok"), True)
+        self.assertEqual(results["h2"].get_value("error"), None)
+
+
+    def test_command_fails(self):
+        results = self.run_hosts(["h0", "broken01", "h1"])
+        self.assertEqual(sorted(results.keys()), ["broken01", "h0", "h1"])
+        self.assertEqual(results["broken01"].get_ssh_result(), NodeResult.SSH_ERROR)
+        self.assertEqual(results["broken01"].get_ssh_errormsg(), "ValueError: no such node")
+        self.assertEqual(results["h1"].get_stdout(), ["h1"])
+
+
+    def test_consumer_fails(self):
+        class Consumer:
+            def __init__(self):
+                self.results = []
+            def add_result(self, result):
+                if result.get_hostname() == "h0":
+                    raise UnicodeDecodeError("utf8", "\xe9", 0, 1, "invalid")
+                self.results.append(result.get_hostname())
+
+        consumer = Consumer()
+        results = self.run_hosts(["h0", "h1", "h2"], threads=1, consumers=[consumer])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(consumer.results, ["h1", "h2"])
+        self.assertTrue(results["h0"].get_value("error").startswith("Consumer failed: UnicodeDecodeError"))
+
+
+if __name__ == '__main__':
+    unittest.main()
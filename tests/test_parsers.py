@@ -0,0 +1,199 @@
+#! /usr/bin/env python
+"""
+Tests for the parsers in L{ringtools.parsers}, using output captured on
+ring nodes (see the data directory).
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools import parsers
+from ringtools.exception import RingException
+from ringtools.result import NodeResult
+
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def captured(name, exitcode=0):
+    """ A result with the captured output in the data directory as stdout.
+    """
+    lines = open(os.path.join(DATA, name)).read().splitlines()
+    return NodeResult('test01', NodeResult.SSH_OK, exitcode, lines, [])
+
+
+def parse(parser, name, exitcode=0):
+    result = captured(name, exitcode)
+    parsers.get_parser(parser)(result)
+    return result
+
+
+def read(reader, name):
+    result = NodeResult('test01', NodeResult.SSH_TIMEOUT)
+    for line in open(os.path.join(DATA, name)).read().splitlines():
+        parsers.get_reader(reader)(result, line)
+    return result
+
+# ===========================================================================
+
+class RegistryTest(unittest.TestCase):
+
+    def test_names(self):
+        for name in ['ping', 'ping6', 'traceroute', 'traceroute6', 'mtr', 'dig', 'curl-writeout']:
+            self.assertTrue(name in parsers.get_parser_names())
+
+    def test_unknown(self):
+        self.assertRaises(RingException, parsers.get_parser, 'nosuchparser')
+        self.assertRaises(RingException, parsers.get_reader, 'nosuchreader')
+
+
+class PingTest(unittest.TestCase):
+
+    def test_ping(self):
+        r = parse('ping', 'ping.txt')
+        self.assertEqual((r.get_value('sent'), r.get_value('received'), r.get_value('loss')), (5, 5, 0.0))
+        self.assertEqual((r.get_value('min'), r.get_value('avg'), r.get_value('max'), r.get_value('mdev')),
+            (8.201, 8.356, 8.473, 0.097))
+
+    def test_quiet(self):
+        r = parse('ping', 'ping-quiet.txt')
+        self.assertEqual(r.get_value('sent'), 3)
+        self.assertEqual(r.get_value('avg'), 22.377)
+
+    def test_timeout(self):
+        r = parse('ping', 'ping-timeout.txt', exitcode=1)
+        self.assertEqual((r.get_value('sent'), r.get_value('received'), r.get_value('loss')), (5, 0, 100.0))
+        self.assertEqual(r.get_value('avg'), None)
+
+    def test_failed(self):
+        # round trip times are only added for successful pings
+        r = parse('ping', 'ping-partial.txt', exitcode=1)
+        self.assertEqual((r.get_value('sent'), r.get_value('received'), r.get_value('loss')), (5, 3, 40.0))
+        self.assertEqual(r.get_value('avg'), None)
+
+    def test_duplicates(self):
+        r = parse('ping', 'ping-dup.txt')
+        self.assertEqual((r.get_value('sent'), r.get_value('received'), r.get_value('loss')), (3, 3, 0.0))
+        self.assertEqual(r.get_value('avg'), 0.589)
+
+    def test_bsd(self):
+        r = parse('ping6', 'ping6-bsd.txt')
+        self.assertEqual((r.get_value('sent'), r.get_value('received'), r.get_value('loss')), (2, 2, 0.0))
+        self.assertEqual(r.get_value('avg'), 9.226)
+
+
+class PingReaderTest(unittest.TestCase):
+
+    def test_reader(self):
+        r = read('ping', 'ping.txt')
+        self.assertEqual((r.get_value('sent'), r.get_value('received'), r.get_value('loss')), (5, 5, 0.0))
+        self.assertAlmostEqual(r.get_value('avg'), 8.356)
+        self.assertEqual(r.get_value('last'), 8.38)
+
+    def test_aborted(self):
+        # replies seen before the command was aborted, sequence 3 was lost
+        r = read('ping', 'ping-aborted.txt')
+        self.assertEqual((r.get_value('sent'), r.get_value('received'), r.get_value('loss')), (4, 3, 25.0))
+        self.assertAlmostEqual(r.get_value('avg'), 130.0)
+        self.assertTrue(r.get_value('jitter') > 0)
+
+    def test_duplicates(self):
+        r = read('ping', 'ping-dup.txt')
+        self.assertEqual((r.get_value('sent'), r.get_value('received'), r.get_value('loss')), (3, 3, 0.0))
+        self.assertAlmostEqual(r.get_value('avg'), (0.512 + 0.498 + 0.505) / 3)
+
+    def test_bsd(self):
+        # BSD and macOS number the probes from 0
+        r = read('ping6', 'ping6-bsd.txt')
+        self.assertEqual((r.get_value('sent'), r.get_value('received'), r.get_value('loss')), (2, 2, 0.0))
+        self.assertAlmostEqual(r.get_value('avg'), 9.226)
+
+    def test_bsd_aborted(self):
+        # the first probe was lost, the header tells probes start at 0
+        r = read('ping', 'ping-bsd-aborted.txt')
+        self.assertEqual((r.get_value('sent'), r.get_value('received')), (3, 2))
+        self.assertAlmostEqual(r.get_value('loss'), 100.0 / 3)
+
+    def test_no_replies(self):
+        r = read('ping', 'ping-timeout.txt')
+        self.assertEqual(r.get_value('loss'), None)
+
+
+class TracerouteTest(unittest.TestCase):
+
+    def test_traceroute(self):
+        hops = parse('traceroute', 'traceroute.txt').get_value('hops')
+        self.assertEqual([(h['hop'], h['address']) for h in hops], [
+            (1, '192.0.2.1'), (2, None), (3, '198.51.100.1'), (3, '198.51.100.5'),
+            (4, '80.249.208.21'), (5, '203.0.113.9')])
+        self.assertEqual(hops[0]['name'], 'gw.example.net')
+        self.assertEqual(hops[0]['rtts'], [0.412, 0.398, 0.391])
+        self.assertEqual(hops[1]['rtts'], [])
+        self.assertEqual(hops[3]['rtts'], [1.305, 1.298])
+        self.assertEqual(hops[4]['rtts'], [2.011])
+        self.assertEqual(hops[5]['rtts'], [5.201, 5.188])
+
+    def test_numeric(self):
+        hops = parse('traceroute6', 'traceroute6-n.txt').get_value('hops')
+        self.assertEqual([(h['hop'], h['address']) for h in hops], [
+            (1, '2001:db8::1'), (2, None), (3, '2001:7f8:1::a500:3265:1'),
+            (3, '2001:7f8:1::a500:3265:2'), (4, '2001:888:2001::130')])
+        self.assertEqual(hops[2]['rtts'], [2.120, 2.097])
+        self.assertEqual(hops[2]['name'], None)
+
+
+class MtrTest(unittest.TestCase):
+
+    def test_mtr(self):
+        hops = parse('mtr', 'mtr.txt').get_value('hops')
+        self.assertEqual([(h['hop'], h['address'], h['loss']) for h in hops], [
+            (1, '192.0.2.1', 0.0), (2, None, 100.0), (3, '198.51.100.1', 10.0), (4, '82.94.230.130', 0.0)])
+        self.assertEqual((hops[2]['sent'], hops[2]['avg'], hops[2]['worst']), (10, 1.3, 1.9))
+
+
+class DigTest(unittest.TestCase):
+
+    def test_dig(self):
+        r = parse('dig', 'dig.txt', exitcode=9)
+        queries = r.get_value('queries')
+        # the query which timed out has no reply at all
+        self.assertEqual([(q['name'], q['type'], q['status']) for q in queries], [
+            ('ring.nlnog.net.', 'A', 'NOERROR'), ('NoSuch.Example.', 'A', 'NXDOMAIN')])
+        self.assertEqual(queries[0]['answers'], [
+            ('ring.nlnog.net.', 300, 'CNAME', 'web.ring.nlnog.net.'),
+            ('web.ring.nlnog.net.', 300, 'A', '82.94.230.130')])
+        self.assertEqual(queries[1]['answers'], [])
+        self.assertEqual([q['query_time'] for q in queries], [12, 31])
+        self.assertEqual(queries[0]['server'], '127.0.0.53#53(127.0.0.53)')
+        self.assertEqual((r.get_value('status'), r.get_value('query_time')), ('NOERROR', 12))
+
+
+class CurlTest(unittest.TestCase):
+
+    def test_writeout(self):
+        result = NodeResult('test01', NodeResult.SSH_OK, 0,
+            ['<html>', '%s 0.004 0.015 0.048 0.102 0.110' % parsers.CURL_WRITEOUT_MARKER], [])
+        result.add_value('runtime', 0.5)
+        parsers.get_parser('curl-writeout')(result)
+        self.assertEqual(result.get_stdout(), ['<html>'])
+        self.assertAlmostEqual(result.get_value('connect'), 0.011)
+        self.assertAlmostEqual(result.get_value('tls'), 0.033)
+        self.assertAlmostEqual(result.get_value('ssh_overhead'), 0.39)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+"""
+Tests for grouping and counting results in L{ringtools.result}.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools.result import NodeResult, NodeResultSet
+
+
+def result(hostname, **values):
+    r = NodeResult(hostname, NodeResult.SSH_OK, 0)
+    for (name, value) in values.items():
+        r.add_value(name, value)
+    return r
+
+# ===========================================================================
+
+class GroupedTest(unittest.TestCase):
+
+    def setUp(self):
+        # a01 was run twice, its last result counts
+        self.results = NodeResultSet([
+            result("a01", code=200, server="nginx"),
+            result("b01", code=404, server="nginx"),
+            result("c01", code=200, server="apache"),
+            result("a01", code=404, server="nginx"),
+        ])
+
+    def test_grouped(self):
+        self.assertEqual(self.results.get_value_grouped("code"), [(404, ["b01", "a01"]), (200, ["c01"])])
+        self.assertEqual(self.results.get_value_grouped(["code", "server"], True),
+            [((200, "apache"), ["c01"]), ((404, "nginx"), ["b01", "a01"])])
+        # the same hosts and values as get_value
+        values = self.results.get_value("code")
+        for (value, hosts) in self.results.get_value_grouped("code"):
+            self.assertEqual(sorted(hosts), sorted([h for h in values if values[h] == value]))
+
+    def test_histogram(self):
+        self.assertEqual(self.results.get_value_histogram("code"), [(200, 1), (404, 2)])
+        self.assertEqual(self.results.get_value_histogram("server", True), [("apache", 1), ("nginx", 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+"""
+Tests for the order in which L{ringtools.scheduler} hands out hosts.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import os, sys, unittest, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ringtools import scheduler
+from ringtools.exception import RingException
+from ringtools.result import NodeResult, NodeResultSet
+
+
+def group(host):
+    return host[0]
+
+# ===========================================================================
+
+class PlanTest(unittest.TestCase):
+
+    def test_spread_evenly(self):
+        hosts = ["a1", "a2", "a3", "a4", "b1", "b2"]
+        self.assertEqual(scheduler.spread_evenly(hosts, group), ["a1", "b1", "a2", "a3", "b2", "a4"])
+
+    def test_priority(self):
+        hosts = ["a1", "b1", "c1", "d1"]
+        self.assertEqual(scheduler.plan(hosts, {"c1": -1, "a1": 1}), ["c1", "b1", "d1", "a1"])
+        self.assertEqual(scheduler.plan(hosts), hosts)
+
+    def test_priority_and_spread(self):
+        hosts = ["a1", "a2", "b1", "b2", "c1"]
+        self.assertEqual(scheduler.plan(hosts, {"c1": 1}, group), ["a1", "b1", "a2", "b2", "c1"])
+
+    def test_runtime_priority(self):
+        results = NodeResultSet()
+        for (host, runtime) in [("fast", 0.1), ("slow", 10.0), ("medium", 1.0)]:
+            r = NodeResult(host, NodeResult.SSH_OK, 0)
+            r.add_value("runtime", runtime)
+            results.append(r)
+        hosts = ["fast", "medium", "slow", "unknown"]
+        self.assertEqual(scheduler.plan(hosts, scheduler.runtime_priority(results)),
+            ["slow", "unknown", "medium", "fast"])
+        self.assertEqual(scheduler.plan(hosts, scheduler.runtime_priority(results, slowest_first=False)),
+            ["fast", "medium", "slow", "unknown"])
+
+    def test_unknown_spread(self):
+        self.assertRaises(RingException, scheduler.plan, ["a1"], None, "nosuchspread")
+
+
+class WorkSchedulerTest(unittest.TestCase):
+
+    def test_order(self):
+        queue = scheduler.WorkScheduler(["a1", "a2", "b1"], spread=group)
+        self.assertEqual(len(queue), 3)
+        self.assertEqual([queue.get() for i in range(4)], ["a1", "b1", "a2", None])
+        queue.task_done()
+        self.assertEqual(len(queue), 0)
+
+    def test_workers(self):
+        # every host is handed out once over all workers
+        hosts = ["h%d" % i for i in range(1000)]
+        queue = scheduler.WorkScheduler(hosts)
+        done = []
+        def work():
+            while True:
+                host = queue.get()
+                if host == None:
+                    break
+                done.append(host)
+        workers = [threading.Thread(target=work) for i in range(8)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        self.assertEqual(sorted(done), sorted(hosts))
+
+
+if __name__ == '__main__':
+    unittest.main()
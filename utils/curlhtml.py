@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+"""
+Lightweight scanning of the head of HTML documents fetched by ring-curl.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import re
+from HTMLParser import HTMLParser
+
+# tags we look for while scanning the head of a document
+TAGS = re.compile(r"<(/?)(title|head|body)\b[^>]*>", re.IGNORECASE)
+
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+META_CHARSET = re.compile(r"<meta\b[^>]*\bcharset\s*=\s*[\"']?([\w.:-]+)", re.IGNORECASE)
+
+# the charset in a Content-Type header
+CHARSET = re.compile(r"\bcharset\s*=\s*[\"']?([\w.:-]+)", re.IGNORECASE)
+
+# no title after this many characters of document: give up
+MAX_SCAN = 65536
+
+_unescape = HTMLParser().unescape
+
+
+class TitleScanner:
+    """ Find the title of an HTML document by scanning it line by line.
+
+        Scanning stops as soon as the title is complete, or when the end
+        of the head (or the start of the body) is reached without finding
+        one, so the rest of the document is never looked at. Truncated
+        documents are fine: an unterminated title is used up to the end.
+
+        The title is decoded using the charset given, or else the charset
+        of a meta tag before the title, or else as UTF-8; bytes which can't
+        be decoded are replaced. Titles are returned UTF-8 encoded.
+    """
+
+    def __init__(self, charset=None):
+        """ Create a new scanner.
+
+            @param charset: the charset of the document, for instance from
+            the Content-Type header
+            @type charset: string
+        """
+        self.charset = charset
+        self.title = None
+        self.done = False
+        self.scanned = 0
+        self.parts = None
+
+
+    def feed(self, line):
+        """ Scan the next line of the document.
+
+            @param line: a line of the document
+            @type line: string
+
+            @return: I{True} if scanning is done and no more lines are needed
+            @rtype: boolean
+        """
+        if self.done:
+            return True
+        self.scanned += len(line)
+
+        pos = 0
+        while True:
+            m = TAGS.search(line, pos)
+            if self.parts != None:
+                # inside the title: collect text up to the closing tag
+                if m == None:
+                    self.parts.append(line[pos:])
+                    break
+                self.parts.append(line[pos:m.start()])
+                if m.group(1) and m.group(2).lower() == 'title':
+                    self.title = self._text(self.parts)
+                    self.parts = None
+                    self.done = True
+                    return True
+            elif m == None:
+                self._find_charset(line[pos:])
+                break
+            elif m.group(2).lower() == 'title' and not m.group(1):
+                self._find_charset(line[pos:m.start()])
+                self.parts = []
+            elif (m.group(1) and m.group(2).lower() == 'head') or m.group(2).lower() == 'body':
+                self.done = True
+                return True
+            pos = m.end()
+
+        if self.parts == None and self.scanned > MAX_SCAN:
+            self.done = True
+        return self.done
+
+
+    def get_title(self):
+        """ Get the title found so far.
+
+            @return: the title, or None if none was found
+            @rtype: string
+        """
+        if self.title == None and self.parts != None:
+            # document ended inside the title
+            return self._text(self.parts)
+        return self.title
+
+
+    def _find_charset(self, text):
+        """ Take the charset from a meta tag, unless one is known already.
+        """
+        if self.charset == None:
+            m = META_CHARSET.search(text)
+            if m:
+                self.charset = m.group(1)
+
+
+    def _text(self, parts):
+        """ Decode the parts of the title, replace entities and collapse
+            whitespace.
+        """
+        text = "\n".join(parts)
+        try:
+            text = text.decode(self.charset or 'utf-8', 'replace')
+        except LookupError:
+            # unknown charset
+            text = text.decode('utf-8', 'replace')
+        return " ".join(_unescape(text).split()).encode('utf-8')
+
+
+def get_charset(content_type):
+    """ Get the charset from a Content-Type header.
+
+        @param content_type: the value of the header
+        @type content_type: string
+
+        @return: the charset, or None if not given
+        @rtype: string
+    """
+    m = CHARSET.search(content_type or "")
+    return m.group(1) if m else None
+
+
+def extract_title(lines, charset=None):
+    """ Find the title of an HTML document.
+
+        @param lines: the lines of the document
+        @type lines: list of strings
+
+        @param charset: the charset of the document, see L{TitleScanner}
+        @type charset: string
+
+        @return: the title (UTF-8 encoded), or None if none was found
+        @rtype: string
+    """
+    scanner = TitleScanner(charset)
+    for line in lines:
+        if scanner.feed(line):
+            break
+    return scanner.get_title()
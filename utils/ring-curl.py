@@ -16,58 +16,70 @@ ring-curl performs a series of curl requests from various ring nodes and shows t
 # ======
 # Teun Vink - teun@teun.tv
 
-import sys, argparse
-from BeautifulSoup import BeautifulSoup
+import sys
+from itertools import islice
 from curlerr import CURL_ERRORS
+from curlhtml import extract_title, get_charset
 
 try:
-    from ringtools import ring, result
+    from ringtools import cli, ring, result, parsers
 except ImportError:
     # ringtools probaly isn't installed yet
     sys.path.append('..')
-    from ringtools import ring, result
+    from ringtools import cli, ring, result, parsers
 
 
 VERSION = "0.1"
 AGENT = "ring-curl.py - http://ring.nlnog.net"
 
 
+# timings shown in the breakdown
+TIMINGS = ['dns', 'connect', 'tls', 'ttfb', 'total', 'ssh_overhead']
+
+
 def analyzer(result):
     # callback to analyse the results: if the command exited ok
-    # we select the average pingtime from the result and add it to the dataset
+    # we select the HTTP headers and title from the result and add it to the dataset.
+    # The timings were already taken from the output by the curl-writeout parser.
     if result.get_exitcode() == 0 and len(result.get_stdout()) > 0:
         stdout = result.get_stdout()
         result.add_value('HTTP-code', stdout[0])
 
         i = 1 # first line was the HTTP-code
-        while stdout[i].strip() != "":
+        while i < len(stdout) and stdout[i].strip() != "":
             if ":" in stdout[i]:
                 x = stdout[i].split(': ', 2)
                 result.add_value(x[0].strip(), x[1].strip())
             i += 1
-        try:
-            soup = BeautifulSoup("\n".join(stdout[i:]))
-            result.add_value('title', soup.title.string if soup.title else '<<none>>')
-        except:
-            pass
-
-
-def split_args(args):
-    result = []
-    if args == None:
-        return []
 
-    for arg in args:
-        x = arg.split(',')
-        [ result.append(r.strip()) for r in x ]
-    return result
+        if any(islice(stdout, i, None)):
+            # only the head of the document is scanned for the title, this
+            # works for truncated (capped) documents as well
+            title = extract_title(islice(stdout, i, None), get_charset(result.get_value('Content-Type') or result.get_value('content-type')))
+            result.add_value('title', title if title != None else '<<none>>')
+
+
+def build_command(ns):
+    # the curl command to run on the nodes
+    if ns.headers_only:
+        # dump the headers to stdout, drop the body on the node
+        return 'curl --connect-timeout 15 -L -s -D - -o /dev/null -A "%s" -w \'%s\' %s' % (
+            AGENT, parsers.CURL_WRITEOUT, ns.destination)
+    elif ns.max_bytes:
+        # only send the first bytes of the response back, keeping the exitcode 
+        # of curl. When head has read enough curl fails writing to the pipe 
+        # (exitcode 23 or SIGPIPE), which is fine. The timings go to stderr.
+        curl = 'curl --connect-timeout 15 -L -i -s -A "%s" -w \'%%{stderr}%s\' %s' % (
+            AGENT, parsers.CURL_WRITEOUT, ns.destination)
+        return ('{ rc=$( { { %s; echo $? >&3; } | head -c %d >&4; } 3>&1 ); '
+                'case $rc in 23|141) rc=0;; esac; exit $rc; } 4>&1' % (curl, ns.max_bytes))
+    else:
+        return 'curl --connect-timeout 15 -L -i -A "%s" -w \'%s\' -s %s' % (
+            AGENT, parsers.CURL_WRITEOUT, ns.destination)
 
 
 def main():
-    parser = argparse.ArgumentParser(
-        description="Run curl requests on the NLNOG ring.",
-        epilog="Visit https://ring.nlnog.net for more information",
-        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser = cli.create_parser("Run curl requests on the NLNOG ring.")
 
     parser.add_argument(
         "-6", "--ipv6", help="enforce IPv6",
@@ -75,109 +87,81 @@ def main():
         const=True, default=False)
 
     parser.add_argument(
-        "-c", "--count",
-        help="the number of nodes to do requests from",
-        action="store", dest="count",
-        default=10, type=int)
-    
-    parser.add_argument(
-        "-e", "--errors",
-        help="detailed error reporting",
-        action="store_const", dest="errors",
-        default=False, const=True)
-
-    parser.add_argument(
-        "-n", "--include-node", help="include specific node",
-        action="append", dest="in_nodes",
-        default=None, metavar="node")
+        "-b", "--max-bytes",
+        help="only transfer the first bytes of the response from the nodes",
+        action="store", dest="max_bytes",
+        default=0, type=int, metavar="bytes")
 
     parser.add_argument(
-        "-N", "--exclude-node", help="exclude specific node",
-        action="append", dest="ex_nodes",
-        default=None, metavar="node")
-
-    parser.add_argument(
-        "-o", "--include-country", help="include specific country",
-        action="append", dest="in_countries",
-        default=None, metavar="country")
-
-    parser.add_argument(
-        "-oo", "--only-country", help="only specific country",
-        action="append", dest="only_countries",
-        default=None, metavar="country")
-
-    parser.add_argument(
-        "-O", "--exclude-country", help="exclude specific country",
-        action="append", dest="ex_countries",
-        default=None, metavar="country")
-
-    parser.add_argument(
-        "-q", "--quiet", help="quiet mode, print only results",
-        action="store_const", dest="quiet",
+        "-g", "--group",
+        help="group results by HTTP code and server",
+        action="store_const", dest="group",
         default=False, const=True)
 
     parser.add_argument(
-        "-t", "--threads",
-        help="the number of concurrent ping threads",
-        action="store", dest="threads",
-        default=25, type=int)
-    
-    parser.add_argument(
-        "-w", "--include-network", help="include specific network",
-        action="append", dest="in_networks",
-        default=None, metavar="network")
-
-    parser.add_argument(
-        "-ww", "--only-network", help="only specific network",
-        action="append", dest="only_networks",
-        default=None, metavar="network")
+        "-H", "--headers-only",
+        help="only fetch the headers, the body is dropped on the nodes",
+        action="store_const", dest="headers_only",
+        default=False, const=True)
 
-    parser.add_argument(
-        "-W", "--exclude-network", help="exclude specific network",
-        action="append", dest="ex_networks",
-        default=None, metavar="network")
+    cli.add_node_arguments(parser, "do requests from")
+    cli.add_report_arguments(parser)
+    cli.add_thread_arguments(parser, "curl")
+    cli.add_output_arguments(parser)
 
     parser.add_argument("destination", help="target URL")
 
     ns = parser.parse_args()
 
-    in_nodes = split_args(ns.in_nodes)
-    ex_nodes = split_args(ns.ex_nodes)
-    in_countries = split_args(ns.in_countries)
-    ex_countries = split_args(ns.ex_countries)
-    only_countries = split_args(ns.only_countries)
-    in_networks = split_args(ns.in_networks)
-    ex_networks = split_args(ns.ex_networks)
-    only_networks = split_args(ns.only_networks)
-
-    nodes = ring.pick_nodes(count=ns.count,
-        inc_hosts=in_nodes, ex_hosts=ex_nodes,
-        inc_countries=in_countries, ex_countries=ex_countries,
-        only_countries=only_countries, inc_networks=in_networks,
-        ex_networks=ex_networks, only_networks=only_networks, 
-        active_only=True)
+
+    nodes = cli.pick_nodes(ns)
 
     if not ns.quiet:
         print "ring-curl v%s written by Teun Vink <teun@teun.tv>\n" % VERSION
         print "opening URL '%s' from %d nodes:" % (ns.destination, len(nodes))
 
-    cmd = 'curl --connect-timeout 15 -L -i -A "%s" -s %s' % (AGENT, ns.destination)
-    cmd_result = ring.run_command(cmd, nodes, analyse=analyzer)
+    cmd = build_command(ns)
+    consumers = []
+    values = ['HTTP-code', 'Server', 'title', 'runtime'] + TIMINGS
+    exporter = cli.open_output(ns, values=values)
+    if exporter:
+        consumers.append(exporter)
+    paster = cli.open_pastebin(ns, "ring-curl %s" % ns.destination, values=values)
+    if paster:
+        consumers.append(paster)
+
+    cmd_result = ring.run_command(cmd, nodes, max_threads=ns.threads, parser='curl-writeout', analyse=analyzer, consumers=consumers)
+
+    if exporter:
+        exporter.close()
 
     s_res = cmd_result.get_successful_results()
-    s_res_t = s_res.get_value_sorted('runtime')
+    s_res_t = s_res.get_value_sorted('total')
     s_res_h = s_res.get_value('HTTP-code')
     fail = cmd_result.get_failed_results(include_ssh_problems=False)
     conn = cmd_result.get_failed_results(only_ssh_problems=True)
 
     cbn = ring.get_countries_by_node()
 
+    if ns.group:
+        print "results grouped by HTTP code and server:"
+        for ((code, server), hosts) in s_res.get_value_grouped(['HTTP-code', 'Server'], True):
+            print "%3d: %s (%s)\n     %s" % (len(hosts), code, server or "unknown", ", ".join(hosts))
+        print
+
     if not ns.quiet:
         for (host, val) in s_res_t:
             hostname = "%s (%s):" % (host, cbn[host].upper())
-            v = "%.2fs" % val
+            v = "%.2fs" % val if val != None else "-"
             print "%-28s %8s  %s" % (hostname, v, s_res_h[host])
 
+        if s_res.count_results() > 0:
+            print "\ntiming breakdown (ms):  %8s %8s %8s" % ("p50", "p90", "p99")
+            for name in TIMINGS:
+                p = [v for (pct, v) in s_res.get_value_percentiles(name, [50, 90, 99])]
+                if p[0] != None:
+                    print "%-22s  %8.1f %8.1f %8.1f" % (name, p[0] * 1000, p[1] * 1000, p[2] * 1000)
+
         if len(conn.get_results()) > 0 and ns.errors:
             print "\nconnection failures:"
             for r in conn.get_results():
@@ -197,5 +181,9 @@ def main():
         len(fail.get_results()),
         len(conn.get_results()))
 
+    if paster:
+        print
+        cli.close_pastebin(paster)
+
 if __name__ == "__main__":
     main()
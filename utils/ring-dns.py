@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+"""
+ring-dns performs DNS queries from various ring nodes and groups the nodes by the answers they get.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import sys
+
+try:
+    from ringtools import cli, ring, result
+except ImportError:
+    # ringtools probaly isn't installed yet
+    sys.path.append('..')
+    from ringtools import cli, ring, result
+
+
+VERSION = "0.1"
+
+
+def parse_queries(args, default_type):
+    # queries are given as name or name/type
+    queries = []
+    for arg in args:
+        if "/" in arg:
+            (name, rrtype) = arg.rsplit("/", 1)
+        else:
+            (name, rrtype) = (arg, default_type)
+        queries.append((name, rrtype.upper()))
+    return queries
+
+
+def build_command(ns, queries):
+    # all queries are done by a single dig command, the options before
+    # the first name apply to all queries
+    cmd = "dig +tries=1 +time=%d" % ns.dns_timeout
+    if ns.ipv6:
+        cmd += " -6"
+    if ns.resolver:
+        cmd += " @%s" % ns.resolver
+    for (name, rrtype) in queries:
+        cmd += " %s %s" % (name, rrtype)
+    return cmd
+
+
+def answer_set(query):
+    # the answers to a query, without TTLs and in a fixed order so
+    # identical answers from different nodes compare equal
+    answers = sorted(["%s %s" % (rrtype, data) for (name, ttl, rrtype, data) in query["answers"]])
+    if query["status"] != "NOERROR":
+        return query["status"]
+    elif not answers:
+        return "NOERROR (no answers)"
+    return ", ".join(answers)
+
+
+def fqdn(name):
+    # dig prints the names in the question section as FQDN
+    return name.lower().rstrip(".") + "."
+
+
+def make_analyzer(queries):
+    # callback to analyse the results: the output was parsed by the dig parser,
+    # for every query we add the answer set and the query time to the dataset
+    # using 'name/type' as name of the value
+    def analyzer(result):
+        # queries which timed out print nothing, so the replies are matched
+        # to the queries by name and type instead of by position
+        parsed = list(result.get_value("queries") or [])
+        for (name, rrtype) in queries:
+            label = "%s/%s" % (name, rrtype)
+            for (i, query) in enumerate(parsed):
+                if fqdn(query["name"] or "") == fqdn(name) and (query["type"] or "").upper() == rrtype:
+                    del parsed[i]
+                    result.add_value(label, answer_set(query))
+                    result.add_value(label + " time", query["query_time"])
+                    break
+            else:
+                result.add_value(label, "<<no reply>>")
+    return analyzer
+
+
+def main():
+    parser = cli.create_parser("Run DNS queries on the NLNOG ring.")
+
+    parser.add_argument(
+        "-6", "--ipv6", help="query the resolver over IPv6",
+        action="store_const", dest="ipv6",
+        const=True, default=False)
+
+    parser.add_argument(
+        "-r", "--resolver",
+        help="the resolver to query instead of the default resolver of the nodes",
+        action="store", dest="resolver",
+        default=None, metavar="server")
+
+    parser.add_argument(
+        "-T", "--type",
+        help="the record type for names given without one (default: A)",
+        action="store", dest="type",
+        default="A", metavar="type")
+
+    parser.add_argument(
+        "--dns-timeout",
+        help="the number of seconds to wait for a reply to each query",
+        action="store", dest="dns_timeout",
+        default=5, type=int, metavar="seconds")
+
+    cli.add_node_arguments(parser, "query from")
+    cli.add_report_arguments(parser, quiet="quiet mode, print only the groups")
+    cli.add_thread_arguments(parser, "query")
+    cli.add_output_arguments(parser)
+
+    parser.add_argument("queries", nargs="+", metavar="name[/type]",
+        help="the names to query, optionally with the record type")
+
+    ns = parser.parse_args()
+
+
+    queries = parse_queries(ns.queries, ns.type)
+    labels = ["%s/%s" % q for q in queries]
+
+    nodes = cli.pick_nodes(ns)
+
+    if not ns.quiet:
+        print "ring-dns v%s written by Teun Vink <teun@teun.tv>\n" % VERSION
+        print "querying %s from %d nodes:\n" % (", ".join(labels), len(nodes))
+
+    consumers = []
+    values = labels + [l + " time" for l in labels] + ["runtime"]
+    exporter = cli.open_output(ns, values=values)
+    if exporter:
+        consumers.append(exporter)
+    paster = cli.open_pastebin(ns, "ring-dns %s" % " ".join(labels), values=values)
+    if paster:
+        consumers.append(paster)
+
+    cmd_result = ring.run_command(build_command(ns, queries), nodes, max_threads=ns.threads,
+        parser="dig", analyse=make_analyzer(queries), consumers=consumers, keep_output=ns.errors)
+
+    if exporter:
+        exporter.close()
+
+    s_res = cmd_result.get_successful_results()
+    fail = cmd_result.get_failed_results(include_ssh_problems=False)
+    conn = cmd_result.get_failed_results(only_ssh_problems=True)
+
+    # dig fails when one of the queries got no reply, the answers to the
+    # other queries are still of interest
+    answered = result.NodeResultSet(s_res.get_results() + fail.get_results())
+
+    cbn = ring.get_countries_by_node()
+
+    for label in labels:
+        print "%s:" % label
+        for (answers, hosts) in reversed(answered.get_value_grouped(label, True)):
+            print "%4d: %s" % (len(hosts), answers)
+            if not ns.quiet:
+                print "      %s" % ", ".join(hosts)
+
+        p = [v for (pct, v) in answered.get_value_percentiles(label + " time", [50, 90, 99])]
+        if p[0] != None:
+            print "query time (ms): p50 %d, p90 %d, p99 %d" % tuple(p)
+        print
+
+    if len(labels) > 1:
+        groups = answered.get_value_grouped(labels, True)
+        print "%d different combinations of answers to all queries." % len(groups)
+        print
+
+    if not ns.quiet:
+        if len(conn.get_results()) > 0 and ns.errors:
+            print "connection failures:"
+            for r in conn.get_results():
+                hostname = "%s (%s):" % (r.get_hostname(), cbn[r.get_hostname()].upper())
+                print "%-28s %s" % (hostname, r.get_ssh_errormsg())
+            print
+
+        if len(fail.get_results()) > 0 and ns.errors:
+            print "command execution problems:"
+            for r in fail.get_results():
+                hostname = "%s (%s):" % (r.get_hostname(), cbn[r.get_hostname()].upper())
+                output = [l for l in (r.get_stdout() or []) + (r.get_stderr() or []) if l.startswith(";; ") and "timed out" in l]
+                print "%-28s exitcode %s%s" % (hostname, r.get_exitcode(), ": " + output[0][3:] if output else "")
+            print
+
+    print "%d nodes answered, %d nodes failed to resolve, failed to connect to %d nodes." % (
+        len(s_res.get_results()),
+        len(fail.get_results()),
+        len(conn.get_results()))
+
+    if paster:
+        print
+        cli.close_pastebin(paster)
+
+if __name__ == "__main__":
+    main()
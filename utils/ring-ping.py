@@ -16,53 +16,78 @@ ring-ping performs a series of pings from various ring nodes and shows the resul
 # ======
 # Teun Vink - teun@teun.tv
 
-import sys, argparse
+import sys, time, random
 from operator import itemgetter
 
 try:
-    from ringtools import ring, result
+    from ringtools import cli, ring, result, aggregate
 except ImportError:
     # ringtools probaly isn't installed yet
     sys.path.append('..')
-    from ringtools import ring, result
+    from ringtools import cli, ring, result, aggregate
 
 VERSION="0.1"
 
-def analyzer(result):
-    # callback to analyse the results: if the command exited ok
-    # we select the average pingtime from the result and add it to the dataset
-    if result.get_exitcode() == 0:
-        avg = result.get_stdout()[-1].split(" ")[3].split("/")[1]
-        result.add_value("avg", float(avg))
-
-def split_args(args):
-    result = []
-    if args == None:
-        return []
-
-    for arg in args:
-        x = arg.split(',')
-        [ result.append(r.strip()) for r in x ]
-    return result
-
+def continuous(ns, nodes, cmd, cbn, consumers):
+    # run the pings in rounds on a fixed schedule, reusing the SSH
+    # connections to the nodes for all rounds
+    from ringtools.node import NodePool
+    pool = NodePool()
+    start = time.time()
+    rounds = 0
+
+    try:
+        while ns.rounds == 0 or rounds < ns.rounds:
+            rounds += 1
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+
+            def analyse(result, rounds=rounds):
+                result.add_value("round", rounds)
+
+            cmd_result = ring.run_command(cmd, nodes, max_threads=ns.threads, parser="ping",
+                analyse=analyse, consumers=consumers, pool=pool, keep_output=False,
+                reader="ping" if ns.stream else None, timeout=ns.timeout)
+            ok = cmd_result.get_successful_results()
+
+            if not ns.quiet:
+                for r in sorted(cmd_result.get_results(), key=lambda r: r.get_hostname()):
+                    hostname = "%s (%s):" % (r.get_hostname(), cbn[r.get_hostname()].upper())
+                    if r.get_value("avg") != None:
+                        v = "%.2fms" % r.get_value("avg")
+                    elif r.get_ssh_result() != result.NodeResult.SSH_OK:
+                        v = "no conn"
+                    else:
+                        v = "-"
+                    loss = "%d%%" % r.get_value("loss") if r.get_value("loss") != None else "-"
+                    print "%s %5d  %-28s %8s %5s loss" % (stamp, rounds, hostname, v, loss)
+
+            print "%s %5d  %d nodes ok (%.2fms avg), %d nodes failed." % (
+                stamp, rounds, ok.count_results(), ok.get_value_avg("avg"),
+                cmd_result.count_results() - ok.count_results())
+            sys.stdout.flush()
+
+            if ns.rounds != 0 and rounds >= ns.rounds:
+                break
+
+            # wait for the next round on the schedule, add some jitter to
+            # avoid all nodes hitting the destination at the same moment
+            delay = start + rounds * ns.interval - time.time()
+            if delay < 0:
+                # the round took longer than the interval: restart the schedule
+                start -= delay
+                delay = 0
+            time.sleep(delay + random.uniform(0, ns.jitter))
+    finally:
+        pool.close()
 
 def main():
-    parser = argparse.ArgumentParser(
-        description="Run ping on the NLNOG ring.",
-        epilog="Visit https://ring.nlnog.net for more information",
-        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser = cli.create_parser("Run ping on the NLNOG ring.")
 
     parser.add_argument(
         "-6", "--ipv6", help="enforce IPv6", 
         action="store_const", dest="ipv6", 
         const=True, default=False)
 
-    parser.add_argument(
-        "-c", "--count", 
-        help="the number of nodes to ping from", 
-        action="store", dest="count", 
-        default=10, type=int)
-    
     parser.add_argument(
         "-C", "--pingcount", 
         help="the number of ping requests", 
@@ -70,123 +95,118 @@ def main():
         default=1, type=int)
 
     parser.add_argument(
-        "-e", "--errors", 
-        help="detailed error reporting", 
-        action="store_const", dest="errors", 
+        "-r", "--country", help="group results by country", 
+        action="store_const", dest="country", 
         default=False, const=True)
-    
-    parser.add_argument(
-        "-n", "--include-node", help="include specific node", 
-        action="append", dest="in_nodes",
-        default=None, metavar="node")
-   
-    parser.add_argument(
-        "-N", "--exclude-node", help="exclude specific node", 
-        action="append", dest="ex_nodes", 
-        default=None, metavar="node")
-    
-    parser.add_argument(
-        "-o", "--include-country", help="include specific country", 
-        action="append", dest="in_countries",
-        default=None, metavar="country")
-
-    parser.add_argument(
-        "-oo", "--only-country", help="only specific country", 
-        action="append", dest="only_countries",
-        default=None, metavar="country")
 
     parser.add_argument(
-        "-O", "--exclude-country", help="exclude specific country", 
-        action="append", dest="ex_countries",
-        default=None, metavar="country")
-    
-    parser.add_argument(
-        "-q", "--quiet", help="quiet mode, print only results", 
-        action="store_const", dest="quiet", 
-        default=False, const=True)
-    
-    parser.add_argument(
-        "-r", "--country", help="group results by country", 
-        action="store_const", dest="country", 
+        "-s", "--stream", help="parse the ping replies as they arrive, keeping results on timeout",
+        action="store_const", dest="stream",
         default=False, const=True)
 
     parser.add_argument(
-        "-t", "--threads", 
-        help="the number of concurrent ping threads", 
-        action="store", dest="threads", 
-        default=25, type=int)
+        "--timeout", help="abort pings running longer than this, in streaming mode partial results are kept",
+        action="store", dest="timeout",
+        default=None, type=float, metavar="seconds")
 
     parser.add_argument(
-        "-w", "--include-network", help="include specific network", 
-        action="append", dest="in_networks",
-        default=None, metavar="network")
-    
+        "--interval", help="ping continuously, starting a round every number of seconds",
+        action="store", dest="interval",
+        default=0, type=float, metavar="seconds")
+
     parser.add_argument(
-        "-ww", "--only-network", help="only specific network", 
-        action="append", dest="only_networks",
-        default=None, metavar="network")
+        "--rounds", help="the number of rounds in continuous mode (default: no limit)",
+        action="store", dest="rounds",
+        default=0, type=int)
 
     parser.add_argument(
-        "-W", "--exclude-network", help="exclude specific network", 
-        action="append", dest="ex_networks",
-        default=None, metavar="network")
-    
+        "--jitter", help="random delay added to the start of each round in continuous mode",
+        action="store", dest="jitter",
+        default=0, type=float, metavar="seconds")
+
+    cli.add_node_arguments(parser, "ping from")
+    cli.add_report_arguments(parser)
+    cli.add_thread_arguments(parser, "ping")
+    cli.add_output_arguments(parser)
 
     parser.add_argument("destination", help="target of the ping command")
 
     ns = parser.parse_args()
 
-    in_nodes = split_args(ns.in_nodes)
-    ex_nodes = split_args(ns.ex_nodes)
-    in_countries = split_args(ns.in_countries)
-    ex_countries = split_args(ns.ex_countries)
-    only_countries = split_args(ns.only_countries)
-    in_networks = split_args(ns.in_networks)
-    ex_networks = split_args(ns.ex_networks)
-    only_networks = split_args(ns.only_networks)
-
-    nodes = ring.pick_nodes(count=ns.count, 
-        inc_hosts=in_nodes, ex_hosts=ex_nodes,
-        inc_countries=in_countries, ex_countries=ex_countries, 
-        only_countries=only_countries, inc_networks=in_networks, 
-        ex_networks=ex_networks, only_networks=only_networks)
+
+    nodes = cli.pick_nodes(ns)
 
     if not ns.quiet:
         print "ring-ping v%s written by Teun Vink <teun@teun.tv>\n" % VERSION
         print "pinging %s from %d nodes:" % (ns.destination, len(nodes))
 
-    cmd_result = ring.run_command('ping%s -c%s -q %s' % ("6" if ns.ipv6 else "", ns.pingcount, ns.destination), 
-        nodes, max_threads=ns.threads, analyse=analyzer)
+    cbn = ring.get_countries_by_node()
+
+    # aggregates are updated while the pings are running, partial results of
+    # pings which failed or timed out are left out like in the node counts
+    total = aggregate.ValueAccumulator("avg", successful_only=True)
+    per_country = aggregate.GroupedAccumulator("avg", lambda r: cbn.get(r.get_hostname()),
+        successful_only=True)
+    consumers = [total, per_country]
+    values = ['round', 'avg', 'loss', 'jitter', 'runtime']
+    exporter = cli.open_output(ns, values=values)
+    if exporter:
+        consumers.append(exporter)
+    paster = cli.open_pastebin(ns, "ring-ping %s" % ns.destination, values=values)
+    if paster:
+        consumers.append(paster)
+
+    cmd = 'ping%s -c%s %s%s' % ("6" if ns.ipv6 else "", ns.pingcount, "" if ns.stream else "-q ", ns.destination)
+
+    if ns.interval > 0 or ns.rounds > 0:
+        try:
+            continuous(ns, nodes, cmd, cbn, consumers)
+        except KeyboardInterrupt:
+            pass
+        if exporter:
+            exporter.close()
+        if paster:
+            cli.close_pastebin(paster)
+        return
+
+    # the ping parser reads the summary, when streaming the running values are
+    # available as well for pings which don't finish in time
+    cmd_result = ring.run_command(cmd, nodes, max_threads=ns.threads, parser="ping", consumers=consumers,
+        reader="ping" if ns.stream else None, timeout=ns.timeout)
+
+    if exporter:
+        exporter.close()
     ok = cmd_result.get_successful_results()
     fail = cmd_result.get_failed_results(include_ssh_problems=False)
     conn = cmd_result.get_failed_results(only_ssh_problems=True)
 
     sort = ok.get_value_sorted("avg")
-    cbn = ring.get_countries_by_node()
 
     if ns.country:
-        countries = ring.get_ring_countries()
-        countries.sort()
-        nbc = ring.get_countries_by_node()
-        res = {}
-        for (host, val) in sort:
-            if res.has_key(nbc[host]):
-                res[nbc[host]].append(val)
-            else:
-                res[nbc[host]] = [val]
         avg = {}
-        for country in countries:
-            if res.has_key(country):
-                avg[country] = sum(res[country])/len(res[country])
+        for (country, acc) in per_country.get_groups().iteritems():
+            if acc.get_count() > 0:
+                avg[country] = acc.get_avg()
         sort = sorted(avg.iteritems(), key=itemgetter(1))
         print "Average ping time per country:"
         for (c, a) in sort:
             print "{0:3s}: {1:6.2f}ms".format(c, a)
     elif not ns.quiet:
-        for (host, val) in sort:
-            hostname = "%s (%s):" % (host, cbn[host].upper())
-            v = "%.2fms" % val
-            print "%-28s %8s   " % (hostname, v)
+        if ns.stream:
+            # partial results of pings which timed out are listed as well
+            for r in sorted([r for r in cmd_result.get_results() if r.get_value("avg") != None], 
+                            key=lambda r: r.get_value("avg")):
+                hostname = "%s (%s):" % (r.get_hostname(), cbn[r.get_hostname()].upper())
+                print "%-28s %8s %5s loss %8s jitter %s" % (hostname, 
+                    "%.2fms" % r.get_value("avg"), 
+                    "%d%%" % r.get_value("loss"), 
+                    "%.2fms" % (r.get_value("jitter") or 0),
+                    "(partial)" if r.get_ssh_result() == result.NodeResult.SSH_TIMEOUT else "")
+        else:
+            for (host, val) in sort:
+                hostname = "%s (%s):" % (host, cbn[host].upper())
+                v = "%.2fms" % val
+                print "%-28s %8s   " % (hostname, v)
 
         if len(conn.get_results()) > 0 and ns.errors:
             print "\nconnection failures:"
@@ -206,9 +226,13 @@ def main():
 
     print "%d nodes ok (%.2fms avg), %d nodes failed to ping, failed to connect to %d nodes." % (
         len(ok.get_results()),
-        ok.get_value_avg("avg"),
+        total.get_avg(),
         len(fail.get_results()),
         len(conn.get_results()))
 
+    if paster:
+        print
+        cli.close_pastebin(paster)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+"""
+ring-trace performs traceroutes from various ring nodes and merges the paths into one graph of hops.
+"""
+
+# ABOUT
+# =====
+# This file is part of:
+#
+# ringtools - A generic module for running commands on nodes of the NLNOG
+# ring. More information about the ring: U{https://ring.nlnog.net}
+#
+# source code: U{https://github.com/NLNOG/py-ring}
+#
+# AUTHOR
+# ======
+# Teun Vink - teun@teun.tv
+
+import sys
+
+try:
+    from ringtools import cli, ring, result, aggregate
+except ImportError:
+    # ringtools probaly isn't installed yet
+    sys.path.append('..')
+    from ringtools import cli, ring, result, aggregate
+
+
+VERSION = "0.1"
+
+
+def analyzer(result):
+    # callback to analyse the results: the hops were parsed already, we
+    # add the last hop which replied and its latency to the dataset
+    hops = [h for h in result.get_value("hops") or [] if h["address"] != None]
+    result.add_value("hopcount", len(set([h["hop"] for h in hops])))
+    if hops:
+        last = hops[-1]
+        result.add_value("last", last["address"])
+        rtts = last["rtts"] if "rtts" in last else [last["avg"]]
+        if rtts:
+            result.add_value("rtt", min(rtts))
+
+
+def build_command(ns):
+    # the traceroute or mtr command to run on the nodes, without name lookups
+    if ns.mtr:
+        return "mtr %s--report --report-cycles %d -n -m %d %s" % (
+            "-6 " if ns.ipv6 else "", ns.cycles, ns.max_hops, ns.destination)
+    else:
+        return "%s -n -q 3 -w 2 -m %d %s" % (
+            "traceroute6" if ns.ipv6 else "traceroute", ns.max_hops, ns.destination)
+
+
+def main():
+    parser = cli.create_parser("Run traceroute or mtr on the NLNOG ring.")
+
+    parser.add_argument(
+        "-6", "--ipv6", help="enforce IPv6",
+        action="store_const", dest="ipv6",
+        const=True, default=False)
+
+    parser.add_argument(
+        "-C", "--cycles",
+        help="the number of pings per hop when using mtr",
+        action="store", dest="cycles",
+        default=10, type=int)
+
+    parser.add_argument(
+        "-m", "--mtr",
+        help="use mtr instead of traceroute, which also shows the loss per hop",
+        action="store_const", dest="mtr",
+        default=False, const=True)
+
+    parser.add_argument(
+        "-M", "--max-hops",
+        help="the maximum number of hops",
+        action="store", dest="max_hops",
+        default=30, type=int)
+
+    parser.add_argument(
+        "--min-nodes",
+        help="only show hops passed by at least this number of nodes",
+        action="store", dest="min_nodes",
+        default=1, type=int)
+
+    parser.add_argument(
+        "--timeout",
+        help="abort traceroutes running longer than this number of seconds",
+        action="store", dest="timeout",
+        default=None, type=float, metavar="seconds")
+
+    cli.add_node_arguments(parser, "trace from")
+    cli.add_report_arguments(parser, quiet="quiet mode, print only the hop graph")
+    cli.add_thread_arguments(parser, "traceroute")
+    cli.add_output_arguments(parser)
+
+    parser.add_argument("destination", help="target of the traceroute")
+
+    ns = parser.parse_args()
+
+
+    nodes = cli.pick_nodes(ns)
+
+    if not ns.quiet:
+        print "ring-trace v%s written by Teun Vink <teun@teun.tv>\n" % VERSION
+        print "tracing the route to %s from %d nodes:" % (ns.destination, len(nodes))
+
+    # the paths are merged into the graph as they arrive, the output is
+    # only needed by the parser
+    graph = aggregate.HopGraph()
+    consumers = [graph]
+    exporter = cli.open_output(ns, values=['hops', 'hopcount', 'last', 'rtt', 'runtime'])
+    if exporter:
+        consumers.append(exporter)
+    paster = cli.open_pastebin(ns, "ring-trace %s" % ns.destination, values=['hopcount', 'last', 'rtt', 'runtime'])
+    if paster:
+        consumers.append(paster)
+
+    cmd_result = ring.run_command(build_command(ns), nodes, max_threads=ns.threads,
+        parser="mtr" if ns.mtr else "traceroute", analyse=analyzer,
+        consumers=consumers, keep_output=False, timeout=ns.timeout)
+
+    if exporter:
+        exporter.close()
+
+    s_res = cmd_result.get_successful_results()
+    fail = cmd_result.get_failed_results(include_ssh_problems=False)
+    conn = cmd_result.get_failed_results(only_ssh_problems=True)
+
+    cbn = ring.get_countries_by_node()
+
+    if not ns.quiet:
+        for r in sorted(s_res.get_results(), key=lambda r: r.get_hostname()):
+            hostname = "%s (%s):" % (r.get_hostname(), cbn[r.get_hostname()].upper())
+            rtt = "%.2fms" % r.get_value("rtt") if r.get_value("rtt") != None else "-"
+            print "%-28s %2d hops  %-40s %9s" % (hostname, r.get_value("hopcount"), r.get_value("last") or "-", rtt)
+        print
+
+    print "merged paths of %d nodes, %d unique hops:" % (graph.get_path_count(), len(graph.get_hops()))
+    print "%4s  %-40s %5s %8s %8s %6s  %s" % ("hop", "address", "nodes", "avg", "p90", "loss", "next hops")
+    for address in graph.get_hops():
+        nodecount = len(graph.get_hop_hosts(address))
+        if nodecount < ns.min_nodes:
+            continue
+        (mindist, maxdist) = graph.get_hop_distance(address)
+        dist = "%d" % mindist if mindist == maxdist else "%d-%d" % (mindist, maxdist)
+        latency = graph.get_hop_latency(address)
+        loss = graph.get_hop_loss(address)
+        print "%4s  %-40s %5d %8s %8s %6s  %s" % (dist, address, nodecount,
+            "%.2f" % latency.get_avg() if latency.get_count() else "-",
+            "%.2f" % latency.get_quantile(0.9) if latency.get_count() else "-",
+            "%.1f%%" % loss.get_avg() if loss.get_count() else "-",
+            ", ".join(["%s (%d)" % (a, c) for (a, c) in graph.get_next_hops(address)]))
+
+    if not ns.quiet:
+        if len(conn.get_results()) > 0 and ns.errors:
+            print "\nconnection failures:"
+            for r in conn.get_results():
+                hostname = "%s (%s):" % (r.get_hostname(), cbn[r.get_hostname()].upper())
+                print "%-28s %s" % (hostname, r.get_ssh_errormsg())
+
+        if len(fail.get_results()) > 0 and ns.errors:
+            print "\ncommand execution problems:"
+            for r in fail.get_results():
+                hostname = "%s (%s):" % (r.get_hostname(), cbn[r.get_hostname()].upper())
+                print "%-28s exitcode %s" % (hostname, r.get_exitcode())
+
+        print
+
+    print "%d nodes traced, %d nodes failed to trace, failed to connect to %d nodes." % (
+        len(s_res.get_results()),
+        len(fail.get_results()),
+        len(conn.get_results()))
+
+    if paster:
+        print
+        cli.close_pastebin(paster)
+
+if __name__ == "__main__":
+    main()